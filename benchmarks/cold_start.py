@@ -0,0 +1,158 @@
+"""
+Measures the cold start of the provider for each resource type.
+
+Every resource type is measured in a fresh Python process, which imports the dispatcher
+and handles a single Create request. The AWS clients are real boto3 clients, but their
+calls are answered by a botocore Stubber, so no AWS account is required.
+
+    python benchmarks/cold_start.py [--runs 5] [--output cold-start.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ARN = "arn:aws:acm:eu-central-1:111111111111:certificate/ffffffff-ffff-ffff-ffff-ffffffffffff"
+
+RESOURCE_PROPERTIES = {
+    "Custom::Certificate": {"DomainName": "example.com", "ValidationMethod": "DNS"},
+    "Custom::CertificateDNSRecord": {"CertificateArn": ARN},
+    "Custom::IssuedCertificate": {"CertificateArn": ARN},
+}
+
+# executed in a fresh interpreter, prints a json object with the measurements
+MEASURE = """
+import json, logging, sys, time
+logging.disable(logging.CRITICAL)
+started = time.perf_counter()
+import provider
+imported = time.perf_counter()
+
+import clients
+from botocore.stub import Stubber
+from responder import Responder
+
+certificate = {
+    "CertificateArn": "%(arn)s",
+    "DomainName": "example.com",
+    "Status": "PENDING_VALIDATION",
+    "DomainValidationOptions": [{
+        "DomainName": "example.com",
+        "ValidationMethod": "DNS",
+        "ResourceRecord": {"Name": "_x1.example.com.", "Type": "CNAME", "Value": "_x2.acm-validations.aws."},
+    }],
+}
+responses = {
+    "Custom::Certificate": {"acm": [("request_certificate", {"CertificateArn": "%(arn)s"})]},
+    "Custom::CertificateDNSRecord": {"acm": [("describe_certificate", {"Certificate": certificate})]},
+    "Custom::IssuedCertificate": {
+        "acm": [("describe_certificate", {"Certificate": certificate})],
+        "lambda": [("invoke", {"StatusCode": 202})],
+    },
+}
+request = json.loads(sys.argv[1])
+create = clients.ClientPool.create
+
+def stubbed_create(pool, region_name):
+    client = create(pool, region_name)
+    stubber = Stubber(client)
+    for operation, response in responses[request["ResourceType"]].get(pool.service_name, []):
+        stubber.add_response(operation, response)
+    stubber.activate()
+    return client
+
+clients.ClientPool.create = stubbed_create
+Responder.send = lambda self, url, response, budget=None: None
+
+before_invoke = time.perf_counter()
+response = provider.handler(request, None)
+invoked = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "first_invoke": invoked - before_invoke,
+    "modules": sorted(m for m in provider.modules.values() if m in sys.modules),
+    "status": response["Status"],
+}))
+""" % {"arn": ARN}
+
+
+def request(resource_type):
+    return {
+        "RequestType": "Create",
+        "ResponseURL": "https://localhost/response",
+        "StackId": "arn:aws:cloudformation:eu-central-1:111111111111:stack/benchmark/guid",
+        "RequestId": "request-1",
+        "ResourceType": resource_type,
+        "LogicalResourceId": "Resource",
+        "ResourceProperties": dict(
+            RESOURCE_PROPERTIES[resource_type],
+            ServiceToken="arn:aws:lambda:eu-central-1:111111111111:function:binxio-cfn-certificate-provider",
+        ),
+    }
+
+
+def measure(resource_type):
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.path.join(ROOT, "src"),
+        AWS_DEFAULT_REGION="eu-central-1",
+        AWS_ACCESS_KEY_ID="benchmark",
+        AWS_SECRET_ACCESS_KEY="benchmark",
+        POLL_FIRST_DELAY="0",
+        REINVOKE_INTERVAL="0",
+        REINVOKE_SCHEDULER="lambda",
+    )
+    output = subprocess.check_output(
+        [sys.executable, "-c", MEASURE, json.dumps(request(resource_type))], env=env
+    )
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="measure the cold start per resource type"
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="number of cold starts per resource type"
+    )
+    parser.add_argument("--output", help="file to write the results to as json")
+    args = parser.parse_args()
+
+    results = {}
+    for resource_type in RESOURCE_PROPERTIES:
+        runs = [measure(resource_type) for _ in range(args.runs)]
+        results[resource_type] = {
+            "import_ms": statistics.median(r["import"] for r in runs) * 1000,
+            "first_invoke_ms": statistics.median(r["first_invoke"] for r in runs)
+            * 1000,
+            "modules": runs[0]["modules"],
+            "status": runs[0]["status"],
+        }
+
+    print(
+        "{:30} {:>10} {:>16}  {}".format(
+            "resource type", "import ms", "first invoke ms", "modules loaded"
+        )
+    )
+    for resource_type, result in results.items():
+        print(
+            "{:30} {:10.1f} {:16.1f}  {}".format(
+                resource_type,
+                result["import_ms"],
+                result["first_invoke_ms"],
+                ", ".join(result["modules"]),
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
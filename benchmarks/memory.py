@@ -0,0 +1,163 @@
+"""
+Measures the peak resident set size (RSS) of the provider per invocation, for each resource type.
+
+Every resource type is measured in a fresh Python process against the fake AWS backend of
+tests/fake_aws.py, with certificates of `--sans` subject alternative names. The process reports
+its peak RSS after importing the provider, after the first invocation and after `--invocations`
+invocations. Growth between the last two points indicates memory kept across invocations.
+It also reports the size of the largest re-invocation payload.
+
+The invocations follow each other much faster than in a real deployment, so the certificate
+cache is disabled by default: otherwise all certificates described within its time to live
+show up as growth. Set CERTIFICATE_CACHE_TTL to measure with the cache.
+
+    python benchmarks/memory.py [--sans 100] [--invocations 200] [--output memory.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESOURCE_TYPES = [
+    "Custom::Certificate",
+    "Custom::CertificateDNSRecord",
+    "Custom::CertificateDNSRecords",
+    "Custom::IssuedCertificate",
+]
+
+# executed in a fresh interpreter, prints a json object with the measurements
+MEASURE = """
+import contextlib, io, json, logging, resource, sys, uuid
+sys.path[0:0] = [%(src)r, %(tests)r]
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+logging.disable(logging.CRITICAL)
+import provider
+from fake_aws import FakeAWS
+from importlib import import_module
+
+resource_type, sans, invocations = %(resource_type)r, %(sans)d, %(invocations)d
+aws = FakeAWS(issue_delay=3600).install()
+for name in provider.modules.values():
+    import_module(name).provider.send_response = lambda: None
+acm = aws.client("acm", None)
+
+def request():
+    names = ["san-%%d.example.com" %% i for i in range(sans)]
+    arn = acm.request_certificate(
+        DomainName="example.com", SubjectAlternativeNames=names, ValidationMethod="DNS"
+    )["CertificateArn"]
+    properties = {
+        "Custom::Certificate": {
+            "DomainName": "example.com",
+            "SubjectAlternativeNames": names,
+            "ValidationMethod": "DNS",
+            "Region": "eu-central-1",
+        },
+        "Custom::CertificateDNSRecord": {"CertificateArn": arn},
+        "Custom::CertificateDNSRecords": {"CertificateArn": arn},
+        "Custom::IssuedCertificate": {"CertificateArn": arn},
+    }[resource_type]
+    properties["ServiceToken"] = "arn:aws:lambda:eu-central-1:111111111111:function:f"
+    return {
+        "RequestType": "Create",
+        "ResponseURL": "https://localhost/response",
+        "StackId": "arn:aws:cloudformation:eu-central-1:111111111111:stack/memory/guid",
+        "RequestId": str(uuid.uuid4()),
+        "ResourceType": resource_type,
+        "LogicalResourceId": "Resource",
+        "ResourceProperties": properties,
+    }
+
+result = {"import_kb": peak_rss_kb()}
+with contextlib.redirect_stdout(io.StringIO()):
+    provider.handler(request(), None)
+result["first_invocation_kb"] = peak_rss_kb()
+payload_bytes = 0
+for _ in range(invocations - 1):
+    with contextlib.redirect_stdout(io.StringIO()):
+        provider.handler(request(), None)
+    payload_bytes = max([payload_bytes] + [len(p) for p in aws.invocations])
+    aws.certificates.clear()
+    aws.invocations.clear()
+result["last_invocation_kb"] = peak_rss_kb()
+result["payload_bytes"] = payload_bytes
+print(json.dumps(result))
+"""
+
+
+def measure(resource_type, sans, invocations):
+    script = MEASURE % {
+        "src": os.path.join(ROOT, "src"),
+        "tests": os.path.join(ROOT, "tests"),
+        "resource_type": resource_type,
+        "sans": sans,
+        "invocations": invocations,
+    }
+    env = {
+        "AWS_DEFAULT_REGION": "eu-central-1",
+        "METRICS_ENABLED": "false",
+        "CERTIFICATE_CACHE_TTL": "0",
+        "REINVOKE_INTERVAL": "0",
+        "POLL_FIRST_DELAY": "0",
+    }
+    env.update(os.environ)
+    env["REINVOKE_SCHEDULER"] = "lambda"
+    output = subprocess.check_output([sys.executable, "-c", script], env=env)
+    return json.loads(output.decode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="measure the peak RSS per invocation")
+    parser.add_argument(
+        "--sans",
+        type=int,
+        default=100,
+        help="subject alternative names per certificate",
+    )
+    parser.add_argument(
+        "--invocations", type=int, default=200, help="invocations per resource type"
+    )
+    parser.add_argument("--output", help="file to write the results to as json")
+    args = parser.parse_args()
+
+    results = {
+        resource_type: measure(resource_type, args.sans, args.invocations)
+        for resource_type in RESOURCE_TYPES
+    }
+
+    print(
+        "{:32} {:>10} {:>12} {:>12} {:>10} {:>10}".format(
+            "resource type",
+            "import KiB",
+            "first KiB",
+            "last KiB",
+            "growth KiB",
+            "payload B",
+        )
+    )
+    for resource_type, result in results.items():
+        print(
+            "{:32} {:>10} {:>12} {:>12} {:>10} {:>10}".format(
+                resource_type,
+                result["import_kb"],
+                result["first_invocation_kb"],
+                result["last_invocation_kb"],
+                result["last_invocation_kb"] - result["first_invocation_kb"],
+                result["payload_bytes"],
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Replays the recorded CloudFormation requests in `requests.json` through `provider.handler`,
+against the fake ACM and Lambda clients of `tests/fake_aws.py`.
+
+For each request it reports the median latency, the AWS calls made and the peak memory
+allocated. The results can be written as json and compared with those of another commit:
+
+    python benchmarks/replay.py --output before.json
+    python benchmarks/replay.py --compare before.json
+
+The comparison exits with status 1 if a request makes more AWS calls than before, or is
+slower than `--tolerance` allows.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+from importlib import import_module
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[0:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "tests")]
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-central-1")
+os.environ.setdefault("POLL_FIRST_DELAY", "0")
+os.environ.setdefault("REINVOKE_INTERVAL", "0")
+os.environ["REINVOKE_SCHEDULER"] = "lambda"
+
+SERVICE_TOKEN = (
+    "arn:aws:lambda:eu-central-1:111111111111:function:binxio-cfn-certificate-provider"
+)
+
+# the certificates referred to by the recorded requests
+CERTIFICATE_ARNS = [
+    "arn:aws:acm:eu-central-1:111111111111:certificate/eeeeeeee-eeee-eeee-eeee-eeeeeeeeeeee",
+    "arn:aws:acm:eu-central-1:111111111111:certificate/ffffffff-ffff-ffff-ffff-ffffffffffff",
+]
+
+
+def load_requests(path):
+    with open(path) as f:
+        recorded = json.load(f)
+
+    for request in recorded.values():
+        request.setdefault("ResponseURL", "https://localhost/response")
+        request.setdefault(
+            "StackId",
+            "arn:aws:cloudformation:eu-central-1:111111111111:stack/replay/guid",
+        )
+        request["ResourceProperties"]["ServiceToken"] = SERVICE_TOKEN
+    return recorded
+
+
+def import_providers():
+    """
+    imports the dispatcher and all provider modules, returning the time taken in seconds
+    """
+    started = time.perf_counter()
+    provider = import_module("provider")
+    for name in provider.modules.values():
+        import_module(name)
+    return time.perf_counter() - started
+
+
+def clear_caches():
+    """
+    clears the caches and waits kept across warm invocations, so that each replay starts cold
+    """
+    import certificate_dns_record_provider
+    import issued_certificate_provider
+    from wait_state import MemoryStore
+
+    certificate_dns_record_provider.certificate_cache.invalidate()
+    issued_certificate_provider.status_cache.invalidate()
+    issued_certificate_provider.wait_states.store = MemoryStore()
+
+
+def handle(handler, aws, request):
+    r = json.loads(json.dumps(request))
+    r["RequestId"] = "replay-{}".format(uuid.uuid4())
+    clear_caches()
+    aws.reset()
+    for arn in CERTIFICATE_ARNS:
+        aws.add_certificate(
+            arn=arn,
+            DomainName="example.com",
+            SubjectAlternativeNames=["*.example.com"],
+            ValidationMethod="DNS",
+        )
+    with contextlib.redirect_stdout(io.StringIO()):
+        return handler(r, None)
+
+
+def replay(handler, aws, request, runs):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        response = handle(handler, aws, request)
+        latencies.append(time.perf_counter() - started)
+
+    # measured separately, as tracing the allocations slows down the request
+    tracemalloc.start()
+    handle(handler, aws, request)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "latency_ms": statistics.median(latencies) * 1000,
+        "aws_calls": dict(aws.calls),
+        "aws_call_count": sum(aws.calls.values()),
+        "peak_memory_kb": peak / 1024.0,
+        "status": response["Status"] if isinstance(response, dict) else None,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    prints the differences with `baseline`, returning the number of regressions
+    """
+    regressions = 0
+    for name, result in results["requests"].items():
+        before = baseline["requests"].get(name)
+        if not before:
+            continue
+        if result["aws_call_count"] > before["aws_call_count"]:
+            regressions += 1
+            print(
+                "REGRESSION {}: {} AWS calls, was {}".format(
+                    name, result["aws_call_count"], before["aws_call_count"]
+                )
+            )
+        if result["latency_ms"] > before["latency_ms"] * (1 + tolerance):
+            regressions += 1
+            print(
+                "REGRESSION {}: {:.2f} ms, was {:.2f} ms".format(
+                    name, result["latency_ms"], before["latency_ms"]
+                )
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay recorded requests offline")
+    parser.add_argument(
+        "--requests",
+        default=os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "requests.json"
+        ),
+        help="recorded requests to replay",
+    )
+    parser.add_argument("--runs", type=int, default=20, help="runs per request")
+    parser.add_argument("--output", help="file to write the results to as json")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="allowed relative latency increase before it is a regression",
+    )
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    import_seconds = import_providers()
+
+    from provider import handler
+    from responder import Responder
+    from fake_aws import FakeAWS
+
+    Responder.send = lambda self, url, response, budget=None: None
+    # the certificates stay pending validation during the replay
+    aws = FakeAWS(issue_delay=3600).install()
+
+    results = {
+        "python": "{}.{}".format(*sys.version_info[:2]),
+        "import_ms": import_seconds * 1000,
+        "requests": {},
+    }
+    for name, request in load_requests(args.requests).items():
+        results["requests"][name] = replay(handler, aws, request, args.runs)
+
+    print("import time: {:.1f} ms".format(results["import_ms"]))
+    print(
+        "{:30} {:>8} {:>12} {:>10}  {}".format(
+            "request", "status", "latency ms", "peak KiB", "AWS calls"
+        )
+    )
+    for name, result in results["requests"].items():
+        print(
+            "{:30} {:>8} {:12.2f} {:10.1f}  {}".format(
+                name,
+                result["status"],
+                result["latency_ms"],
+                result["peak_memory_kb"],
+                ", ".join(
+                    "{}={}".format(k, v) for k, v in sorted(result["aws_calls"].items())
+                ),
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
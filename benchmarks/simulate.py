@@ -0,0 +1,346 @@
+"""
+Simulates a deployment wave of `--stacks` stacks against the fake AWS of tests/fake_aws.py,
+under a virtual clock. Every stack creates a Custom::Certificate with `--sans` subject
+alternative names, then a Custom::CertificateDNSRecords and finally waits for the certificate
+with a Custom::IssuedCertificate. The requests are sent through `provider.handler`, and the
+re-invocations of the provider are handled as new invocations.
+
+For each strategy it reports the ACM calls, the peak ACM calls per second, the number of
+invocations, the billed Lambda seconds and the time until all stacks completed:
+
+    python benchmarks/simulate.py --stacks 500 --sans 3 --strategy sync --strategy async
+
+A strategy is a set of environment variables for the provider, see STRATEGIES. Additional
+variables are set on all strategies with `--set NAME=VALUE`. Every strategy is simulated in a
+fresh process, as the provider reads its configuration on import.
+
+All invocations share the caches of a single warm Lambda instance, and run one at a time:
+an invocation starts at its scheduled virtual time, and the clock advances only when it sleeps.
+Only the Lambda scheduler of re-invocations is simulated. The client-side rate limit of ACM
+calls is disabled, unless set with `--set ACM_RATE_LIMIT=...`.
+"""
+
+import argparse
+import contextlib
+import heapq
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVICE_TOKEN = (
+    "arn:aws:lambda:eu-central-1:111111111111:function:binxio-cfn-certificate-provider"
+)
+
+STRATEGIES = {
+    "sync": {},
+    "async": {"ASYNC_DNS_RECORD_POLLING": "true"},
+    "backoff": {
+        "ASYNC_DNS_RECORD_POLLING": "true",
+        "REINVOKE_INTERVAL": "10",
+        "REINVOKE_BACKOFF_FACTOR": "1.5",
+    },
+}
+
+
+class Context(object):
+    """
+    a Lambda context of which the remaining time runs on the virtual clock
+    """
+
+    def __init__(self, clock, timeout):
+        self.clock = clock
+        self.deadline = clock() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - self.clock()) * 1000))
+
+
+def request(stack, resource_type, properties):
+    properties = dict(properties, ServiceToken=SERVICE_TOKEN)
+    return {
+        "RequestType": "Create",
+        "ResponseURL": "https://localhost/response",
+        "StackId": "arn:aws:cloudformation:eu-central-1:111111111111:stack/sim-{}/guid".format(
+            stack
+        ),
+        "RequestId": "{}-{}".format(resource_type, stack),
+        "ResourceType": resource_type,
+        "LogicalResourceId": resource_type.split("::")[1],
+        "ResourceProperties": properties,
+    }
+
+
+def stack_of(request):
+    return int(request["StackId"].split("/")[1].split("-")[1])
+
+
+def simulate(config):
+    """
+    runs the simulation of `config` in this process, returning the measurements
+    """
+    sys.path[0:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "tests")]
+    from fake_aws import FakeAWS, VirtualClock
+
+    # replaced before the providers are imported, as they bind these as defaults
+    clock = VirtualClock(0.0)
+    time.time = clock
+    time.monotonic = clock
+    time.sleep = clock.sleep
+
+    from importlib import import_module
+
+    from provider import handler, modules
+
+    logging.disable(logging.CRITICAL)
+    aws = FakeAWS(
+        clock=clock,
+        record_delay=config["record_delay"],
+        issue_delay=config["issue_delay"],
+        throttle_limit=config["throttle_limit"],
+        require_validation_records=bool(config["hosted_zone"]),
+    ).install(throttled=True)
+
+    responses = []
+    for name in modules.values():
+        instance = import_module(name).provider
+        instance.send_response = lambda instance=instance: responses.append(
+            (instance.request, instance.response)
+        )
+
+    events = []
+    sequence = [0]
+
+    def schedule(at, r):
+        sequence[0] += 1
+        heapq.heappush(events, (at, sequence[0], r))
+
+    for stack in range(config["stacks"]):
+        domain_name = "stack-{}.example.com".format(stack)
+        schedule(
+            config["ramp"] * stack / config["stacks"],
+            request(
+                stack,
+                "Custom::Certificate",
+                {
+                    "DomainName": domain_name,
+                    "SubjectAlternativeNames": [
+                        "san-{}.{}".format(i, domain_name)
+                        for i in range(config["sans"])
+                    ],
+                    "ValidationMethod": "DNS",
+                },
+            ),
+        )
+
+    invocations = 0
+    billed = 0.0
+    timeouts = 0
+    completed = {}
+    failed = set()
+    devnull = open(os.devnull, "w")
+    while events:
+        at, _, r = heapq.heappop(events)
+        clock.now = at
+        invocations += 1
+        with contextlib.redirect_stdout(devnull):
+            handler(r, Context(clock, config["timeout"]))
+        duration = clock() - at
+        billed += min(duration, config["timeout"])
+        if duration > config["timeout"]:
+            timeouts += 1
+
+        while aws.invocations:
+            schedule(clock(), json.loads(aws.invocations.popleft()))
+
+        while responses:
+            done, response = responses.pop(0)
+            stack = stack_of(done)
+            if response["Status"] != "SUCCESS":
+                failed.add(stack)
+                continue
+            arn = response["PhysicalResourceId"]
+            if done["ResourceType"] == "Custom::Certificate":
+                schedule(
+                    clock(),
+                    request(
+                        stack, "Custom::CertificateDNSRecords", {"CertificateArn": arn}
+                    ),
+                )
+            elif done["ResourceType"] == "Custom::CertificateDNSRecords":
+                properties = {"CertificateArn": arn}
+                if config["hosted_zone"]:
+                    properties["HostedZoneId"] = config["hosted_zone"]
+                schedule(
+                    clock(),
+                    request(stack, "Custom::IssuedCertificate", properties),
+                )
+            else:
+                completed[stack] = clock()
+
+    acm_per_second = [
+        count
+        for (service, _), count in aws.calls_per_second.items()
+        if service == "acm"
+    ]
+    return {
+        "stacks_completed": len(completed),
+        "stacks_failed": len(failed),
+        "stacks_pending": config["stacks"] - len(completed) - len(failed),
+        "completion_seconds": max(completed.values()) if completed else None,
+        "invocations": invocations,
+        "timeouts": timeouts,
+        "billed_seconds": billed,
+        "acm_calls": sum(
+            count
+            for name, count in aws.calls.items()
+            if name.startswith("acm.") and not name.endswith(".throttled")
+        ),
+        "acm_throttled": sum(
+            count for name, count in aws.calls.items() if name.endswith(".throttled")
+        ),
+        "peak_acm_calls_per_second": max(acm_per_second) if acm_per_second else 0,
+        "aws_calls": dict(aws.calls),
+    }
+
+
+def run(name, environment, config):
+    """
+    simulates the strategy `name` in a fresh process with the `environment` set
+    """
+    env = dict(os.environ)
+    env.update(
+        {
+            "AWS_DEFAULT_REGION": "eu-central-1",
+            "METRICS_ENABLED": "false",
+            "REINVOKE_SCHEDULER": "lambda",
+            # the client-side rate limit applies per Lambda instance, which is not simulated
+            "ACM_RATE_LIMIT": "1000000",
+            "ACM_BURST": "1000000",
+        }
+    )
+    env.update(environment)
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--simulate", json.dumps(config)],
+        env=env,
+    )
+    return json.loads(output.decode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="simulate a deployment wave offline")
+    parser.add_argument("--stacks", type=int, default=100, help="number of stacks")
+    parser.add_argument(
+        "--sans", type=int, default=2, help="subject alternative names per certificate"
+    )
+    parser.add_argument(
+        "--ramp", type=float, default=0, help="seconds over which the stacks start"
+    )
+    parser.add_argument(
+        "--record-delay",
+        type=float,
+        default=10,
+        help="seconds before the validation records appear",
+    )
+    parser.add_argument(
+        "--issue-delay",
+        type=float,
+        default=60,
+        help="seconds from validation to issue of a certificate",
+    )
+    parser.add_argument(
+        "--throttle-limit",
+        type=int,
+        help="ACM calls per second per operation, after which calls are throttled",
+    )
+    parser.add_argument(
+        "--hosted-zone",
+        help="hosted zone the IssuedCertificate writes the validation records to, "
+        "certificates are then only validated after the records are written",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=300, help="Lambda timeout in seconds"
+    )
+    parser.add_argument(
+        "--strategy",
+        action="append",
+        choices=sorted(STRATEGIES.keys()),
+        help="strategy to simulate, default all",
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="environment variable to set for all strategies",
+    )
+    parser.add_argument("--output", help="file to write the results to as json")
+    parser.add_argument("--simulate", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.simulate:
+        result = simulate(json.loads(args.simulate))
+        print(json.dumps(result))
+        return
+
+    config = {
+        "stacks": args.stacks,
+        "sans": args.sans,
+        "ramp": args.ramp,
+        "record_delay": args.record_delay,
+        "issue_delay": args.issue_delay,
+        "throttle_limit": args.throttle_limit,
+        "hosted_zone": args.hosted_zone,
+        "timeout": args.timeout,
+    }
+    overrides = dict(value.split("=", 1) for value in args.set)
+
+    results = {"config": config, "strategies": {}}
+    for name in args.strategy or sorted(STRATEGIES.keys()):
+        environment = dict(STRATEGIES[name], **overrides)
+        results["strategies"][name] = run(name, environment, config)
+
+    columns = [
+        ("completed", "stacks_completed"),
+        ("failed", "stacks_failed"),
+        ("pending", "stacks_pending"),
+        ("ACM calls", "acm_calls"),
+        ("peak ACM/s", "peak_acm_calls_per_second"),
+        ("throttled", "acm_throttled"),
+        ("invokes", "invocations"),
+        ("timeouts", "timeouts"),
+        ("billed s", "billed_seconds"),
+        ("completion s", "completion_seconds"),
+    ]
+    print(
+        "{:10}".format("strategy")
+        + "".join(" {:>12}".format(title) for title, _ in columns)
+    )
+    for name, result in results["strategies"].items():
+        print(
+            "{:10}".format(name)
+            + "".join(
+                " {:>12}".format(
+                    "-"
+                    if result[key] is None
+                    else (
+                        "{:.1f}".format(result[key])
+                        if isinstance(result[key], float)
+                        else result[key]
+                    )
+                )
+                for _, key in columns
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
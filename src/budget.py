@@ -0,0 +1,68 @@
+import time
+from os import getenv
+
+from polling import remaining_time_in_seconds
+
+
+class ExecutionBudget(object):
+    """
+    The execution time left of a Lambda invocation, which times out at `deadline`.
+
+    The last `reserve` seconds before the timeout are kept to hand off waiting and to send
+    the response to CloudFormation: polling, retries and sleeps are bounded by `remaining`.
+    When less than `minimum` seconds remain, the budget is low and requests which are not
+    yet handled are handed off to a new invocation. Without a deadline, the budget is
+    unbounded.
+    """
+
+    def __init__(self, deadline=None, reserve=10.0, minimum=30.0, clock=time.monotonic):
+        super(ExecutionBudget, self).__init__()
+        self.deadline = deadline
+        self.reserve = reserve
+        self.minimum = minimum
+        self.clock = clock
+
+    @staticmethod
+    def from_context(context, clock=time.monotonic):
+        """
+        returns the budget of the Lambda invocation `context`, configured from the environment
+        """
+        remaining = remaining_time_in_seconds(context)
+        return ExecutionBudget(
+            deadline=None if remaining is None else clock() + remaining,
+            reserve=float(
+                getenv("DEADLINE_RESERVE", getenv("POLL_DEADLINE_RESERVE", "10"))
+            ),
+            minimum=float(getenv("HANDOFF_THRESHOLD", "30")),
+            clock=clock,
+        )
+
+    def time_left(self):
+        """
+        returns the seconds until the invocation times out, or None if unbounded
+        """
+        return None if self.deadline is None else self.deadline - self.clock()
+
+    def remaining(self):
+        """
+        returns the seconds left before the reserve, or None if unbounded
+        """
+        time_left = self.time_left()
+        return None if time_left is None else max(0.0, time_left - self.reserve)
+
+    def bound(self, seconds):
+        """
+        returns `seconds`, limited to the time remaining
+        """
+        remaining = self.remaining()
+        return seconds if remaining is None else min(seconds, remaining)
+
+    def is_low(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining < self.minimum
+
+    def __str__(self):
+        remaining = self.remaining()
+        if remaining is None:
+            return "unbounded"
+        return "{:.1f} seconds".format(remaining)
@@ -1,18 +1,27 @@
 import time
 
-import boto3
 import logging
+from os import getenv
 from botocore.exceptions import ClientError
 from cfn_resource_provider import ResourceProvider
 
+import clients
+from budget import ExecutionBudget
+from metrics import metrics
+from polling import PollingSchedule
+from reinvoke import Reinvoker
+from responder import send_response
+
 logger = logging.getLogger()
 
-lmbda = boto3.client("lambda")
+# seconds after which describe_certificate is expected to list all domain names
+VALIDATION_OPTIONS_SETTLE_TIME = 5.0
 
 
 class CertificateDNSRecordProvider(ResourceProvider):
     def __init__(self):
         super(CertificateDNSRecordProvider, self).__init__()
+        self.budget = ExecutionBudget()
         self.request_schema = {
             "type": "object",
             "required": ["CertificateArn"],
@@ -30,22 +39,18 @@ class CertificateDNSRecordProvider(ResourceProvider):
 
     @property
     def certificate(self):
-        result = None
-        region = self.certificate_arn.split(":")[3]
-        acm = boto3.client("acm", region_name=region)
-        try:
-            response = acm.describe_certificate(CertificateArn=self.certificate_arn)
-            result = Certificate(response["Certificate"])
-            if result.status not in ["PENDING_VALIDATION", "ISSUED"]:
-                raise PreConditionFailed(
-                    "certificate {} is state {}, expected pending validation or issued".format(
-                        result.status
-                    )
+        result = self.lookup_certificate()
+        if result.status not in ["PENDING_VALIDATION", "ISSUED"]:
+            raise PreConditionFailed(
+                "certificate {} is state {}, expected pending validation or issued".format(
+                    result.arn, result.status
                 )
-        except ClientError as e:
-            raise PreConditionFailed("{}".format(e))
+            )
         return result
 
+    def lookup_certificate(self):
+        return describe_certificate(self.certificate_arn)
+
     @property
     def certificate_arn(self):
         return self.get("CertificateArn")
@@ -59,7 +64,7 @@ class CertificateDNSRecordProvider(ResourceProvider):
         result = self.certificate.get_validation_option(self.domain_name)
 
         if not result:
-            raise PreConditionFailed("No validation option found for domain")
+            raise ValidationOptionNotFound("No validation option found for domain")
 
         return result
 
@@ -74,23 +79,108 @@ class CertificateDNSRecordProvider(ResourceProvider):
             )
         return result
 
-    def poll_for_resource_record(self):
-        # Sleep for 5 seconds because describe_certificate gives a different answer after 3 seconds.
-        time.sleep(5)
+    def handle(self, request, context, budget=None):
+        self.budget = budget if budget else ExecutionBudget.from_context(context)
+        return super(CertificateDNSRecordProvider, self).handle(request, context)
+
+    def create_polling_schedule(self):
+        return PollingSchedule.from_environment(self.budget)
+
+    @property
+    def asynchronous_polling(self):
+        """ returns true if waiting for the resource record is handed off to a new invocation """
+        return getenv("ASYNC_DNS_RECORD_POLLING", "false").lower() == "true"
+
+    def resource_records(self):
+        """
+        returns the unique DNS validation records of the certificate, or None if
+        not all records are available yet.
+        """
+        certificate = self.certificate
+        options = certificate.get_validation_options(
+            certificate.subject_alternative_names
+        )
+        missing = [name for name, option in options.items() if not option]
+        if missing:
+            raise ValidationOptionNotFound(
+                "No validation option found for domain {}".format(", ".join(missing))
+            )
+
+        for option in options.values():
+            if option.validation_method != "DNS":
+                raise PreConditionFailed(
+                    "domain {} is using validation method {}, not DNS".format(
+                        option.domain_name, option.validation_method
+                    )
+                )
+
+        records = certificate.records_by_domain_name
+        if not all(name in records for name in options):
+            return None
+        keys = {record_key(records[name]) for name in options}
+        return [r for r in certificate.resource_records if record_key(r) in keys]
+
+    def poll(self, probe):
+        """
+        returns the result of `probe` as soon as it is available. returns None if the
+        request failed or waiting was handed off to a new invocation.
+        """
+        schedule = self.create_polling_schedule()
         try:
-            dns_record = None
-            while not dns_record:
-                dns_record = self.dns_domain_validation_option.resource_record
-                if not dns_record:
-                    print("waiting for resource record to appear")
-                    time.sleep(15)
+            return self.poll_with_schedule(probe, schedule)
+        finally:
+            metrics.put("PollIterations", schedule.iterations, "Count")
 
-            self.response["Data"] = dns_record
-            self.physical_resource_id = dns_record["Name"]
+    def poll_with_schedule(self, probe, schedule):
+        try:
+            while True:
+                if not schedule.wait():
+                    print("handing off waiting for resource record")
+                    self.async_reinvoke()
+                    return None
+                certificate_cache.invalidate(self.certificate_arn)
+                try:
+                    result = probe()
+                    if result:
+                        metrics.put(
+                            "TimeToResourceRecord",
+                            self.waiting_time(schedule),
+                            "Seconds",
+                        )
+                        return result
+                except ValidationOptionNotFound:
+                    # describe_certificate may not list all domain names in the first seconds
+                    if (
+                        self.attempt > 1
+                        or schedule.elapsed >= VALIDATION_OPTIONS_SETTLE_TIME
+                    ):
+                        raise
+
+                print("waiting for resource record to appear")
+                if self.asynchronous_polling:
+                    self.async_reinvoke()
+                    return None
         except PreConditionFailed as error:
             self.fail(error.message)
             if self.request_type == "Create":
                 self.physical_resource_id = "could-not-create"
+            return None
+
+    def waiting_time(self, schedule=None):
+        """
+        returns the number of seconds since waiting started
+        """
+        if self.attempt > 1:
+            return reinvoker.elapsed(self.properties)
+        return schedule.elapsed if schedule else 0.0
+
+    def poll_for_resource_record(self):
+        dns_record = self.poll(
+            lambda: self.dns_domain_validation_option.resource_record
+        )
+        if dns_record:
+            self.response["Data"] = dns_record
+            self.physical_resource_id = dns_record["Name"]
 
     def create(self):
         self.poll_for_resource_record()
@@ -101,8 +191,37 @@ class CertificateDNSRecordProvider(ResourceProvider):
     def delete(self):
         pass
 
+    def send_response(self):
+        send_response(self)
+
+    def invoke_lambda(self, payload):
+        clients.lmbda().invoke(
+            FunctionName=self.get("ServiceToken"),
+            InvocationType="Event",
+            Payload=payload,
+        )
+
+    def async_reinvoke(self, delay=None):
+        reinvoker.reinvoke(self, delay)
+
+    @property
+    def attempt(self):
+        """ returns the number of attempts waiting for completion """
+        return reinvoker.attempt(self.properties)
+
+    def increment_attempt(self):
+        """ increments the number of attempts waiting for completion """
+        reinvoker.increment_attempt(self.properties)
+
 
 class DomainValidationOption(object):
+    __slots__ = (
+        "domain_name",
+        "validation_status",
+        "resource_record",
+        "validation_method",
+    )
+
     def __init__(self, option):
         self.domain_name = option["DomainName"]
         self.validation_status = option.get("ValidationStatus", None)
@@ -110,18 +229,54 @@ class DomainValidationOption(object):
         self.validation_method = option.get("ValidationMethod", None)
 
 
+def record_key(record):
+    return record["Name"], record["Type"], record["Value"]
+
+
 class Certificate(object):
+    """
+    The fields of a describe_certificate response used by the providers. No reference to
+    the response itself is kept.
+
+    ACM returns the same validation record for domain names like `example.com` and
+    `*.example.com`. Identical records are grouped once per describe: `resource_records` are
+    the unique records, and the options of all domain names sharing a record refer to the same
+    one, which `records_by_domain_name` maps them to.
+    """
+
+    __slots__ = (
+        "arn",
+        "status",
+        "domain_name",
+        "subject_alternative_names",
+        "options_by_domain_name",
+        "resource_records",
+        "records_by_domain_name",
+    )
+
     def __init__(self, certificate):
-        self.certificate = certificate.copy()
-        self.arn = self.certificate["CertificateArn"]
-        self.status = self.certificate["Status"]
-        self.domain_name = self.certificate["DomainName"]
-        self.options = list(
-            map(
-                lambda o: DomainValidationOption(o),
-                self.certificate["DomainValidationOptions"],
-            )
+        self.arn = certificate["CertificateArn"]
+        self.status = certificate["Status"]
+        self.domain_name = certificate["DomainName"]
+        self.subject_alternative_names = tuple(
+            certificate.get("SubjectAlternativeNames", (self.domain_name,))
         )
+        self.options_by_domain_name = {}
+        self.records_by_domain_name = {}
+        records = {}
+        for o in certificate["DomainValidationOptions"]:
+            option = DomainValidationOption(o)
+            if option.resource_record:
+                option.resource_record = records.setdefault(
+                    record_key(option.resource_record), option.resource_record
+                )
+                self.records_by_domain_name[option.domain_name] = option.resource_record
+            self.options_by_domain_name[option.domain_name] = option
+        self.resource_records = tuple(records.values())
+
+    @property
+    def options(self):
+        return list(self.options_by_domain_name.values())
 
     def __str__(self):
         return "{} - {}".format(self.domain_name, self.arn)
@@ -130,15 +285,63 @@ class Certificate(object):
         """
         returns the validation option for `domain_name` or the certificate domain_name if not specified
         """
-        return next(
-            filter(
-                lambda o: o.domain_name == domain_name
-                or (not domain_name and o.domain_name == self.domain_name),
-                self.options,
-            ),
-            None,
+        return self.options_by_domain_name.get(
+            domain_name if domain_name else self.domain_name
         )
 
+    def get_validation_options(self, domain_names=None):
+        """
+        returns the validation options for all `domain_names`, or all options if not specified.
+        Domain names without a validation option are mapped to None.
+        """
+        if domain_names is None:
+            return dict(self.options_by_domain_name)
+        return {n: self.options_by_domain_name.get(n) for n in domain_names}
+
+
+class CertificateCache(object):
+    """
+    Caches the described certificates by ARN for `ttl` seconds, to avoid
+    repeated describe_certificate calls for the same certificate.
+    """
+
+    def __init__(self, ttl=5.0, clock=time.monotonic):
+        super(CertificateCache, self).__init__()
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, arn):
+        """
+        returns the cached certificate for `arn`, or None if absent or expired
+        """
+        entry = self.entries.get(arn)
+        if entry and self.clock() - entry[0] < self.ttl:
+            self.hits += 1
+            return entry[1]
+
+        self.entries.pop(arn, None)
+        self.misses += 1
+        return None
+
+    def put(self, certificate):
+        now = self.clock()
+        # expired certificates are dropped, so that they are not kept across invocations
+        for arn in [a for a, (t, _) in self.entries.items() if now - t >= self.ttl]:
+            del self.entries[arn]
+        self.entries[certificate.arn] = (now, certificate)
+
+    def invalidate(self, arn=None):
+        """
+        removes the certificate `arn` from the cache, or all certificates if not specified
+        """
+        if arn:
+            self.entries.pop(arn, None)
+        else:
+            self.entries.clear()
+
 
 class PreConditionFailed(Exception):
     def __init__(self, message):
@@ -146,8 +349,33 @@ class PreConditionFailed(Exception):
         self.message = message
 
 
+class ValidationOptionNotFound(PreConditionFailed):
+    pass
+
+
+certificate_cache = CertificateCache(float(getenv("CERTIFICATE_CACHE_TTL", "5")))
+
+reinvoker = Reinvoker.from_environment()
+
+
+def describe_certificate(arn):
+    """
+    returns the certificate `arn`, from the certificate cache if possible
+    """
+    result = certificate_cache.get(arn)
+    if not result:
+        acm = clients.acm(arn.split(":")[3])
+        try:
+            response = acm.describe_certificate(CertificateArn=arn)
+            result = Certificate(response["Certificate"])
+            certificate_cache.put(result)
+        except ClientError as e:
+            raise PreConditionFailed("{}".format(e))
+    return result
+
+
 provider = CertificateDNSRecordProvider()
 
 
-def handler(request, context):
-    return provider.handle(request, context)
+def handler(request, context, budget=None):
+    return provider.handle(request, context, budget)
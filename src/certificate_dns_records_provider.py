@@ -0,0 +1,37 @@
+from certificate_dns_record_provider import CertificateDNSRecordProvider
+
+
+class CertificateDNSRecordsProvider(CertificateDNSRecordProvider):
+    """
+    Returns the DNS validation records of all domain names on a certificate at once.
+    """
+
+    def __init__(self):
+        super(CertificateDNSRecordsProvider, self).__init__()
+        self.request_schema = {
+            "type": "object",
+            "required": ["CertificateArn"],
+            "properties": {
+                "CertificateArn": {
+                    "type": "string",
+                    "description": "to get the DNS records for",
+                }
+            },
+        }
+
+    def poll_for_resource_record(self):
+        records = self.poll(self.resource_records)
+        if records:
+            self.set_attribute("Count", len(records))
+            for i, record in enumerate(records):
+                self.set_attribute("Name.{}".format(i), record["Name"])
+                self.set_attribute("Type.{}".format(i), record["Type"])
+                self.set_attribute("Value.{}".format(i), record["Value"])
+            self.physical_resource_id = self.certificate_arn
+
+
+provider = CertificateDNSRecordsProvider()
+
+
+def handler(request, context, budget=None):
+    return provider.handle(request, context, budget)
@@ -0,0 +1,121 @@
+import threading
+import time
+
+import clients
+
+# list_certificates only returns RSA_2048 certificates, unless asked otherwise
+KEY_TYPES = [
+    "RSA_1024",
+    "RSA_2048",
+    "RSA_3072",
+    "RSA_4096",
+    "EC_prime256v1",
+    "EC_secp384r1",
+    "EC_secp521r1",
+]
+
+
+def normalize_name(name):
+    """
+    returns the domain `name` in lowercase without a trailing dot
+    """
+    return name.lower().rstrip(".") if isinstance(name, str) else name
+
+
+def list_certificates(acm, **kwargs):
+    """
+    yields the pages of `list_certificates`, following the NextToken. Each page is requested
+    by a call on `acm`, so that a ThrottledClient rate limits and retries every page.
+    """
+    arguments = dict(kwargs)
+    while True:
+        page = acm.list_certificates(**arguments)
+        yield page
+        if not page.get("NextToken"):
+            return
+        arguments["NextToken"] = page["NextToken"]
+
+
+def certificate_key(domain_name, subject_alternative_names=None, key_algorithm=None):
+    """
+    returns the key of a certificate in the index: the normalized domain name, the set of
+    all names on the certificate and the key algorithm
+    """
+    names = set(subject_alternative_names or [])
+    names.add(domain_name)
+    return (
+        normalize_name(domain_name),
+        frozenset(map(normalize_name, names)),
+        key_algorithm or "RSA_2048",
+    )
+
+
+class CertificateIndex(object):
+    """
+    Finds the issued certificates in a region by their names. The index of a region is
+    built from a walk over `list_certificates`, and rebuilt when older than `ttl` seconds.
+    """
+
+    def __init__(self, ttl=300.0, clock=time.monotonic):
+        super(CertificateIndex, self).__init__()
+        self.ttl = ttl
+        self.clock = clock
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def find(
+        self, region, domain_name, subject_alternative_names=None, key_algorithm=None
+    ):
+        """
+        returns the ARN of an issued certificate with exactly the requested names, or None
+        """
+        key = certificate_key(domain_name, subject_alternative_names, key_algorithm)
+        return self.get(region).get(key)
+
+    def get(self, region):
+        with self.lock:
+            built, index = self.indexes.get(region, (None, None))
+            if built is not None and self.clock() - built < self.ttl:
+                return index
+
+        index = self.build(region)
+        with self.lock:
+            self.indexes[region] = (self.clock(), index)
+        return index
+
+    def build(self, region):
+        """
+        returns the ARNs of the issued certificates in `region` by key. If several certificates
+        have the same names, the one which expires last is used.
+        """
+        result = {}
+        expires = {}
+        for page in list_certificates(
+            clients.acm(region),
+            CertificateStatuses=["ISSUED"],
+            Includes={"keyTypes": KEY_TYPES},
+        ):
+            for summary in page["CertificateSummaryList"]:
+                if summary.get("Type", "AMAZON_ISSUED") != "AMAZON_ISSUED":
+                    continue
+                if summary.get("HasAdditionalSubjectAlternativeNames"):
+                    continue
+                key = certificate_key(
+                    summary["DomainName"],
+                    summary.get("SubjectAlternativeNameSummaries"),
+                    summary.get("KeyAlgorithm"),
+                )
+                not_after = summary.get("NotAfter")
+                if key not in result or (
+                    not_after and expires[key] and not_after > expires[key]
+                ):
+                    result[key] = summary["CertificateArn"]
+                    expires[key] = not_after
+        return result
+
+    def invalidate(self, region=None):
+        with self.lock:
+            if region:
+                self.indexes.pop(region, None)
+            else:
+                self.indexes.clear()
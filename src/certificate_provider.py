@@ -4,9 +4,17 @@ import time
 import boto3
 import json
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
 from botocore.exceptions import ClientError
 from cfn_resource_provider import ResourceProvider
 
+import clients
+from budget import ExecutionBudget
+from certificate_index import CertificateIndex, normalize_name
+from responder import send_response
+
 logger = logging.getLogger()
 
 
@@ -24,6 +32,7 @@ class CertificateProvider(ResourceProvider):
 
     def __init__(self):
         super(CertificateProvider, self).__init__()
+        self.budget = ExecutionBudget()
         self.request_schema = {
             "type": "object",
             "required": ["DomainName", "ValidationMethod"],
@@ -39,9 +48,39 @@ class CertificateProvider(ResourceProvider):
                     "type": "array",
                     "description": "Additional FQDNs to be included in the Subject Alternative Name extension of the ACM certificate.",
                 },
+                "Regions": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "minItems": 1,
+                    "uniqueItems": True,
+                    "description": "to create the certificate in, instead of a single Region",
+                },
+                "ReuseExisting": {
+                    "type": ["boolean", "string"],
+                    "description": "an issued certificate with the same names, instead of requesting a new one",
+                },
             },
         }
 
+    @property
+    def reuse_existing(self):
+        return str(self.get("ReuseExisting", False)).lower() == "true"
+
+    @property
+    def regions(self):
+        return self.get("Regions", None)
+
+    @property
+    def certificate_arns(self):
+        """
+        the certificates of this resource, as recorded in the physical resource id
+        """
+        return [
+            arn
+            for arn in (self.physical_resource_id or "").split(",")
+            if arn.startswith("arn:aws:acm:")
+        ]
+
     def create(self):
         try:
             self.request_certificate()
@@ -50,77 +89,310 @@ class CertificateProvider(ResourceProvider):
             self.physical_resource_id = "failed-to-create"
 
     def request_certificate(self):
-        arguments = self.properties.copy()
-        region = arguments.pop("Region", None)
-        acm = boto3.client("acm", region_name=region)
-        if "ServiceToken" in arguments:
-            del arguments["ServiceToken"]
-
+        region = self.get("Region", None)
+        regions = self.get("Regions", None)
+        arguments = {
+            name: value
+            for name, value in self.properties.items()
+            if name not in PROVIDER_PROPERTIES
+        }
         if "IdempotencyToken" not in arguments:
-            arguments["IdempotencyToken"] = self.request["LogicalResourceId"]
-        response = acm.request_certificate(**arguments)
-        self.physical_resource_id = response["CertificateArn"]
+            arguments["IdempotencyToken"] = self.idempotency_token
 
-    def update(self):
-        new_names = set(self.properties.keys())
-        old_names = (
-            set(self.old_properties.keys())
-            if "OldResourceProperties" in self.request
-            else new_names
+        if regions:
+            return self.request_certificates(regions, arguments)
+
+        self.physical_resource_id = self.find_or_request_certificate(region, arguments)
+
+    @property
+    def idempotency_token(self):
+        """
+        the token of the certificate requests. A replacement gets a token of its own, so that
+        ACM does not return the certificates it replaces, which are deleted afterwards.
+        """
+        if self.request_type == "Create":
+            return self.logical_resource_id
+        return re.sub(r"\W", "", self.request_id)[:32]
+
+    def find_existing_certificate(self, region, arguments):
+        """
+        returns the ARN of an issued certificate in `region` for the requested names, or None
+        """
+        if not self.reuse_existing or "CertificateAuthorityArn" in arguments:
+            return None
+        return certificate_index.find(
+            region,
+            arguments["DomainName"],
+            arguments.get("SubjectAlternativeNames"),
+            arguments.get("KeyAlgorithm"),
         )
 
-        changed_properties = list(new_names.symmetric_difference(old_names))
-        for name in new_names.union(old_names).difference(set(["ServiceToken"])):
-            if self.get(name, None) != self.get_old(name, self.get(name)):
-                changed_properties.append(name)
+    def find_or_request_certificate(self, region, arguments):
+        arn = self.find_existing_certificate(region, arguments)
+        if arn:
+            print("reusing issued certificate {}".format(arn))
+            return arn
+        if self.reuse_existing:
+            # marks the certificate as requested by this resource, see `requested_certificates`
+            arguments = dict(
+                arguments, Tags=list(arguments.get("Tags", [])) + [self.requested_by]
+            )
+        return clients.acm(region).request_certificate(**arguments)["CertificateArn"]
+
+    @property
+    def requested_by(self):
+        """
+        the tag of the certificates requested by this resource
+        """
+        resource = "{}/{}".format(
+            self.stack_id.split(":")[-1], self.logical_resource_id
+        )
+        return tag(REQUESTED_BY_TAG, resource[:256])
+
+    def requested_certificates(self):
+        """
+        returns the certificates of this resource which it requested itself, instead of
+        reusing an existing one, and the error per certificate of which the tags could not
+        be listed.
+        """
+        results = in_parallel(
+            lambda arn: clients.acm(region_of(arn)).list_tags_for_certificate(
+                CertificateArn=arn
+            )["Tags"],
+            self.certificate_arns,
+        )
+        requested = [
+            arn
+            for arn, (tags, error) in results.items()
+            if not error and self.requested_by in tags
+        ]
+        errors = {arn: error for arn, (_, error) in results.items() if error}
+        return requested, errors
 
+    def request_certificates(self, regions, arguments):
+        """
+        requests the certificate in all `regions` in parallel. If a request fails, the
+        certificates already requested are deleted and the error is raised.
+        """
+        results = in_parallel(
+            lambda region: self.find_or_request_certificate(region, arguments),
+            regions,
+        )
+        errors = [error for _, error in results.values() if error]
+        if errors:
+            arns = [
+                arn
+                for region, (arn, _) in results.items()
+                if arn and arn != self.find_existing_certificate(region, arguments)
+            ]
+            print("rolling back the certificates {}".format(", ".join(arns)))
+            delete_certificates(arns)
+            raise errors[0]
+
+        self.physical_resource_id = ",".join(results[region][0] for region in regions)
+        for region in regions:
+            self.set_attribute(region, results[region][0])
+
+    def changed_properties(self):
+        """
+        returns the names of the properties which changed, comparing normalized values
+        """
+        old_properties = (
+            self.old_properties
+            if "OldResourceProperties" in self.request
+            else self.properties
+        )
+        names = set(self.properties.keys()).union(old_properties.keys())
+        names.discard("ServiceToken")
+        # only changes how the provider finds and deletes the certificate
+        names.discard("ReuseExisting")
+        return sorted(
+            name
+            for name in names
+            if normalize(self.properties, name) != normalize(old_properties, name)
+        )
+
+    def update(self):
+        changed_properties = self.changed_properties()
         try:
-            if "DomainName" in changed_properties:
-                return self.request_certificate()
-            elif "SubjectAlternativeNames" in changed_properties:
+            if any(name in REISSUE_PROPERTIES for name in changed_properties):
                 return self.request_certificate()
-            elif (
-                changed_properties
-                and len(changed_properties) == 1
-                and changed_properties[0] == "Options"
-            ):
-                try:
-                    region = self.properties.get("Region")
-                    acm = boto3.client("acm", region_name=region)
-                    acm.update_certificate_options(
-                        CertificateArn=self.physical_resource_id,
-                        Options=self.get("Options"),
-                    )
-                except ClientError as error:
-                    self.fail("{}".format(error))
-            elif changed_properties:
+            elif set(changed_properties).difference(IN_PLACE_PROPERTIES):
                 self.fail(
-                    'You can only change the "Options", "SubjectAlternativeNames" and "DomainName" '
+                    'You can only change the "Options", "Tags", "SubjectAlternativeNames" and "DomainName" '
                     + "of a certificate, you tried to change {}".format(
                         ", ".join(changed_properties)
                     )
                 )
+            elif changed_properties:
+                if "Options" in changed_properties:
+                    options = self.get("Options", DEFAULT_OPTIONS)
+                    self.for_each_certificate(
+                        lambda acm, arn: acm.update_certificate_options(
+                            CertificateArn=arn, Options=options
+                        )
+                    )
+                if "Tags" in changed_properties:
+                    self.update_tags()
             else:
                 self.success("nothing to change")
         except ClientError as error:
             self.fail("{}".format(error))
 
+        if self.regions and self.status == "SUCCESS":
+            for arn in self.certificate_arns:
+                self.set_attribute(region_of(arn), arn)
+
+    def update_tags(self):
+        """
+        adds the new and changed tags to the certificates, and removes the deleted tags
+        """
+        new_tags = normalize(self.properties, "Tags")
+        old_tags = normalize(self.old_properties, "Tags")
+        added = [
+            tag(key, value)
+            for key, value in new_tags.items()
+            if key not in old_tags or old_tags[key] != value
+        ]
+        removed = [
+            tag(key, value) for key, value in old_tags.items() if key not in new_tags
+        ]
+        if removed:
+            self.for_each_certificate(
+                lambda acm, arn: acm.remove_tags_from_certificate(
+                    CertificateArn=arn, Tags=removed
+                )
+            )
+        if added:
+            self.for_each_certificate(
+                lambda acm, arn: acm.add_tags_to_certificate(
+                    CertificateArn=arn, Tags=added
+                )
+            )
+
+    def for_each_certificate(self, function):
+        """
+        calls `function` with the ACM client and ARN of each certificate, in parallel
+        """
+        results = in_parallel(
+            lambda arn: function(clients.acm(region_of(arn)), arn),
+            self.certificate_arns,
+        )
+        errors = [error for _, error in results.values() if error]
+        if errors:
+            raise errors[0]
+
     def delete(self):
         if not self.physical_resource_id or not self.physical_resource_id.startswith(
             "arn:aws:acm:"
         ):
             return
 
+        arns, errors = self.certificate_arns, {}
+        if self.reuse_existing:
+            arns, errors = self.requested_certificates()
+            if not arns and not errors:
+                self.success("certificates are shared when reused, and not deleted")
+                return
+
+        errors.update(delete_certificates(arns))
+        errors = errors.values()
+        if any(errors):
+            self.success(
+                "Ignore failure to delete certificates {}".format(
+                    ", ".join(str(error) for error in errors if error)
+                )
+            )
+
+    def handle(self, request, context, budget=None):
+        self.budget = budget if budget else ExecutionBudget.from_context(context)
+        return super(CertificateProvider, self).handle(request, context)
+
+    def send_response(self):
+        send_response(self)
+
+
+# properties of the resource which are not passed to request_certificate
+PROVIDER_PROPERTIES = ["ServiceToken", "Region", "Regions", "ReuseExisting"]
+
+# properties which can only be changed by requesting a new certificate
+REISSUE_PROPERTIES = ["DomainName", "SubjectAlternativeNames", "Regions"]
+
+# properties which can be changed on the existing certificate
+IN_PLACE_PROPERTIES = ["Options", "Tags"]
+
+# the tag of certificates requested with `ReuseExisting`, which are deleted with the resource
+REQUESTED_BY_TAG = "cfn-certificate-provider:requested-by"
+
+DEFAULT_OPTIONS = {"CertificateTransparencyLoggingPreference": "ENABLED"}
+
+
+def normalize(properties, name):
+    """
+    returns the value of the property `name` in a form which compares equal when the
+    resulting certificate is the same. The DomainName is always included in the
+    subject alternative names, and the order of names, regions and tags does not matter.
+    """
+    value = properties.get(name)
+    if name == "DomainName":
+        return normalize_name(value)
+    elif name == "SubjectAlternativeNames":
+        names = set(value or [])
+        names.add(properties.get("DomainName"))
+        return set(map(normalize_name, names))
+    elif name == "Regions":
+        return set(value) if value else None
+    elif name == "Tags":
+        return {t["Key"]: t.get("Value") for t in value or []}
+    return value
+
+
+def tag(key, value):
+    return {"Key": key, "Value": value} if value is not None else {"Key": key}
+
+
+def region_of(arn):
+    """
+    returns the region of the certificate `arn`
+    """
+    return arn.split(":")[3]
+
+
+def in_parallel(function, items):
+    """
+    calls `function` for each of `items` in a thread of its own. returns a dictionary
+    with the tuple (result, error) of each item. Any error is returned, so that the
+    callers can always roll back the items which succeeded.
+    """
+
+    def call(item):
         try:
-            region = self.properties.get("Region")
-            acm = boto3.client("acm", region_name=region)
-            response = acm.delete_certificate(CertificateArn=self.physical_resource_id)
-        except ClientError as error:
-            self.success("Ignore failure to delete certificate {}".format(error))
+            return function(item), None
+        except Exception as error:
+            return None, error
+
+    if not items:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(items)) as executor:
+        return dict(zip(items, executor.map(call, items)))
+
+
+def delete_certificates(arns):
+    """
+    deletes the certificates `arns` in parallel, returning the error per certificate
+    """
+    results = in_parallel(
+        lambda arn: clients.acm(region_of(arn)).delete_certificate(CertificateArn=arn),
+        arns,
+    )
+    return {arn: error for arn, (_, error) in results.items()}
+
 
+# issued certificates by name per region, see `ReuseExisting`
+certificate_index = CertificateIndex(float(getenv("CERTIFICATE_INDEX_TTL", "300")))
 
 provider = CertificateProvider()
 
 
-def handler(request, context):
-    return provider.handle(request, context)
+def handler(request, context, budget=None):
+    return provider.handle(request, context, budget)
@@ -0,0 +1,65 @@
+import logging
+from collections import defaultdict
+
+import clients
+from certificate_dns_record_provider import (
+    Certificate,
+    PreConditionFailed,
+    describe_certificate,
+)
+from certificate_index import KEY_TYPES, list_certificates
+
+logger = logging.getLogger()
+
+
+class CertificateStatusBatch(object):
+    """
+    Resolves the status of many certificates at once, with a single list_certificates
+    page walk per region. Certificates which are not listed with one of `statuses`, are
+    described individually.
+    """
+
+    def __init__(self, statuses=("PENDING_VALIDATION", "ISSUED")):
+        super(CertificateStatusBatch, self).__init__()
+        self.statuses = list(statuses)
+
+    def resolve(self, arns):
+        """
+        returns a Certificate, holding at least the status, for each of the `arns`.
+        Certificates which cannot be described are omitted.
+        """
+        by_region = defaultdict(set)
+        for arn in arns:
+            by_region[arn.split(":")[3]].add(arn)
+
+        result = {}
+        for region, wanted in by_region.items():
+            result.update(self.list_certificates(region, wanted))
+            for arn in wanted.difference(result.keys()):
+                try:
+                    result[arn] = describe_certificate(arn)
+                except PreConditionFailed as error:
+                    logger.warning("failed to describe %s, %s", arn, error.message)
+        return result
+
+    def list_certificates(self, region, wanted):
+        result = {}
+        for page in list_certificates(
+            clients.acm(region),
+            CertificateStatuses=self.statuses,
+            Includes={"keyTypes": KEY_TYPES},
+        ):
+            for summary in page["CertificateSummaryList"]:
+                arn = summary["CertificateArn"]
+                if arn in wanted and "Status" in summary:
+                    result[arn] = Certificate(
+                        {
+                            "CertificateArn": arn,
+                            "Status": summary["Status"],
+                            "DomainName": summary["DomainName"],
+                            "DomainValidationOptions": [],
+                        }
+                    )
+            if len(result) == len(wanted):
+                break
+        return result
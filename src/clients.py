@@ -0,0 +1,116 @@
+import threading
+from os import getenv
+
+import boto3
+from botocore.config import Config
+
+from metrics import metrics
+from throttling import ThrottledCaller, ThrottledClient
+
+
+def config_from_environment(prefix, max_attempts=5):
+    """
+    returns the botocore client configuration for the service `prefix`, read from the environment.
+
+    For instance, with `prefix` ACM the following variables are read:
+
+        ACM_MAX_POOL_CONNECTIONS - maximum number of connections kept in the connection pool (10)
+        ACM_CONNECT_TIMEOUT - in seconds to establish a connection (5)
+        ACM_READ_TIMEOUT - in seconds to wait for a response (30)
+        ACM_MAX_ATTEMPTS - maximum number of attempts, including the initial call (`max_attempts`)
+        ACM_RETRY_MODE - botocore retry mode: legacy, standard or adaptive (standard)
+    """
+    return Config(
+        max_pool_connections=int(getenv(f"{prefix}_MAX_POOL_CONNECTIONS", "10")),
+        connect_timeout=float(getenv(f"{prefix}_CONNECT_TIMEOUT", "5")),
+        read_timeout=float(getenv(f"{prefix}_READ_TIMEOUT", "30")),
+        retries={
+            "max_attempts": int(getenv(f"{prefix}_MAX_ATTEMPTS", str(max_attempts))),
+            "mode": getenv(f"{prefix}_RETRY_MODE", "standard"),
+        },
+    )
+
+
+class ClientPool(object):
+    """
+    A process-wide pool of boto3 clients for a single service, one client per region.
+
+    The clients and their HTTP connections are kept at module level, so that they are
+    reused by all providers and across warm Lambda invocations.
+    """
+
+    def __init__(self, service_name, config=None, caller=None):
+        super(ClientPool, self).__init__()
+        self.service_name = service_name
+        self.config = config
+        self.caller = caller
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get(self, region_name=None):
+        """
+        returns the client for `region_name`, or the default region if not specified
+        """
+        client = self.clients.get(region_name)
+        if client:
+            return client
+
+        with self.lock:
+            client = self.clients.get(region_name)
+            if not client:
+                client = self.create(region_name)
+                self.clients[region_name] = client
+        return client
+
+    def create(self, region_name):
+        client = boto3.client(
+            self.service_name, region_name=region_name, config=self.config
+        )
+        metrics.instrument(client, self.service_name)
+        if self.caller:
+            return ThrottledClient(client, self.caller, region_name)
+        return client
+
+    def clear(self):
+        """
+        removes all clients from the pool
+        """
+        with self.lock:
+            self.clients.clear()
+
+
+acm_pool = ClientPool(
+    "acm",
+    config_from_environment("ACM", max_attempts=1),
+    ThrottledCaller.from_environment("ACM"),
+)
+
+
+def acm(region_name=None):
+    """
+    returns the pooled ACM client for `region_name`
+    """
+    return acm_pool.get(region_name)
+
+
+lambda_pool = ClientPool("lambda")
+
+
+def lmbda(region_name=None):
+    """
+    returns the pooled Lambda client for `region_name`
+    """
+    return lambda_pool.get(region_name)
+
+
+route53_pool = ClientPool("route53")
+
+
+def route53():
+    """
+    returns the pooled Route53 client
+    """
+    return route53_pool.get()
+
+
+dynamodb_pool = ClientPool("dynamodb")
@@ -0,0 +1,122 @@
+import threading
+import time
+from os import getenv
+
+from botocore.exceptions import ClientError
+
+from clients import dynamodb_pool
+
+
+class MemoryStore(object):
+    """
+    Keeps the claimed keys in memory, which only detects duplicates delivered to the same
+    Lambda instance.
+    """
+
+    def __init__(self, clock=time.time):
+        super(MemoryStore, self).__init__()
+        self.clock = clock
+        self.expires = {}
+        self.lock = threading.Lock()
+
+    def claim(self, key, ttl):
+        """
+        claims `key` for `ttl` seconds. returns False if the key is already claimed.
+        """
+        with self.lock:
+            now = self.clock()
+            self.expires = {k: v for k, v in self.expires.items() if v > now}
+            if key in self.expires:
+                return False
+            self.expires[key] = now + ttl
+            return True
+
+    def release(self, key):
+        """
+        releases the claim of `key`, so that it can be claimed again
+        """
+        with self.lock:
+            self.expires.pop(key, None)
+
+
+class DynamoDBStore(object):
+    """
+    Claims the keys with a conditional put in a DynamoDB table, with the partition key `Key`.
+    Expired claims are removed by the time to live of the table on the attribute `ExpiresAt`.
+    """
+
+    def __init__(self, table_name, dynamodb=None, clock=time.time):
+        super(DynamoDBStore, self).__init__()
+        self.table_name = table_name
+        self.dynamodb = dynamodb
+        self.clock = clock
+
+    def claim(self, key, ttl):
+        dynamodb = self.dynamodb if self.dynamodb else dynamodb_pool.get()
+        now = int(self.clock())
+        try:
+            dynamodb.put_item(
+                TableName=self.table_name,
+                Item={"Key": {"S": key}, "ExpiresAt": {"N": str(now + int(ttl))}},
+                # the time to live deletes expired items with a delay, so these are overwritten
+                ConditionExpression="attribute_not_exists(#key) OR ExpiresAt < :now",
+                ExpressionAttributeNames={"#key": "Key"},
+                ExpressionAttributeValues={":now": {"N": str(now)}},
+            )
+            return True
+        except ClientError as error:
+            if (
+                error.response.get("Error", {}).get("Code")
+                == "ConditionalCheckFailedException"
+            ):
+                return False
+            raise
+
+    def release(self, key):
+        dynamodb = self.dynamodb if self.dynamodb else dynamodb_pool.get()
+        dynamodb.delete_item(TableName=self.table_name, Key={"Key": {"S": key}})
+
+
+class Deduplicator(object):
+    """
+    Detects duplicate deliveries of a request, by claiming its `RequestId`, `LogicalResourceId`
+    and `Attempt` in the `store`. A re-invocation increments the attempt, so only the first
+    delivery of each attempt is handled.
+
+    The claim lasts `ttl` seconds, so that late redeliveries are ignored too. When handling
+    the request fails, the claim is released, so that the request is handled again when it is
+    redelivered.
+    """
+
+    def __init__(self, store, ttl=900.0):
+        super(Deduplicator, self).__init__()
+        self.store = store
+        self.ttl = ttl
+
+    @staticmethod
+    def from_environment():
+        table_name = getenv("DEDUP_TABLE_NAME")
+        return Deduplicator(
+            DynamoDBStore(table_name) if table_name else MemoryStore(),
+            ttl=float(getenv("DEDUP_TTL", "900")),
+        )
+
+    @staticmethod
+    def key(request):
+        return "{}/{}/{}".format(
+            request.get("RequestId"),
+            request.get("LogicalResourceId"),
+            request.get("ResourceProperties", {}).get("Attempt", 1),
+        )
+
+    def is_duplicate(self, request):
+        """
+        returns True if the `request` is already being handled, otherwise claims it.
+        """
+        return not self.store.claim(self.key(request), self.ttl)
+
+    def release(self, key):
+        """
+        releases the claim of the request `key`, after handling it failed
+        """
+        self.store.release(key)
@@ -0,0 +1,199 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from os import getenv
+
+import clients
+from metrics import metrics
+
+# maximum size of the payload of a continuation: asynchronous Lambda invocations, SQS
+# messages and Step Functions inputs are limited to 256 KiB.
+MAX_PAYLOAD_SIZE = 240 * 1024
+
+log = logging.getLogger()
+
+
+class Continuation(object):
+    """
+    the target of a coalesced re-invocation: the Lambda function `function_name`, invoked
+    within the execution `budget`.
+    """
+
+    def __init__(self, function_name, budget=None):
+        super(Continuation, self).__init__()
+        self.function_name = function_name
+        self.budget = budget
+
+    def invoke_lambda(self, payload):
+        clients.lmbda().invoke(
+            FunctionName=self.function_name,
+            InvocationType="Event",
+            Payload=payload,
+        )
+
+
+class Dispatcher(object):
+    """
+    Coalesces the re-invocations scheduled while handling a batch of requests into a single
+    continuation, which carries the list of requests as `{"Requests": [...]}`. The continuation
+    is handled by `provider.handler`, which reports the result of each request to its own
+    ResponseURL.
+
+    Outside of `batch`, re-invocations are scheduled immediately. A continuation carries at
+    most `max_batch_size` requests, and waits for the shortest delay of its requests. Failures
+    to schedule, like a throttled Lambda invoke, are retried up to `max_attempts` times.
+
+    Only the re-invocations of a single invocation are coalesced. Requests reach the same
+    invocation together only when they are delivered as a batch, through the `sqs` scheduler
+    or a previous continuation. With the default `lambda` scheduler, every CloudFormation
+    request is handled by an invocation of its own, and is re-invoked on its own.
+    """
+
+    def __init__(
+        self,
+        max_batch_size=25,
+        max_payload_size=MAX_PAYLOAD_SIZE,
+        max_attempts=3,
+        sleep=time.sleep,
+    ):
+        super(Dispatcher, self).__init__()
+        self.max_batch_size = max_batch_size
+        self.max_payload_size = max_payload_size
+        self.max_attempts = max_attempts
+        self.sleep = sleep
+        self.pending = None
+
+    @staticmethod
+    def from_environment():
+        return Dispatcher(
+            max_batch_size=int(getenv("REINVOKE_BATCH_SIZE", "25")),
+            max_attempts=int(getenv("REINVOKE_SCHEDULE_ATTEMPTS", "3")),
+        )
+
+    @contextmanager
+    def batch(self):
+        """
+        collects the re-invocations scheduled within, and dispatches them on exit
+        """
+        if self.pending is not None:
+            yield
+            return
+
+        self.pending = []
+        try:
+            yield
+        finally:
+            pending, self.pending = self.pending, None
+            self.dispatch(pending)
+
+    def schedule(self, scheduler, provider, payload, delay):
+        """
+        schedules the re-invocation of `provider` with `payload` after `delay` seconds
+        """
+        if self.pending is None:
+            self.retry(scheduler, provider, payload, delay)
+            return
+        self.pending.append(
+            (scheduler, provider, provider.get("ServiceToken"), payload, delay)
+        )
+
+    def dispatch(self, pending):
+        if not pending:
+            return
+
+        groups = {}
+        for entry in pending:
+            scheduler, _, function_name, _, _ = entry
+            groups.setdefault((id(scheduler), function_name), []).append(entry)
+
+        continuations = 0
+        for entries in groups.values():
+            for chunk in self.chunks(entries):
+                self.send(chunk)
+                continuations += 1
+
+        metrics.reset({"Operation": "Reinvoke"})
+        metrics.add("ReinvokedRequests", len(pending))
+        metrics.add("Continuations", continuations)
+        metrics.add("CoalescedInvocations", len(pending) - continuations)
+        metrics.put("CoalescingRatio", float(len(pending)) / continuations)
+        metrics.emit()
+
+    def chunks(self, entries):
+        """
+        splits `entries` in chunks within the maximum batch and payload size
+        """
+        chunk, size = [], 0
+        for entry in entries:
+            length = len(entry[3]) + 1
+            if chunk and (
+                len(chunk) >= self.max_batch_size
+                or size + length > self.max_payload_size
+            ):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(entry)
+            size += length
+        if chunk:
+            yield chunk
+
+    def send(self, chunk):
+        """
+        schedules a single continuation for the requests in `chunk`. If that fails, the
+        requests are reported as failed, as the requests of the batch cannot be retried apart.
+        """
+        scheduler, provider, function_name, payload, _ = chunk[-1]
+        delay = min(entry[4] for entry in chunk)
+        if len(chunk) > 1:
+            payload = b'{"Requests":[' + b",".join(entry[3] for entry in chunk) + b"]}"
+        # a provider invokes the function of the request it handled last
+        if provider.get("ServiceToken") != function_name:
+            provider = Continuation(function_name, getattr(provider, "budget", None))
+        try:
+            self.retry(scheduler, provider, payload, delay)
+        except Exception as error:
+            for _, provider, _, payload, _ in chunk:
+                provider.set_request(json.loads(payload), None)
+                provider.fail("failed to re-invoke, {}".format(error))
+                if not provider.physical_resource_id:
+                    # CloudFormation rejects a response without a physical resource id
+                    provider.physical_resource_id = "could-not-create"
+                provider.send_response()
+
+    def retry(self, scheduler, provider, payload, delay):
+        """
+        schedules the re-invocation, retrying failures after 1, 2, 4.. seconds. A retry is
+        not delayed again, as the lambda scheduler has already waited.
+        """
+        attempt = 1
+        while True:
+            try:
+                scheduler.schedule(provider, payload, delay)
+                return
+            except Exception as error:
+                if attempt >= self.max_attempts:
+                    raise
+                log.warning("retrying the re-invocation, %s", error)
+            self.sleep(2 ** (attempt - 1))
+            attempt += 1
+            delay = 0
+
+
+def requests_of(event):
+    """
+    returns the CloudFormation requests in `event`: an SQS batch, a continuation or a
+    single request.
+    """
+    if "Records" in event:
+        return [
+            r
+            for record in event["Records"]
+            for r in requests_of(json.loads(record["body"]))
+        ]
+    if "Requests" in event:
+        return [r for request in event["Requests"] for r in requests_of(request)]
+    return [event]
+
+
+dispatcher = Dispatcher.from_environment()
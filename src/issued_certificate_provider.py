@@ -1,15 +1,20 @@
-import sys
-import time
+import logging
+from os import getenv
 
-import boto3
-import json
+from botocore.exceptions import BotoCoreError, ClientError
 
 from certificate_dns_record_provider import (
+    CertificateCache,
     CertificateDNSRecordProvider,
     PreConditionFailed,
+    reinvoker,
 )
+from certificate_status_batch import CertificateStatusBatch
+from metrics import metrics
+from validation_record_writer import ValidationRecordWriter
+from wait_state import WaitStates
 
-lmbda = boto3.client("lambda")
+logger = logging.getLogger()
 
 
 class IssuedCertificateProvider(CertificateDNSRecordProvider):
@@ -22,34 +27,119 @@ class IssuedCertificateProvider(CertificateDNSRecordProvider):
                 "CertificateArn": {
                     "type": "string",
                     "description": "to get the status of",
-                }
+                },
+                "HostedZoneId": {
+                    "type": "string",
+                    "description": "to write the DNS validation records to",
+                },
             },
         }
 
+    @property
+    def hosted_zone_id(self):
+        return self.get("HostedZoneId", None)
+
+    def lookup_certificate(self):
+        result = status_cache.get(self.certificate_arn)
+        if not result:
+            result = super(IssuedCertificateProvider, self).lookup_certificate()
+        return result
+
     def check(self):
         self.physical_resource_id = self.certificate_arn
+        waiter = wait_states.waiter(self.request)
+        state = wait_states.watch(self.certificate_arn, waiter)
+        metrics.put("Waiters", len(state["Waiters"]), "Count")
+        if state.get("LastStatus") == "ISSUED":
+            print("{} is issued".format(self.certificate_arn))
+            self.issued(waiter)
+        elif state["Poller"] != waiter and self.follows(state):
+            print(
+                "{} is checked by {}".format(self.certificate_arn, state["Poller"])
+            )
+            metrics.add("FollowedChecks")
+            self.async_reinvoke(wait_states.wait(state))
+        else:
+            self.poll_certificate(state, waiter)
+
+    def follows(self, state):
+        """
+        returns True if this request waits for the status recorded by the poller
+        """
+        return state.get("LastStatus") in [None, "PENDING_VALIDATION"] and (
+            not self.hosted_zone_id or self.get("ValidationRecordsInSync", False)
+        )
+
+    def issued(self, waiter):
+        metrics.put("TimeToIssued", self.waiting_time(), "Seconds")
+        wait_states.leave(self.certificate_arn, waiter)
+        self.success()
+
+    def poll_certificate(self, state, waiter):
         try:
             certificate = self.certificate
             if certificate.status == "ISSUED":
                 print("{} is issued".format(certificate))
-                self.success()
+                wait_states.record(self.certificate_arn, waiter, certificate.status)
+                self.issued(waiter)
             elif certificate.status == "PENDING_VALIDATION":
+                interval = wait_states.interval(state, reinvoker.delay(self.properties))
+                wait_states.record(
+                    self.certificate_arn,
+                    waiter,
+                    certificate.status,
+                    wait_states.clock() + interval,
+                )
+                if self.hosted_zone_id and not self.write_validation_records():
+                    return
                 print("{} is pending validation".format(certificate))
-                self.async_reinvoke()
+                self.async_reinvoke(interval)
             else:
                 print(
                     "{} is in incorrect state {}".format(
                         certificate, certificate.status
                     )
                 )
+                wait_states.leave(self.certificate_arn, waiter)
                 self.fail(
                     "incorrect certificated status {}, expected ISSUED or PENDING_VALIDATION".format(
                         certificate.status
                     )
                 )
         except PreConditionFailed as error:
+            wait_states.leave(self.certificate_arn, waiter)
             self.fail(error.message)
 
+    def write_validation_records(self):
+        """
+        writes the DNS validation records into the hosted zone, and waits until the change is in sync.
+        returns True if in sync, otherwise the request failed or waiting was handed off.
+        """
+        if self.get("ValidationRecordsInSync", False):
+            return True
+
+        change_id = self.get("ValidationRecordsChangeId")
+        if not change_id:
+            status_cache.invalidate(self.certificate_arn)
+            records = self.poll(self.resource_records)
+            if not records:
+                return False
+            change_id = validation_record_writer.upsert(
+                self.hosted_zone_id,
+                records,
+                "validation of {}".format(self.certificate_arn),
+            )
+            print("wrote {} validation records as {}".format(len(records), change_id))
+            self.properties["ValidationRecordsChangeId"] = change_id
+
+        if not validation_record_writer.is_insync(change_id):
+            print("waiting for change {} to be in sync".format(change_id))
+            self.async_reinvoke()
+            return False
+
+        self.properties["ValidationRecordsInSync"] = True
+        return True
+
     def create(self):
         self.check()
 
@@ -59,32 +149,39 @@ class IssuedCertificateProvider(CertificateDNSRecordProvider):
     def delete(self):
         pass
 
-    def invoke_lambda(self, payload):
-        lmbda.invoke(
-            FunctionName=self.get("ServiceToken"),
-            InvocationType="Event",
-            Payload=payload,
-        )
-
-    def async_reinvoke(self, interval_in_seconds=15):
-        self.asynchronous = True  ## do not report result to CFN yet
-        time.sleep(interval_in_seconds)
-        self.increment_attempt()
-        payload = json.dumps(self.request).encode("utf-8")
-        self.invoke_lambda(payload)
 
-    @property
-    def attempt(self):
-        """ returns the number of attempts waiting for completion """
-        return int(self.get("Attempt", 1))
+# certificate statuses resolved in batch, see `prefetch`
+status_cache = CertificateCache(float(getenv("CERTIFICATE_CACHE_TTL", "5")))
 
-    def increment_attempt(self):
-        """ returns the number of attempts waiting for completion """
-        self.properties["Attempt"] = self.attempt + 1
+validation_record_writer = ValidationRecordWriter()
 
+# the waits for a certificate, shared by all requests waiting on it
+wait_states = WaitStates.from_environment()
 
 provider = IssuedCertificateProvider()
 
 
-def handler(request, context):
-    return provider.handle(request, context)
+def prefetch(requests):
+    """
+    resolves the status of all certificates awaited by `requests` in a single batch. This is
+    best effort: if the batch fails, each request describes its own certificate.
+    """
+    arns = set(
+        r["ResourceProperties"]["CertificateArn"]
+        for r in requests
+        if r.get("ResourceType") == "Custom::IssuedCertificate"
+        and r.get("RequestType") in ["Create", "Update"]
+        and "CertificateArn" in r.get("ResourceProperties", {})
+    )
+    if len(arns) > 1:
+        try:
+            certificates = CertificateStatusBatch().resolve(arns)
+        except (BotoCoreError, ClientError) as error:
+            logger.warning("failed to resolve the certificate statuses, %s", error)
+            return
+        for certificate in certificates.values():
+            status_cache.put(certificate)
+
+
+def handler(request, context, budget=None):
+    return provider.handle(request, context, budget)
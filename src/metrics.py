@@ -0,0 +1,141 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from os import getenv
+
+
+class Metrics(object):
+    """
+    Collects the metrics of a single request, and writes them to stdout in the
+    CloudWatch Embedded Metric Format when the request is done. Metrics may be recorded
+    from several threads at once, like the AWS calls made in parallel.
+    """
+
+    def __init__(self, namespace, enabled=True, clock=time.time, stream=None):
+        super(Metrics, self).__init__()
+        self.namespace = namespace
+        self.enabled = enabled
+        self.clock = clock
+        self.stream = stream
+        self.dimensions = {}
+        self.values = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def from_environment():
+        return Metrics(
+            namespace=getenv("METRICS_NAMESPACE", "cfn-certificate-provider"),
+            enabled=getenv("METRICS_ENABLED", "true").lower() == "true",
+        )
+
+    def reset(self, dimensions=None):
+        with self.lock:
+            self.dimensions = dict(dimensions) if dimensions else {}
+            self.values = {}
+
+    def put(self, name, value, unit="None"):
+        """
+        sets the metric `name` to `value`
+        """
+        with self.lock:
+            self.values[name] = (value, unit)
+
+    def add(self, name, value=1, unit="Count"):
+        """
+        adds `value` to the metric `name`
+        """
+        with self.lock:
+            self.values[name] = (self.values.get(name, (0, unit))[0] + value, unit)
+
+    def record_call(self, service_name, operation_name, latency, error_code=None):
+        """
+        records a call to the AWS API, with the `latency` in seconds
+        """
+        name = "{}.{}".format(service_name, operation_name)
+        self.add("AWSCalls")
+        self.add(name + ".Calls")
+        self.add(name + ".Latency", latency * 1000.0, "Milliseconds")
+        if error_code:
+            self.add(name + ".Errors")
+            if "Throttl" in error_code or error_code == "LimitExceededException":
+                self.add(name + ".Throttles")
+
+    def to_emf(self):
+        """
+        returns the metrics as CloudWatch Embedded Metric Format record
+        """
+        with self.lock:
+            dimensions, values = dict(self.dimensions), dict(self.values)
+        result = {
+            "_aws": {
+                "Timestamp": int(self.clock() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [sorted(dimensions.keys())],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for name, (_, unit) in sorted(values.items())
+                        ],
+                    }
+                ],
+            }
+        }
+        result.update(dimensions)
+        result.update({name: value for name, (value, _) in values.items()})
+        return result
+
+    def emit(self):
+        if self.enabled and self.values:
+            print(json.dumps(self.to_emf()), file=self.stream or sys.stdout)
+
+    @contextmanager
+    def request(self, request):
+        """
+        collects the metrics of the CloudFormation `request`, and emits them when done
+        """
+        self.reset(
+            {
+                "ResourceType": request.get("ResourceType", "unknown"),
+                "RequestType": request.get("RequestType", "unknown"),
+            }
+        )
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.put(
+                "Duration", (time.perf_counter() - started) * 1000.0, "Milliseconds"
+            )
+            self.put(
+                "Attempt",
+                int(request.get("ResourceProperties", {}).get("Attempt", 1)),
+                "Count",
+            )
+            self.emit()
+
+    def instrument(self, client, service_name):
+        """
+        records the calls made by the boto3 `client`
+        """
+
+        def before_call(context, **kwargs):
+            context["metrics_started"] = time.perf_counter()
+
+        def after_call(model, parsed, context, **kwargs):
+            started = context.get("metrics_started")
+            if started is None:
+                return
+            error_code = parsed.get("Error", {}).get("Code") if parsed else None
+            self.record_call(
+                service_name, model.name, time.perf_counter() - started, error_code
+            )
+
+        client.meta.events.register("before-parameter-build", before_call)
+        client.meta.events.register("after-call", after_call)
+        return client
+
+
+metrics = Metrics.from_environment()
@@ -0,0 +1,99 @@
+import random
+import time
+from os import getenv
+
+
+def remaining_time_in_seconds(context):
+    """
+    returns the remaining execution time of the Lambda invocation in seconds, or None if unknown.
+    """
+    get_remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+    return get_remaining_time() / 1000.0 if get_remaining_time else None
+
+
+class PollingSchedule(object):
+    """
+    Schedules the waits between polls: a short first probe, followed by exponentially
+    increasing intervals with jitter, until `max_wait` seconds have elapsed.
+    """
+
+    def __init__(
+        self,
+        first_delay=1.0,
+        interval=2.0,
+        max_interval=15.0,
+        factor=2.0,
+        jitter=0.5,
+        max_wait=None,
+        clock=time.monotonic,
+        sleep=time.sleep,
+        random=random.random,
+    ):
+        super(PollingSchedule, self).__init__()
+        self.first_delay = first_delay
+        self.interval = interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.jitter = jitter
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self.random = random
+        self.started = clock()
+        self.iterations = 0
+
+    @staticmethod
+    def from_environment(budget=None, **kwargs):
+        """
+        returns a schedule configured from the environment, which ends when the execution
+        `budget` is used up.
+        """
+        max_wait = budget.remaining() if budget else None
+
+        return PollingSchedule(
+            first_delay=float(getenv("POLL_FIRST_DELAY", "1")),
+            interval=float(getenv("POLL_INTERVAL", "2")),
+            max_interval=float(getenv("POLL_MAX_INTERVAL", "15")),
+            factor=float(getenv("POLL_BACKOFF_FACTOR", "2")),
+            jitter=float(getenv("POLL_JITTER", "0.5")),
+            max_wait=max_wait,
+            **kwargs
+        )
+
+    @property
+    def elapsed(self):
+        return self.clock() - self.started
+
+    @property
+    def remaining(self):
+        """
+        returns the number of seconds left to wait, or None if unbounded.
+        """
+        return None if self.max_wait is None else self.max_wait - self.elapsed
+
+    def next_delay(self):
+        """
+        returns the delay before the next poll, without jitter applied to the first probe.
+        """
+        if self.iterations == 0:
+            return self.first_delay
+
+        delay = min(
+            self.max_interval, self.interval * self.factor ** (self.iterations - 1)
+        )
+        return delay * (1.0 - self.jitter * self.random())
+
+    def wait(self):
+        """
+        sleeps until the next poll is due. returns False if the deadline has passed.
+        """
+        delay = self.next_delay()
+        remaining = self.remaining
+        if remaining is not None:
+            if remaining <= 0:
+                return False
+            delay = min(delay, remaining)
+
+        self.sleep(delay)
+        self.iterations += 1
+        return True
@@ -1,16 +1,91 @@
 import logging
-import certificate_dns_record_provider
-import certificate_provider
-import issued_certificate_provider
+from importlib import import_module
 from os import getenv
 
+import clients
+from budget import ExecutionBudget
+from dedup import Deduplicator
+from dispatcher import dispatcher, requests_of
+from metrics import metrics
+from responder import responder
+
 logging.basicConfig(level=getenv("LOG_LEVEL", "INFO"))
 
+# the provider modules are imported on first use, to keep the cold start short.
+modules = {
+    "Custom::Certificate": "certificate_provider",
+    "Custom::IssuedCertificate": "issued_certificate_provider",
+    "Custom::CertificateDNSRecord": "certificate_dns_record_provider",
+    "Custom::CertificateDNSRecords": "certificate_dns_records_provider",
+}
+
+deduplicator = Deduplicator.from_environment()
+
+
+def provider_module(resource_type):
+    """
+    returns the module implementing `resource_type`, defaulting to the CertificateDNSRecord
+    """
+    return import_module(modules.get(resource_type, "certificate_dns_record_provider"))
+
 
 def handler(request, context):
-    if request["ResourceType"] == "Custom::Certificate":
-        return certificate_provider.handler(request, context)
-    elif request["ResourceType"] == "Custom::IssuedCertificate":
-        return issued_certificate_provider.handler(request, context)
-    else:
-        return certificate_dns_record_provider.handler(request, context)
+    budget = ExecutionBudget.from_context(context)
+    clients.acm_pool.caller.set_budget(budget)
+    if "Records" in request or "Requests" in request:
+        # re-invocations scheduled through SQS or coalesced, see scheduler.py and dispatcher.py
+        requests = requests_of(request)
+        # the keys before handling, which increments the attempt of re-invoked requests
+        keys = [deduplicator.key(r) for r in requests]
+        provider_module("Custom::IssuedCertificate").prefetch(requests)
+        try:
+            with responder.batch(), dispatcher.batch():
+                return [
+                    hand_off(r, context, budget)
+                    if budget.is_low()
+                    else handle(r, context, budget)
+                    for r in requests
+                ]
+        except Exception:
+            # requests of which the response was not delivered are handled again on redelivery
+            for r, key in zip(requests, keys):
+                if r.get("ResponseURL") in responder.failed:
+                    deduplicator.release(key)
+            raise
+
+    with dispatcher.batch():
+        return handle(request, context, budget)
+
+
+def handle(request, context, budget):
+    clients.acm_pool.caller.set_budget(budget)
+    key = deduplicator.key(request)
+    with metrics.request(request):
+        if deduplicator.is_duplicate(request):
+            print("ignoring duplicate delivery of {}".format(key))
+            metrics.add("Duplicates")
+            return None
+        try:
+            return provider_module(request["ResourceType"]).handler(
+                request, context, budget
+            )
+        except Exception:
+            # the request is handled again when Lambda retries it
+            deduplicator.release(key)
+            raise
+
+
+def hand_off(request, context, budget):
+    """
+    hands the `request` off to a new invocation, as the execution `budget` is running out
+    """
+    provider = provider_module(request["ResourceType"]).provider
+    provider.set_request(request, context)
+    provider.budget = budget
+    print("handing off {}, {} left".format(deduplicator.key(request), budget))
+    with metrics.request(request):
+        metrics.add("HandOffs")
+        import_module("certificate_dns_record_provider").reinvoker.reinvoke(provider, 0)
+        if not provider.asynchronous:
+            provider.send_response()
+    return None
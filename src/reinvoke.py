@@ -0,0 +1,131 @@
+import json
+import time
+from os import getenv
+
+from dispatcher import dispatcher
+from scheduler import LambdaScheduler, scheduler_from_environment
+
+
+class Reinvoker(object):
+    """
+    Hands waiting off to a new asynchronous invocation of the provider function.
+
+    The state of the wait is carried in the resource properties of the request: `Attempt` counts
+    the invocations and `FirstAttemptTime` records when waiting started. Each re-invocation is
+    delayed by `interval` seconds, growing with `factor` per attempt up to `max_interval`. After
+    `max_attempts` attempts or `max_elapsed` seconds the request fails.
+
+    The `scheduler` determines how the delay is implemented, see `scheduler.py`. The
+    re-invocations scheduled while handling a batch are coalesced, see `dispatcher.py`.
+    """
+
+    def __init__(
+        self,
+        interval=15.0,
+        factor=1.0,
+        max_interval=60.0,
+        max_attempts=240,
+        max_elapsed=3300.0,
+        clock=time.time,
+        scheduler=None,
+    ):
+        super(Reinvoker, self).__init__()
+        self.interval = interval
+        self.factor = factor
+        self.max_interval = max_interval
+        self.max_attempts = max_attempts
+        self.max_elapsed = max_elapsed
+        self.clock = clock
+        self.scheduler = scheduler if scheduler else LambdaScheduler()
+
+    @staticmethod
+    def from_environment(**kwargs):
+        return Reinvoker(
+            interval=float(getenv("REINVOKE_INTERVAL", "15")),
+            factor=float(getenv("REINVOKE_BACKOFF_FACTOR", "1")),
+            max_interval=float(getenv("REINVOKE_MAX_INTERVAL", "60")),
+            max_attempts=int(getenv("REINVOKE_MAX_ATTEMPTS", "240")),
+            max_elapsed=float(getenv("REINVOKE_MAX_ELAPSED", "3300")),
+            scheduler=scheduler_from_environment(),
+            **kwargs
+        )
+
+    def attempt(self, properties):
+        """
+        returns the number of attempts waiting for completion
+        """
+        return int(properties.get("Attempt", 1))
+
+    def elapsed(self, properties):
+        """
+        returns the number of seconds since the first attempt
+        """
+        return self.clock() - float(properties.get("FirstAttemptTime", self.clock()))
+
+    def delay(self, properties):
+        """
+        returns the number of seconds to wait before the next attempt
+        """
+        return min(
+            self.max_interval,
+            self.interval * self.factor ** (self.attempt(properties) - 1),
+        )
+
+    def is_exhausted(self, properties):
+        return (
+            self.attempt(properties) >= self.max_attempts
+            or self.elapsed(properties) >= self.max_elapsed
+        )
+
+    def increment_attempt(self, properties):
+        properties.setdefault("FirstAttemptTime", self.clock())
+        properties["Attempt"] = self.attempt(properties) + 1
+
+    def reinvoke(self, provider, delay=None):
+        """
+        re-invokes the function with the request of `provider`, unless the attempts are exhausted.
+        The re-invocation is delayed by `delay` seconds, or by the interval of the attempt.
+        """
+        properties = provider.properties
+        properties.setdefault("FirstAttemptTime", self.clock())
+        if self.is_exhausted(properties):
+            provider.fail(
+                "gave up waiting after {} attempts in {:.0f} seconds".format(
+                    self.attempt(properties), self.elapsed(properties)
+                )
+            )
+            return
+
+        provider.asynchronous = True  ## do not report result to CFN yet
+        delay = self.delay(properties) if delay is None else delay
+        self.increment_attempt(properties)
+        payload = json.dumps(
+            resume_request(provider.request), separators=(",", ":")
+        ).encode("utf-8")
+        try:
+            dispatcher.schedule(self.scheduler, provider, payload, delay)
+        except Exception:
+            # the check is not continued, so the provider reports the failure itself
+            provider.asynchronous = False
+            raise
+
+
+# the fields of a CloudFormation request needed to resume waiting
+RESUME_FIELDS = (
+    "RequestType",
+    "ResponseURL",
+    "StackId",
+    "RequestId",
+    "ResourceType",
+    "LogicalResourceId",
+    "PhysicalResourceId",
+    "ResourceProperties",
+)
+
+
+def resume_request(request):
+    """
+    returns the part of `request` which is sent to the re-invocation. The OldResourceProperties
+    are not needed to wait for completion, and are left out.
+    """
+    return {name: request[name] for name in RESUME_FIELDS if name in request}
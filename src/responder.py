@@ -0,0 +1,191 @@
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from os import getenv
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics
+
+log = logging.getLogger()
+
+
+class Responder(object):
+    """
+    Sends the responses to the CloudFormation `ResponseURL`, over a pooled keep-alive HTTP
+    session. Failed deliveries with a 5xx status or a connection error are retried up to
+    `max_attempts` times, waiting with decorrelated jitter between `base_delay` and `max_delay`
+    seconds.
+
+    Within `batch`, responses are sent concurrently by up to `concurrency` threads, and the
+    batch waits for their delivery on exit. The URLs of which the delivery failed are kept in
+    `failed`.
+    """
+
+    def __init__(
+        self,
+        concurrency=8,
+        max_attempts=5,
+        base_delay=0.5,
+        max_delay=8.0,
+        timeout=10.0,
+        session=None,
+        sleep=time.sleep,
+        random=random.uniform,
+    ):
+        super(Responder, self).__init__()
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.session = session if session else self.create_session()
+        self.sleep = sleep
+        self.random = random
+        self.executor = None
+        self.futures = None
+        self.failed = set()
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.retries = 0
+
+    @staticmethod
+    def from_environment():
+        return Responder(
+            concurrency=int(getenv("RESPONSE_CONCURRENCY", "8")),
+            max_attempts=int(getenv("RESPONSE_MAX_ATTEMPTS", "5")),
+            timeout=float(getenv("RESPONSE_TIMEOUT", "10")),
+        )
+
+    def create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.concurrency, pool_maxsize=self.concurrency
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @contextmanager
+    def batch(self):
+        """
+        sends the responses within concurrently, and waits for their delivery on exit
+        """
+        if self.futures is not None:
+            yield
+            return
+
+        self.futures = {}
+        self.latencies, self.retries = [], 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as self.executor:
+                yield
+                wait(self.futures)
+        finally:
+            futures, self.futures, self.executor = self.futures, None, None
+            self.failed = {url for f, url in futures.items() if f.exception()}
+            self.report(len(futures))
+
+        errors = [f.exception() for f in futures if f.exception()]
+        if errors:
+            raise errors[0]
+
+    def send(self, url, response, budget=None):
+        """
+        sends `response` to `url`, in the background when in a batch. Retries stop when the
+        execution `budget` runs out.
+        """
+        body = json.dumps(response).encode("utf-8")
+        if self.futures is not None:
+            self.futures[self.executor.submit(self.put, url, body, budget)] = url
+            return
+
+        self.latencies, self.retries = [], 0
+        self.put(url, body, budget)
+        metrics.put("ResponseLatency", self.latencies[0], "Milliseconds")
+        if self.retries:
+            metrics.add("ResponseRetries", self.retries)
+
+    def put(self, url, body, budget=None):
+        """
+        puts the `body` to `url`, retrying transient failures
+        """
+        started = time.perf_counter()
+        delay = self.base_delay
+        attempt = 1
+        while True:
+            delay = min(self.max_delay, self.random(self.base_delay, delay * 3))
+            time_left = budget.time_left() if budget else None
+            last = attempt >= self.max_attempts or (
+                time_left is not None and delay >= time_left
+            )
+            try:
+                r = self.session.put(
+                    url,
+                    data=body,
+                    headers={"content-type": ""},
+                    timeout=self.timeout_within(time_left),
+                )
+                if r.status_code == 200:
+                    break
+                if r.status_code < 500 or last:
+                    raise Exception(
+                        "failed to put the response to %s status code %d, %s"
+                        % (url, r.status_code, r.text)
+                    )
+                log.warning(
+                    "retrying response to %s, status code %d", url, r.status_code
+                )
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if last:
+                    raise
+                log.warning("retrying response to %s, %s", url, error)
+
+            self.sleep(delay)
+            attempt += 1
+            with self.lock:
+                self.retries += 1
+
+        with self.lock:
+            self.latencies.append((time.perf_counter() - started) * 1000.0)
+
+    def timeout_within(self, time_left):
+        """
+        returns the timeout of a put, which ends before the invocation times out
+        """
+        if time_left is None:
+            return self.timeout
+        return max(1.0, min(self.timeout, time_left))
+
+    def report(self, count):
+        """
+        writes the metrics of the responses sent in a batch
+        """
+        if not count:
+            return
+        metrics.reset({"Operation": "Respond"})
+        metrics.add("Responses", count)
+        metrics.add("ResponseFailures", count - len(self.latencies))
+        metrics.add("ResponseRetries", self.retries)
+        if self.latencies:
+            # the embedded metric format accepts up to 100 values per metric
+            metrics.put("ResponseLatency", self.latencies[:100], "Milliseconds")
+        metrics.emit()
+
+
+def send_response(provider):
+    """
+    sends the response of `provider` to the CloudFormation `ResponseURL` of its request
+    """
+    provider._truncate_reason()
+    responder.send(
+        provider.response_url, provider.response, getattr(provider, "budget", None)
+    )
+
+
+responder = Responder.from_environment()
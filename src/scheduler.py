@@ -0,0 +1,86 @@
+import json
+import time
+from os import getenv
+
+from clients import ClientPool
+
+sqs_pool = ClientPool("sqs")
+stepfunctions_pool = ClientPool("stepfunctions")
+
+# maximum delay of an SQS message
+MAX_SQS_DELAY = 900
+
+
+class LambdaScheduler(object):
+    """
+    Sleeps inside the current invocation and then invokes the function asynchronously.
+    The sleep ends early when the execution budget of the provider is used up.
+    """
+
+    def __init__(self, sleep=time.sleep):
+        super(LambdaScheduler, self).__init__()
+        self.sleep = sleep
+
+    def schedule(self, provider, payload, delay):
+        budget = getattr(provider, "budget", None)
+        self.sleep(budget.bound(delay) if budget else delay)
+        provider.invoke_lambda(payload)
+
+
+class SQSScheduler(object):
+    """
+    Sends the request to an SQS queue with a delivery delay. The queue is expected to
+    trigger the provider function through an event source mapping.
+    """
+
+    def __init__(self, queue_url, sqs=None):
+        super(SQSScheduler, self).__init__()
+        self.queue_url = queue_url
+        self.sqs = sqs
+
+    def schedule(self, provider, payload, delay):
+        sqs = self.sqs if self.sqs else sqs_pool.get()
+        sqs.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=payload.decode("utf-8"),
+            DelaySeconds=min(MAX_SQS_DELAY, int(round(delay))),
+        )
+
+
+class StepFunctionsScheduler(object):
+    """
+    Starts an execution of a state machine which waits `Delay` seconds and then
+    invokes the provider function asynchronously with `Request`.
+    """
+
+    def __init__(self, state_machine_arn, stepfunctions=None):
+        super(StepFunctionsScheduler, self).__init__()
+        self.state_machine_arn = state_machine_arn
+        self.stepfunctions = stepfunctions
+
+    def schedule(self, provider, payload, delay):
+        stepfunctions = (
+            self.stepfunctions if self.stepfunctions else stepfunctions_pool.get()
+        )
+        stepfunctions.start_execution(
+            stateMachineArn=self.state_machine_arn,
+            input=json.dumps(
+                {"Delay": int(round(delay)), "Request": json.loads(payload)}
+            ),
+        )
+
+
+def scheduler_from_environment():
+    """
+    returns the scheduler selected by REINVOKE_SCHEDULER: lambda (default), sqs or stepfunctions.
+    """
+    name = getenv("REINVOKE_SCHEDULER", "lambda").lower()
+    if name == "sqs":
+        return SQSScheduler(getenv("REINVOKE_QUEUE_URL"))
+    elif name == "stepfunctions":
+        return StepFunctionsScheduler(getenv("REINVOKE_STATE_MACHINE_ARN"))
+    elif name == "lambda":
+        return LambdaScheduler()
+    raise ValueError(
+        "REINVOKE_SCHEDULER must be lambda, sqs or stepfunctions, not {}".format(name)
+    )
@@ -0,0 +1,190 @@
+import random
+import threading
+import time
+from os import getenv
+
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+from metrics import metrics
+
+# error codes after which the call is retried. ACM reports exceeding its request rate
+# quotas as LimitExceededException, next to exceeding the number of certificates.
+RETRYABLE_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "LimitExceededException",
+    "InternalFailure",
+    "InternalServerError",
+    "ServiceUnavailable",
+    "RequestTimeout",
+}
+
+RETRYABLE_EXCEPTIONS = (
+    ConnectionClosedError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+
+def is_retryable(error):
+    """
+    returns true if the call which raised `error` may succeed when retried
+    """
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in RETRYABLE_ERROR_CODES
+    return isinstance(error, RETRYABLE_EXCEPTIONS)
+
+
+def is_throttle(error):
+    return isinstance(error, ClientError) and (
+        error.response.get("Error", {}).get("Code")
+        in [
+            "Throttling",
+            "ThrottlingException",
+            "TooManyRequestsException",
+            "LimitExceededException",
+        ]
+    )
+
+
+class TokenBucket(object):
+    """
+    Limits the call rate to `rate` calls per second, with bursts of up to `capacity` calls.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        super(TokenBucket, self).__init__()
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """
+        takes a token from the bucket. returns the number of seconds to wait before the token may be used.
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class ThrottledCaller(object):
+    """
+    Calls the AWS API with client-side rate limiting per key and retries of throttled and
+    transient failures, with decorrelated jitter. Retries stop when the execution budget set by
+    `set_budget` is used up, after which the last error is raised.
+
+    The rate limit applies to the calls made by this process only.
+    """
+
+    def __init__(
+        self,
+        rate=5.0,
+        burst=10,
+        base_delay=0.5,
+        max_delay=20.0,
+        clock=time.monotonic,
+        sleep=time.sleep,
+        random=random.uniform,
+    ):
+        super(ThrottledCaller, self).__init__()
+        self.rate = rate
+        self.burst = burst
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+        self.random = random
+        self.budget = None
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.throttles_absorbed = 0
+        self.retries = 0
+
+    @staticmethod
+    def from_environment(prefix, **kwargs):
+        return ThrottledCaller(
+            rate=float(getenv(f"{prefix}_RATE_LIMIT", "5")),
+            burst=int(getenv(f"{prefix}_BURST", "10")),
+            base_delay=float(getenv(f"{prefix}_RETRY_BASE_DELAY", "0.5")),
+            max_delay=float(getenv(f"{prefix}_RETRY_MAX_DELAY", "20")),
+            **kwargs,
+        )
+
+    def set_budget(self, budget):
+        """
+        bounds the retries by the execution `budget` of the Lambda invocation
+        """
+        self.budget = budget
+
+    def bucket(self, key):
+        with self.lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(self.rate, self.burst, self.clock)
+            return self.buckets[key]
+
+    def time_left(self):
+        return None if self.budget is None else self.budget.remaining()
+
+    def call(self, key, method, *args, **kwargs):
+        """
+        calls `method`, rate limited by the bucket of `key`
+        """
+        delay = self.base_delay
+        while True:
+            wait = self.bucket(key).take()
+            if wait:
+                self.sleep(wait)
+            try:
+                return method(*args, **kwargs)
+            except Exception as error:
+                if not is_retryable(error):
+                    raise
+                delay = min(self.max_delay, self.random(self.base_delay, delay * 3))
+                time_left = self.time_left()
+                if time_left is not None and delay > time_left:
+                    raise
+                if is_throttle(error):
+                    self.throttles_absorbed += 1
+                    metrics.add("ThrottlesAbsorbed")
+                self.retries += 1
+                metrics.add("Retries")
+                self.sleep(delay)
+
+
+class ThrottledClient(object):
+    """
+    Wraps a boto3 client, so that all API calls go through the `caller`. Paginators are not
+    wrapped, so pages are requested with explicit calls instead, see
+    `certificate_index.list_certificates`.
+    """
+
+    def __init__(self, client, caller, key):
+        super(ThrottledClient, self).__init__()
+        self.client = client
+        self.caller = caller
+        self.key = key
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if name not in self.client.meta.method_to_api_mapping:
+            return attribute
+
+        def call(*args, **kwargs):
+            return self.caller.call(self.key, attribute, *args, **kwargs)
+
+        return call
@@ -0,0 +1,44 @@
+import clients
+
+
+class ValidationRecordWriter(object):
+    """
+    Writes DNS validation records of a certificate into a Route53 hosted zone.
+    """
+
+    def __init__(self, ttl=60):
+        super(ValidationRecordWriter, self).__init__()
+        self.ttl = ttl
+
+    def upsert(self, hosted_zone_id, records, comment=None):
+        """
+        upserts all `records` in a single change batch, returning the change id.
+        """
+        change_batch = {
+            "Changes": [
+                {
+                    "Action": "UPSERT",
+                    "ResourceRecordSet": {
+                        "Name": record["Name"],
+                        "Type": record["Type"],
+                        "TTL": self.ttl,
+                        "ResourceRecords": [{"Value": record["Value"]}],
+                    },
+                }
+                for record in records
+            ]
+        }
+        if comment:
+            change_batch["Comment"] = comment
+
+        response = clients.route53().change_resource_record_sets(
+            HostedZoneId=hosted_zone_id, ChangeBatch=change_batch
+        )
+        return response["ChangeInfo"]["Id"]
+
+    def is_insync(self, change_id):
+        """
+        returns true if the change `change_id` has been propagated to all Route53 name servers.
+        """
+        response = clients.route53().get_change(Id=change_id)
+        return response["ChangeInfo"]["Status"] == "INSYNC"
@@ -0,0 +1,267 @@
+import fcntl
+import json
+import threading
+import time
+from os import getenv
+
+from botocore.exceptions import ClientError
+
+from clients import dynamodb_pool
+
+
+class MemoryStore(object):
+    """
+    Keeps the states in memory, which only shares them between the requests handled by the
+    same Lambda instance.
+    """
+
+    def __init__(self, clock=time.time):
+        super(MemoryStore, self).__init__()
+        self.clock = clock
+        self.states = {}
+        self.lock = threading.Lock()
+
+    def update(self, key, function, ttl):
+        """
+        replaces the state of `key` with the result of `function(state)`, and returns it.
+        The state is None if absent, and removed when `function` returns None. A state
+        expires `ttl` seconds after its last update.
+        """
+        with self.lock:
+            now = self.clock()
+            self.states = {k: v for k, v in self.states.items() if v[0] > now}
+            state = function(self.states.get(key, (None, None))[1])
+            if state is None:
+                self.states.pop(key, None)
+            else:
+                self.states[key] = (now + ttl, state)
+            return state
+
+
+class FileStore(object):
+    """
+    Keeps the states in a JSON file, locked while updated. The file is shared by all
+    processes on the same host, and lives as long as the Lambda instance in /tmp.
+    """
+
+    def __init__(self, path, clock=time.time):
+        super(FileStore, self).__init__()
+        self.path = path
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    def update(self, key, function, ttl):
+        with self.lock, open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            content = f.read()
+            now = self.clock()
+            states = {
+                k: v
+                for k, v in (json.loads(content) if content else {}).items()
+                if v[0] > now
+            }
+            state = function(states.get(key, (None, None))[1])
+            if state is None:
+                states.pop(key, None)
+            else:
+                states[key] = (now + ttl, state)
+            f.seek(0)
+            f.truncate()
+            json.dump(states, f)
+            return state
+
+
+class DynamoDBStore(object):
+    """
+    Keeps the states in a DynamoDB table with the partition key `Key`. An update is a
+    conditional write on the `Version` read, which is retried when another request updated
+    the state in between. Expired states are removed by the time to live of the table on the
+    attribute `ExpiresAt`.
+    """
+
+    def __init__(self, table_name, dynamodb=None, clock=time.time, max_attempts=10):
+        super(DynamoDBStore, self).__init__()
+        self.table_name = table_name
+        self.dynamodb = dynamodb
+        self.clock = clock
+        self.max_attempts = max_attempts
+
+    def update(self, key, function, ttl):
+        dynamodb = self.dynamodb if self.dynamodb else dynamodb_pool.get()
+        for attempt in range(1, self.max_attempts + 1):
+            now = int(self.clock())
+            item = dynamodb.get_item(
+                TableName=self.table_name, Key={"Key": {"S": key}}, ConsistentRead=True
+            ).get("Item")
+            version = int(item["Version"]["N"]) if item else 0
+            # the time to live deletes expired items with a delay
+            if item and int(item["ExpiresAt"]["N"]) >= now:
+                state = function(json.loads(item["State"]["S"]))
+            else:
+                state = function(None)
+            try:
+                if state is None:
+                    if item:
+                        dynamodb.delete_item(
+                            TableName=self.table_name,
+                            Key={"Key": {"S": key}},
+                            ConditionExpression="Version = :version",
+                            ExpressionAttributeValues={":version": {"N": str(version)}},
+                        )
+                    return None
+                dynamodb.put_item(
+                    TableName=self.table_name,
+                    Item={
+                        "Key": {"S": key},
+                        "State": {"S": json.dumps(state)},
+                        "Version": {"N": str(version + 1)},
+                        "ExpiresAt": {"N": str(now + int(ttl))},
+                    },
+                    ConditionExpression="attribute_not_exists(#key) OR Version = :version",
+                    ExpressionAttributeNames={"#key": "Key"},
+                    ExpressionAttributeValues={":version": {"N": str(version)}},
+                )
+                return state
+            except ClientError as error:
+                code = error.response.get("Error", {}).get("Code")
+                if code != "ConditionalCheckFailedException" or (
+                    attempt == self.max_attempts
+                ):
+                    raise
+
+
+class WaitStates(object):
+    """
+    Shares the wait for a certificate between all requests waiting on it. Per certificate
+    ARN, the `store` records when it was first seen, its last status, when it is checked next
+    and the requests waiting on it.
+
+    Only one of the waiting requests, the poller, checks the certificate in ACM. The others
+    read the status it recorded, after its next check. The poller hands over to another
+    request when it leaves, or when it has not checked for `grace` seconds after its next
+    check was due.
+
+    The interval between checks grows with the time the certificate is pending: it is
+    `backoff` times the pending time, between the interval of the re-invoker and
+    `max_interval`.
+    """
+
+    def __init__(
+        self,
+        store,
+        ttl=3600.0,
+        grace=10.0,
+        backoff=0.1,
+        max_interval=60.0,
+        clock=time.time,
+    ):
+        super(WaitStates, self).__init__()
+        self.store = store
+        self.ttl = ttl
+        self.grace = grace
+        self.backoff = backoff
+        self.max_interval = max_interval
+        self.clock = clock
+
+    @staticmethod
+    def from_environment():
+        table_name = getenv("WAIT_STATE_TABLE_NAME")
+        path = getenv("WAIT_STATE_FILE")
+        if table_name:
+            store = DynamoDBStore(table_name)
+        elif path:
+            store = FileStore(path)
+        else:
+            store = MemoryStore()
+        return WaitStates(
+            store,
+            ttl=float(getenv("REINVOKE_MAX_ELAPSED", "3300")) + 300,
+            backoff=float(getenv("WAIT_STATE_BACKOFF", "0.1")),
+            max_interval=float(getenv("REINVOKE_MAX_INTERVAL", "60")),
+        )
+
+    @staticmethod
+    def waiter(request):
+        return "{}/{}".format(
+            request.get("RequestId"), request.get("LogicalResourceId")
+        )
+
+    def watch(self, arn, waiter):
+        """
+        registers `waiter` on the certificate `arn`, and makes it the poller if there is none.
+        returns the state of the certificate.
+        """
+        now = self.clock()
+
+        def watch(state):
+            state = state if state else {"FirstSeen": now, "Waiters": {}}
+            # a waiter which did not check in for two intervals is gone
+            state["Waiters"] = {
+                w: seen
+                for w, seen in state["Waiters"].items()
+                if seen + 2 * self.max_interval + self.grace > now
+            }
+            state["Waiters"][waiter] = now
+            poller = state.get("Poller")
+            if (
+                not poller
+                or poller not in state["Waiters"]
+                or state.get("NextCheck", now) + self.grace < now
+            ):
+                state["Poller"] = waiter
+                state["NextCheck"] = now
+            return state
+
+        return self.store.update(arn, watch, self.ttl)
+
+    def record(self, arn, waiter, status, next_check=None):
+        """
+        records the `status` of the certificate `arn` checked by `waiter`, which checks again
+        at `next_check`.
+        """
+        now = self.clock()
+
+        def record(state):
+            state = state if state else {"FirstSeen": now, "Waiters": {}}
+            state["Waiters"][waiter] = now
+            state.update(
+                {
+                    "Poller": waiter,
+                    "LastStatus": status,
+                    "LastChecked": now,
+                    "NextCheck": next_check if next_check else now,
+                }
+            )
+            return state
+
+        return self.store.update(arn, record, self.ttl)
+
+    def leave(self, arn, waiter):
+        """
+        removes `waiter` from the certificate `arn`. The state is removed with the last waiter.
+        """
+
+        def leave(state):
+            if not state:
+                return None
+            state["Waiters"].pop(waiter, None)
+            if state.get("Poller") == waiter:
+                state.pop("Poller")
+            return state if state["Waiters"] else None
+
+        self.store.update(arn, leave, self.ttl)
+
+    def interval(self, state, interval):
+        """
+        returns the seconds until the next check by the poller, growing with the pending time
+        """
+        pending = self.clock() - state["FirstSeen"]
+        return min(self.max_interval, max(interval, self.backoff * pending))
+
+    def wait(self, state):
+        """
+        returns the seconds a waiter waits for the status of the next check by the poller
+        """
+        next_check = state.get("NextCheck", self.clock())
+        return min(self.max_interval, max(1.0, next_check - self.clock() + 1.0))
@@ -0,0 +1,54 @@
+from importlib import import_module
+
+import pytest
+
+import certificate_dns_record_provider
+import issued_certificate_provider
+from dispatcher import dispatcher
+from fake_aws import FakeAWS
+from provider import modules
+from scheduler import LambdaScheduler
+from wait_state import MemoryStore, WaitStates
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """
+    the fake AWS, installed in the client pools. The caches, the re-invoker and the wait
+    states of the providers run on its virtual clock, and start empty.
+    """
+    result = FakeAWS()
+    clock = result.clock
+    for cache in [
+        certificate_dns_record_provider.certificate_cache,
+        issued_certificate_provider.status_cache,
+    ]:
+        monkeypatch.setattr(cache, "clock", clock)
+        monkeypatch.setattr(cache, "entries", {})
+    monkeypatch.setattr(
+        issued_certificate_provider,
+        "wait_states",
+        WaitStates(MemoryStore(clock), clock=clock),
+    )
+    reinvoker = certificate_dns_record_provider.reinvoker
+    monkeypatch.setattr(reinvoker, "clock", clock)
+    monkeypatch.setattr(reinvoker, "scheduler", LambdaScheduler(clock.sleep))
+    monkeypatch.setattr(dispatcher, "sleep", clock.sleep)
+    yield result.install()
+    result.uninstall()
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    """
+    the responses of all providers, recorded instead of sent to CloudFormation
+    """
+    result = []
+    for name in modules.values():
+        instance = import_module(name).provider
+        monkeypatch.setattr(
+            instance,
+            "send_response",
+            lambda instance=instance: result.append(dict(instance.response)),
+        )
+    return result
@@ -0,0 +1,430 @@
+"""
+An in-process fake of ACM, Lambda and Route53, installed in the client pools of `clients`.
+
+The fake keeps state: a requested certificate is pending validation, its DNS validation
+records appear after `record_delay` seconds, and it is issued `issue_delay` seconds later.
+Time is read from `clock`, which defaults to a `VirtualClock`. Throttling and failures can be
+injected per operation, and all calls are counted.
+"""
+
+import datetime
+import hashlib
+import random
+import uuid
+from collections import Counter, defaultdict, deque
+
+from botocore.exceptions import ClientError
+
+
+class VirtualClock(object):
+    """
+    a clock which only advances when slept on
+    """
+
+    def __init__(self, now=1700000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(0.0, seconds)
+
+
+def client_error(code, operation, message=None):
+    return ClientError({"Error": {"Code": code, "Message": message or code}}, operation)
+
+
+def tag(key, value):
+    return {"Key": key, "Value": value} if value is not None else {"Key": key}
+
+
+class Meta(object):
+    def __init__(self, region_name, operations):
+        self.region_name = region_name
+        self.method_to_api_mapping = {
+            name: "".join(part.title() for part in name.split("_"))
+            for name in operations
+        }
+
+
+class FakeCertificate(object):
+    def __init__(self, arn, arguments, created, record_delay, issue_delay):
+        self.arn = arn
+        self.arguments = arguments
+        self.domain_name = arguments["DomainName"]
+        self.names = [self.domain_name] + [
+            name
+            for name in arguments.get("SubjectAlternativeNames", [])
+            if name != self.domain_name
+        ]
+        self.created = created
+        self.record_delay = record_delay
+        self.issue_delay = issue_delay
+        self.validated = None
+        self.fixed_status = None
+        self.not_after = datetime.datetime.fromtimestamp(
+            created + 395 * 86400, datetime.timezone.utc
+        )
+        self.tags = {t["Key"]: t.get("Value") for t in arguments.get("Tags", [])}
+        self.options = arguments.get("Options", {})
+        self.validation_method = arguments.get("ValidationMethod", "DNS")
+
+    def resource_record(self, name):
+        base = name[2:] if name.startswith("*.") else name
+        digest = hashlib.sha256((self.arn + base).encode("utf-8")).hexdigest()
+        return {
+            "Name": "_{}.{}.".format(digest[:32], base),
+            "Type": "CNAME",
+            "Value": "_{}.acm-validations.aws.".format(digest[32:]),
+        }
+
+    def status(self, now):
+        if self.fixed_status:
+            return self.fixed_status
+        if self.validated is not None and now >= self.validated + self.issue_delay:
+            return "ISSUED"
+        return "PENDING_VALIDATION"
+
+    def describe(self, now):
+        status = self.status(now)
+        options = []
+        for name in self.names:
+            option = {
+                "DomainName": name,
+                "ValidationDomain": name,
+                "ValidationMethod": self.validation_method,
+                "ValidationStatus": "SUCCESS" if status == "ISSUED" else status,
+            }
+            if (
+                self.validation_method == "DNS"
+                and now >= self.created + self.record_delay
+            ):
+                option["ResourceRecord"] = self.resource_record(name)
+            options.append(option)
+        return {
+            "CertificateArn": self.arn,
+            "DomainName": self.domain_name,
+            "SubjectAlternativeNames": list(self.names),
+            "Status": status,
+            "Type": "AMAZON_ISSUED",
+            "KeyAlgorithm": self.arguments.get("KeyAlgorithm", "RSA_2048"),
+            "DomainValidationOptions": options,
+            "Options": self.options,
+        }
+
+    def summary(self, now):
+        return {
+            "CertificateArn": self.arn,
+            "DomainName": self.domain_name,
+            "SubjectAlternativeNameSummaries": list(self.names),
+            "HasAdditionalSubjectAlternativeNames": False,
+            "Status": self.status(now),
+            "Type": "AMAZON_ISSUED",
+            "KeyAlgorithm": self.arguments.get("KeyAlgorithm", "RSA_2048"),
+            "NotAfter": self.not_after,
+        }
+
+
+class FakeClient(object):
+    service_name = None
+    operations = []
+
+    def __init__(self, aws, region_name):
+        self.aws = aws
+        self.region_name = region_name or aws.default_region
+        self.meta = Meta(self.region_name, self.operations)
+
+    def call(self, operation):
+        """
+        counts the call to `operation`, and raises the injected throttling and failures
+        """
+        self.aws.call(self.service_name, self.region_name, operation)
+
+
+class FakeACM(FakeClient):
+    service_name = "acm"
+    operations = [
+        "request_certificate",
+        "describe_certificate",
+        "list_certificates",
+        "update_certificate_options",
+        "add_tags_to_certificate",
+        "remove_tags_from_certificate",
+        "list_tags_for_certificate",
+        "delete_certificate",
+    ]
+
+    def certificate(self, arn, operation):
+        certificate = self.aws.certificates.get(arn)
+        if not certificate:
+            raise client_error(
+                "ResourceNotFoundException", operation, "{} not found".format(arn)
+            )
+        return certificate
+
+    def request_certificate(self, **kwargs):
+        self.call("request_certificate")
+        token = kwargs.get("IdempotencyToken")
+        if token and (self.region_name, token) in self.aws.tokens:
+            return {"CertificateArn": self.aws.tokens[(self.region_name, token)]}
+
+        arn = self.aws.add_certificate(region_name=self.region_name, **kwargs)
+        if token:
+            self.aws.tokens[(self.region_name, token)] = arn
+        return {"CertificateArn": arn}
+
+    def describe_certificate(self, CertificateArn):
+        self.call("describe_certificate")
+        certificate = self.certificate(CertificateArn, "DescribeCertificate")
+        return {"Certificate": certificate.describe(self.aws.clock())}
+
+    def list_certificates(
+        self, CertificateStatuses=None, Includes=None, NextToken=None, MaxItems=None
+    ):
+        self.call("list_certificates")
+        now = self.aws.clock()
+        summaries = [
+            c.summary(now)
+            for c in self.aws.certificates.values()
+            if c.arn.split(":")[3] == self.region_name
+        ]
+        if CertificateStatuses:
+            summaries = [s for s in summaries if s["Status"] in CertificateStatuses]
+        start = int(NextToken) if NextToken else 0
+        MaxItems = MaxItems or self.aws.page_size
+        result = {"CertificateSummaryList": summaries[start : start + MaxItems]}
+        if start + MaxItems < len(summaries):
+            result["NextToken"] = str(start + MaxItems)
+        return result
+
+    def update_certificate_options(self, CertificateArn, Options):
+        self.call("update_certificate_options")
+        self.certificate(CertificateArn, "UpdateCertificateOptions").options = Options
+
+    def add_tags_to_certificate(self, CertificateArn, Tags):
+        self.call("add_tags_to_certificate")
+        certificate = self.certificate(CertificateArn, "AddTagsToCertificate")
+        certificate.tags.update({t["Key"]: t.get("Value") for t in Tags})
+
+    def remove_tags_from_certificate(self, CertificateArn, Tags):
+        self.call("remove_tags_from_certificate")
+        certificate = self.certificate(CertificateArn, "RemoveTagsFromCertificate")
+        for t in Tags:
+            certificate.tags.pop(t["Key"], None)
+
+    def list_tags_for_certificate(self, CertificateArn):
+        self.call("list_tags_for_certificate")
+        certificate = self.certificate(CertificateArn, "ListTagsForCertificate")
+        return {"Tags": [tag(k, v) for k, v in certificate.tags.items()]}
+
+    def delete_certificate(self, CertificateArn):
+        self.call("delete_certificate")
+        self.certificate(CertificateArn, "DeleteCertificate")
+        del self.aws.certificates[CertificateArn]
+
+
+class FakeLambda(FakeClient):
+    service_name = "lambda"
+    operations = ["invoke"]
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.call("invoke")
+        if isinstance(Payload, bytes):
+            Payload = Payload.decode("utf-8")
+        self.aws.invocations.append(Payload)
+        return {"StatusCode": 202}
+
+
+class FakeRoute53(FakeClient):
+    """
+    changes are in sync `change_delay` seconds after they were made. Writing the validation
+    records of a certificate validates it.
+    """
+
+    service_name = "route53"
+    operations = ["change_resource_record_sets", "get_change"]
+
+    def change_resource_record_sets(self, HostedZoneId, ChangeBatch):
+        self.call("change_resource_record_sets")
+        now = self.aws.clock()
+        for change in ChangeBatch["Changes"]:
+            record_set = change["ResourceRecordSet"]
+            self.aws.records[(HostedZoneId, record_set["Name"])] = record_set
+        self.aws.validate(set(self.aws.records.keys()), now)
+        change_id = "/change/C{}".format(len(self.aws.changes) + 1)
+        self.aws.changes[change_id] = now
+        return {"ChangeInfo": {"Id": change_id, "Status": "PENDING"}}
+
+    def get_change(self, Id):
+        self.call("get_change")
+        insync = self.aws.clock() >= self.aws.changes[Id] + self.aws.change_delay
+        return {"ChangeInfo": {"Id": Id, "Status": "INSYNC" if insync else "PENDING"}}
+
+
+fake_classes = {"acm": FakeACM, "lambda": FakeLambda, "route53": FakeRoute53}
+
+
+class FakeAWS(object):
+    """
+    the shared state of the fake clients.
+
+    `throttle_limit` is the number of calls per second per region and operation after which
+    ThrottlingException is raised, for the services in `throttled_services`. `failure_rate`
+    is the fraction of calls failing with InternalFailure. Use `fail_next` to fail specific
+    calls. `page_size` is the number of certificates listed per page.
+    """
+
+    def __init__(
+        self,
+        clock=None,
+        record_delay=0.0,
+        issue_delay=60.0,
+        change_delay=0.0,
+        require_validation_records=False,
+        throttle_limit=None,
+        throttled_services=("acm",),
+        failure_rate=0.0,
+        seed=0,
+        account_id="111111111111",
+        default_region="eu-central-1",
+        page_size=100,
+    ):
+        super(FakeAWS, self).__init__()
+        self.clock = clock if clock else VirtualClock()
+        self.record_delay = record_delay
+        self.issue_delay = issue_delay
+        self.change_delay = change_delay
+        self.require_validation_records = require_validation_records
+        self.throttle_limit = throttle_limit
+        self.throttled_services = throttled_services
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.account_id = account_id
+        self.default_region = default_region
+        self.page_size = page_size
+        self.certificates = {}
+        self.tokens = {}
+        self.records = {}
+        self.changes = {}
+        self.invocations = deque()
+        self.failures = defaultdict(deque)
+        self.calls = Counter()
+        self.throttles = Counter()
+        self.calls_per_second = Counter()
+        self.original_create = None
+
+    def fail_next(self, operation, code="InternalFailure", count=1, region_name=None):
+        """
+        fails the next `count` calls to `operation`, e.g. "acm.describe_certificate", in
+        `region_name` or in any region.
+        """
+        self.failures[(region_name, operation)].extend([code] * count)
+
+    def call(self, service_name, region_name, operation):
+        name = "{}.{}".format(service_name, operation)
+        self.calls[name] += 1
+        second = int(self.clock())
+        self.calls_per_second[(service_name, second)] += 1
+
+        for key in [(region_name, name), (None, name)]:
+            if self.failures[key]:
+                code = self.failures[key].popleft()
+                raise client_error(
+                    code, operation, "{} in {}".format(code, region_name)
+                )
+
+        if self.throttle_limit is not None and service_name in self.throttled_services:
+            key = (second, region_name, name)
+            self.throttles[key] += 1
+            if self.throttles[key] > self.throttle_limit:
+                self.calls[name + ".throttled"] += 1
+                raise client_error("ThrottlingException", operation, "Rate exceeded")
+
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise client_error("InternalFailure", operation)
+
+    def add_certificate(
+        self, region_name=None, arn=None, status=None, not_after=None, **arguments
+    ):
+        """
+        adds a certificate requested with `arguments`, returning its ARN. With `status`,
+        the certificate keeps that status, and with `not_after` it expires at that datetime.
+        """
+        arn = arn or "arn:aws:acm:{}:{}:certificate/{}".format(
+            region_name or self.default_region,
+            self.account_id,
+            uuid.UUID(int=self.random.getrandbits(128)),
+        )
+        certificate = FakeCertificate(
+            arn, arguments, self.clock(), self.record_delay, self.issue_delay
+        )
+        if not self.require_validation_records:
+            certificate.validated = certificate.created + self.record_delay
+        certificate.fixed_status = status
+        if not_after:
+            certificate.not_after = not_after
+        self.certificates[arn] = certificate
+        return arn
+
+    def reset(self):
+        """
+        removes all certificates, records and invocations, and clears the counted calls
+        """
+        for state in [
+            self.certificates,
+            self.tokens,
+            self.records,
+            self.changes,
+            self.invocations,
+            self.failures,
+            self.calls,
+            self.throttles,
+            self.calls_per_second,
+        ]:
+            state.clear()
+
+    def validate(self, record_names, now):
+        """
+        validates the pending certificates of which all validation records are written
+        """
+        written = set(name for _, name in record_names)
+        for certificate in self.certificates.values():
+            if certificate.validated is None and all(
+                certificate.resource_record(name)["Name"] in written
+                for name in certificate.names
+            ):
+                certificate.validated = now
+
+    def client(self, service_name, region_name):
+        return fake_classes[service_name](self, region_name)
+
+    def install(self, throttled=False):
+        """
+        replaces the clients created by `clients.ClientPool` with fakes. With `throttled`, the
+        clients are wrapped in the ThrottledClient of the pool, if any.
+        """
+        # imported here, so that the virtual clock can be installed before the providers are
+        import clients
+        from throttling import ThrottledClient
+
+        aws = self
+        self.original_create = clients.ClientPool.create
+
+        def create(pool, region_name):
+            client = aws.client(pool.service_name, region_name)
+            if throttled and pool.caller:
+                return ThrottledClient(client, pool.caller, region_name)
+            return client
+
+        clients.ClientPool.create = create
+        for pool in (clients.acm_pool, clients.lambda_pool, clients.route53_pool):
+            pool.clear()
+        return self
+
+    def uninstall(self):
+        import clients
+
+        clients.ClientPool.create = self.original_create
+        for pool in (clients.acm_pool, clients.lambda_pool, clients.route53_pool):
+            pool.clear()
@@ -0,0 +1,178 @@
+import json
+import uuid
+
+import pytest
+import requests
+
+import clients
+from budget import ExecutionBudget
+from provider import handler
+from responder import Responder
+from scheduler import LambdaScheduler
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Context(object):
+    """
+    simulated Lambda context, which times out `timeout` seconds after creation
+    """
+
+    def __init__(self, clock, timeout):
+        self.clock = clock
+        self.deadline = clock() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - self.clock()) * 1000)
+
+
+class Provider(object):
+    def __init__(self, budget):
+        self.budget = budget
+        self.payloads = []
+
+    def invoke_lambda(self, payload):
+        self.payloads.append(payload)
+
+
+def test_budget_from_context(monkeypatch):
+    monkeypatch.setenv("DEADLINE_RESERVE", "10")
+    monkeypatch.setenv("HANDOFF_THRESHOLD", "30")
+    clock = Clock()
+    budget = ExecutionBudget.from_context(Context(clock, 60), clock)
+    assert budget.time_left() == 60
+    assert budget.remaining() == 50
+    assert budget.bound(15) == 15
+    assert not budget.is_low()
+
+    clock.now += 25
+    assert budget.remaining() == 25
+    assert budget.is_low()
+
+    clock.now += 30
+    assert budget.remaining() == 0
+    assert budget.bound(15) == 0
+
+
+def test_budget_without_context_is_unbounded():
+    budget = ExecutionBudget.from_context(None)
+    assert budget.remaining() is None
+    assert budget.bound(15) == 15
+    assert not budget.is_low()
+    assert str(budget) == "unbounded"
+
+
+def test_poll_deadline_reserve_is_still_read(monkeypatch):
+    monkeypatch.delenv("DEADLINE_RESERVE", raising=False)
+    monkeypatch.setenv("POLL_DEADLINE_RESERVE", "20")
+    clock = Clock()
+    assert ExecutionBudget.from_context(Context(clock, 60), clock).remaining() == 40
+
+
+def test_scheduler_sleep_is_bounded():
+    clock = Clock()
+    provider = Provider(ExecutionBudget(deadline=30, reserve=10, clock=clock))
+    LambdaScheduler(clock.sleep).schedule(provider, b"{}", 60)
+    assert clock.sleeps == [20]
+    assert provider.payloads == [b"{}"]
+
+
+class Session(object):
+    """
+    local stand-in for a requests session, which fails every put after `duration` seconds
+    """
+
+    def __init__(self, clock, duration):
+        self.clock = clock
+        self.duration = duration
+        self.timeouts = []
+
+    def put(self, url, data, headers, timeout):
+        self.timeouts.append(timeout)
+        self.clock.now += self.duration
+        raise requests.ConnectionError("connection refused")
+
+
+def test_response_retries_stop_when_budget_runs_out():
+    clock = Clock()
+    session = Session(clock, 1)
+    responder = Responder(
+        max_attempts=10,
+        session=session,
+        sleep=clock.sleep,
+        random=lambda low, high: high,
+    )
+    budget = ExecutionBudget(deadline=20, reserve=10, clock=clock)
+    with pytest.raises(requests.ConnectionError):
+        responder.send("https://localhost/response", {}, budget)
+    assert len(session.timeouts) < 10
+    assert clock.now <= 20
+    assert all(timeout <= 10 for timeout in session.timeouts)
+
+
+def request(certificate_arn):
+    return {
+        "RequestType": "Create",
+        "ResponseURL": "https://localhost/response",
+        "StackId": "arn:aws:cloudformation:eu-central-1:111111111111:stack/s/guid",
+        "RequestId": "request-%s" % uuid.uuid4(),
+        "ResourceType": "Custom::IssuedCertificate",
+        "LogicalResourceId": "Issued",
+        "ResourceProperties": {
+            "CertificateArn": certificate_arn,
+            "ServiceToken": "arn:aws:lambda:eu-central-1:111111111111:function:f",
+        },
+    }
+
+
+def test_batch_is_handed_off_when_budget_is_low(aws, responses, monkeypatch):
+    monkeypatch.setenv("DEADLINE_RESERVE", "10")
+    monkeypatch.setenv("HANDOFF_THRESHOLD", "30")
+    arn = aws.add_certificate(DomainName="example.com")
+    batch = [request(arn) for _ in range(3)]
+
+    handler({"Requests": batch}, Context(aws.clock, 30))
+
+    assert aws.calls["acm.describe_certificate"] == 0
+    assert len(aws.invocations) == 1
+    handed_off = json.loads(aws.invocations.popleft())["Requests"]
+    assert [r["RequestId"] for r in handed_off] == [r["RequestId"] for r in batch]
+    assert all(r["ResourceProperties"]["Attempt"] == 2 for r in handed_off)
+    assert not responses
+
+
+def test_batch_is_handled_within_budget(aws, responses, monkeypatch):
+    monkeypatch.setenv("HANDOFF_THRESHOLD", "30")
+    arn = aws.add_certificate(DomainName="example.com")
+    handler({"Requests": [request(arn)]}, Context(aws.clock, 300))
+    assert aws.calls["acm.describe_certificate"] == 1
+
+
+def test_batch_prefetch_is_retried_within_budget(aws, responses, monkeypatch):
+    caller = clients.acm_pool.caller
+    monkeypatch.setattr(caller, "sleep", aws.clock.sleep)
+    # the budget of the previous invocation, which has run out
+    monkeypatch.setattr(
+        caller, "budget", ExecutionBudget(deadline=0, reserve=0, clock=aws.clock)
+    )
+    aws.uninstall()
+    aws.install(throttled=True)
+    arns = [
+        aws.add_certificate(status="ISSUED", DomainName="example.com") for _ in range(2)
+    ]
+    aws.fail_next("acm.list_certificates", "ThrottlingException")
+
+    handler({"Requests": [request(arn) for arn in arns]}, Context(aws.clock, 300))
+    assert aws.calls["acm.list_certificates"] == 2
+    assert [r["Status"] for r in responses] == ["SUCCESS", "SUCCESS"]
@@ -0,0 +1,100 @@
+import gc
+
+import pytest
+
+from certificate_dns_record_provider import Certificate, DomainValidationOption
+
+
+def certificate(count=100):
+    names = ["example.com"] + ["san-%d.example.com" % i for i in range(1, count)]
+    return Certificate(
+        {
+            "CertificateArn": "arn:aws:acm:eu-central-1:111111111111:certificate/1",
+            "Status": "PENDING_VALIDATION",
+            "DomainName": "example.com",
+            "DomainValidationOptions": [
+                {
+                    "DomainName": name,
+                    "ValidationMethod": "DNS",
+                    "ResourceRecord": {
+                        "Name": "_%s." % name,
+                        "Type": "CNAME",
+                        "Value": "_x.acm-validations.aws.",
+                    },
+                }
+                for name in names
+            ],
+        }
+    )
+
+
+def test_get_validation_option():
+    cert = certificate()
+    assert cert.get_validation_option("san-99.example.com").resource_record == {
+        "Name": "_san-99.example.com.",
+        "Type": "CNAME",
+        "Value": "_x.acm-validations.aws.",
+    }
+    assert cert.get_validation_option(None).domain_name == "example.com"
+    assert cert.get_validation_option("other.example.com") is None
+
+
+def test_get_validation_options():
+    cert = certificate()
+    options = cert.get_validation_options()
+    assert len(options) == 100
+    assert options["san-1.example.com"].validation_method == "DNS"
+
+    options = cert.get_validation_options(["example.com", "other.example.com"])
+    assert options["example.com"] is cert.get_validation_option("example.com")
+    assert options["other.example.com"] is None
+
+
+def test_validation_option_has_no_dict():
+    option = DomainValidationOption({"DomainName": "example.com"})
+    with pytest.raises(AttributeError):
+        option.unknown = 1
+
+
+def test_certificate_keeps_no_reference_to_response():
+    response = {
+        "CertificateArn": "arn:aws:acm:eu-central-1:111111111111:certificate/1",
+        "Status": "ISSUED",
+        "DomainName": "example.com",
+        "SubjectAlternativeNames": ["example.com", "www.example.com"],
+        "DomainValidationOptions": [],
+    }
+    cert = Certificate(response)
+    assert cert.subject_alternative_names == ("example.com", "www.example.com")
+    assert all(value is not response for value in gc.get_referents(cert))
+    with pytest.raises(AttributeError):
+        cert.certificate
+
+
+def test_shared_records_are_grouped_once():
+    record = {"Name": "_x1.example.com.", "Type": "CNAME", "Value": "_x2.acm."}
+    cert = Certificate(
+        {
+            "CertificateArn": "arn:aws:acm:eu-central-1:111111111111:certificate/1",
+            "Status": "PENDING_VALIDATION",
+            "DomainName": "example.com",
+            "SubjectAlternativeNames": [
+                "example.com",
+                "*.example.com",
+                "www.other.com",
+            ],
+            "DomainValidationOptions": [
+                {"DomainName": "example.com", "ResourceRecord": dict(record)},
+                {"DomainName": "*.example.com", "ResourceRecord": dict(record)},
+                {"DomainName": "www.other.com"},
+            ],
+        }
+    )
+    assert cert.resource_records == (record,)
+    assert cert.records_by_domain_name == {
+        "example.com": record,
+        "*.example.com": record,
+    }
+    shared = cert.get_validation_option("*.example.com").resource_record
+    assert shared is cert.get_validation_option("example.com").resource_record
+    assert shared is cert.resource_records[0]
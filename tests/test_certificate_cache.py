@@ -0,0 +1,54 @@
+from certificate_dns_record_provider import Certificate, CertificateCache
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def certificate(arn="arn:aws:acm:eu-central-1:111111111111:certificate/1"):
+    return Certificate(
+        {
+            "CertificateArn": arn,
+            "Status": "PENDING_VALIDATION",
+            "DomainName": "example.com",
+            "DomainValidationOptions": [],
+        }
+    )
+
+
+def test_hit_and_miss():
+    cache = CertificateCache(ttl=5, clock=Clock())
+    cert = certificate()
+    assert cache.get(cert.arn) is None
+    cache.put(cert)
+    assert cache.get(cert.arn) is cert
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_expiry():
+    clock = Clock()
+    cache = CertificateCache(ttl=5, clock=clock)
+    cert = certificate()
+    cache.put(cert)
+    clock.now = 4.9
+    assert cache.get(cert.arn) is cert
+    clock.now = 5.0
+    assert cache.get(cert.arn) is None
+    assert cert.arn not in cache.entries
+
+
+def test_invalidate():
+    cache = CertificateCache(ttl=5, clock=Clock())
+    one = certificate("arn:aws:acm:eu-central-1:111111111111:certificate/1")
+    two = certificate("arn:aws:acm:eu-central-1:111111111111:certificate/2")
+    cache.put(one)
+    cache.put(two)
+    cache.invalidate(one.arn)
+    assert cache.get(one.arn) is None
+    assert cache.get(two.arn) is two
+    cache.invalidate()
+    assert cache.get(two.arn) is None
@@ -0,0 +1,71 @@
+import uuid
+
+import pytest
+
+from certificate_dns_records_provider import provider
+from polling import PollingSchedule
+
+
+@pytest.fixture
+def poll(aws, monkeypatch):
+    def poll(**arguments):
+        arn = aws.add_certificate(**arguments)
+        monkeypatch.setattr(
+            provider,
+            "create_polling_schedule",
+            lambda: PollingSchedule(sleep=aws.clock.sleep, clock=aws.clock),
+        )
+        provider.set_request(Request(arn), {})
+        provider.create()
+        return aws.certificates[arn]
+
+    return poll
+
+
+def test_waits_for_all_records_and_deduplicates(aws, poll):
+    # the records appear after a few probes
+    aws.record_delay = 5
+    certificate = poll(
+        DomainName="example.com",
+        SubjectAlternativeNames=["*.example.com", "www.example.com"],
+    )
+    assert provider.status == "SUCCESS", provider.reason
+    assert aws.calls["acm.describe_certificate"] > 1
+    assert provider.physical_resource_id == provider.certificate_arn
+
+    # the apex and wildcard domain share a validation record
+    apex = certificate.resource_record("example.com")
+    www = certificate.resource_record("www.example.com")
+    assert provider.response["Data"] == {
+        "Count": 2,
+        "Name.0": apex["Name"],
+        "Type.0": "CNAME",
+        "Value.0": apex["Value"],
+        "Name.1": www["Name"],
+        "Type.1": "CNAME",
+        "Value.1": www["Value"],
+    }
+
+
+def test_fails_on_email_validation(poll):
+    poll(DomainName="example.com", ValidationMethod="EMAIL")
+    assert provider.status == "FAILED"
+    assert (
+        provider.reason
+        == "domain example.com is using validation method EMAIL, not DNS"
+    )
+
+
+class Request(dict):
+    def __init__(self, certificate_arn):
+        self.update(
+            {
+                "RequestType": "Create",
+                "ResponseURL": "https://httpbin.org/put",
+                "StackId": "arn:aws:cloudformation:us-west-2:EXAMPLE/stack-name/guid",
+                "RequestId": "request-%s" % uuid.uuid4(),
+                "ResourceType": "Custom::CertificateDNSRecords",
+                "LogicalResourceId": "Records",
+                "ResourceProperties": {"CertificateArn": certificate_arn},
+            }
+        )
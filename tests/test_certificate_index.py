@@ -0,0 +1,148 @@
+import datetime
+import uuid
+
+import pytest
+
+import certificate_provider
+from certificate_index import CertificateIndex
+
+
+@pytest.fixture
+def aws(aws):
+    # small pages, to list the certificates in several
+    aws.page_size = 2
+    return aws
+
+
+def add(aws, domain_name, names, status="ISSUED", days=90, **kwargs):
+    return aws.add_certificate(
+        status=status,
+        not_after=datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        + datetime.timedelta(days=days),
+        DomainName=domain_name,
+        SubjectAlternativeNames=names,
+        **kwargs
+    )
+
+
+def test_find_by_normalized_names(aws):
+    expected = add(aws, "example.com", ["example.com", "*.example.com"])
+    add(aws, "example.com", ["example.com"])
+    add(
+        aws,
+        "example.com",
+        ["example.com", "*.example.com"],
+        status="PENDING_VALIDATION",
+    )
+    add(
+        aws,
+        "example.com",
+        ["example.com", "*.example.com"],
+        KeyAlgorithm="EC_prime256v1",
+    )
+    index = CertificateIndex()
+    assert (
+        index.find("eu-central-1", "Example.com.", ["*.example.com", "EXAMPLE.com"])
+        == expected
+    )
+    assert index.find("eu-central-1", "example.com", ["other.example.com"]) is None
+    assert aws.calls == {"acm.list_certificates": 2}
+
+
+def test_latest_expiring_certificate_is_used(aws):
+    add(aws, "example.com", ["example.com"], days=10)
+    expected = add(aws, "example.com", ["example.com"], days=300)
+    add(aws, "example.com", ["example.com"], days=30)
+    assert CertificateIndex().find("eu-central-1", "example.com") == expected
+
+
+def test_index_is_rebuilt_after_ttl(aws):
+    index = CertificateIndex(ttl=60, clock=aws.clock)
+    assert index.find("eu-central-1", "example.com") is None
+
+    expected = add(aws, "example.com", ["example.com"])
+    aws.clock.sleep(59)
+    assert index.find("eu-central-1", "example.com") is None
+    aws.clock.sleep(2)
+    assert index.find("eu-central-1", "example.com") == expected
+    assert aws.calls == {"acm.list_certificates": 2}
+
+
+def test_provider_reuses_issued_certificate(aws, responses, monkeypatch):
+    monkeypatch.setattr(certificate_provider, "certificate_index", CertificateIndex())
+    provider = certificate_provider.provider
+    expected = add(aws, "example.com", ["example.com"])
+
+    provider.set_request(Request("Create"), {})
+    provider.execute()
+    assert provider.response["Status"] == "SUCCESS", provider.response["Reason"]
+    assert provider.physical_resource_id == expected
+
+    provider.set_request(Request("Delete", expected), {})
+    provider.execute()
+    assert provider.response["Status"] == "SUCCESS", provider.response["Reason"]
+    assert expected in aws.certificates
+    assert aws.calls == {
+        "acm.list_certificates": 1,
+        "acm.list_tags_for_certificate": 1,
+    }
+
+
+def test_provider_requests_certificate_without_match(aws, responses, monkeypatch):
+    monkeypatch.setattr(certificate_provider, "certificate_index", CertificateIndex())
+    provider = certificate_provider.provider
+    add(aws, "example.com", ["example.com", "www.example.com"])
+
+    provider.set_request(Request("Create"), {})
+    provider.execute()
+    arn = provider.physical_resource_id
+    assert aws.calls == {"acm.list_certificates": 1, "acm.request_certificate": 1}
+    assert aws.certificates[arn].tags == {
+        "cfn-certificate-provider:requested-by": "EXAMPLE/stack-name/guid/Certificate"
+    }
+
+    # the requested certificate is not shared, and is deleted with the resource
+    provider.set_request(Request("Delete", arn), {})
+    provider.execute()
+    assert provider.response["Status"] == "SUCCESS", provider.response["Reason"]
+    assert arn not in aws.certificates
+    assert aws.calls["acm.list_tags_for_certificate"] == 1
+
+
+def test_certificate_is_kept_when_tags_cannot_be_listed(aws, responses, monkeypatch):
+    monkeypatch.setattr(certificate_provider, "certificate_index", CertificateIndex())
+    provider = certificate_provider.provider
+    provider.set_request(Request("Create"), {})
+    provider.execute()
+    arn = provider.physical_resource_id
+
+    aws.fail_next("acm.list_tags_for_certificate", "ThrottlingException")
+    provider.set_request(Request("Delete", arn), {})
+    provider.execute()
+    assert provider.response["Status"] == "SUCCESS", provider.response["Reason"]
+    assert provider.reason.startswith("Ignore failure to delete certificates")
+    assert "ThrottlingException" in provider.reason
+    assert arn in aws.certificates
+    assert not aws.calls["acm.delete_certificate"]
+
+
+class Request(dict):
+    def __init__(self, request_type, physical_resource_id=None):
+        self.update(
+            {
+                "RequestType": request_type,
+                "ResponseURL": "https://httpbin.org/put",
+                "StackId": "arn:aws:cloudformation:us-west-2:EXAMPLE/stack-name/guid",
+                "RequestId": "request-%s" % uuid.uuid4(),
+                "ResourceType": "Custom::Certificate",
+                "LogicalResourceId": "Certificate",
+                "ResourceProperties": {
+                    "DomainName": "example.com",
+                    "ValidationMethod": "DNS",
+                    "Region": "eu-central-1",
+                    "ReuseExisting": "true",
+                },
+            }
+        )
+        if physical_resource_id:
+            self["PhysicalResourceId"] = physical_resource_id
@@ -0,0 +1,135 @@
+import uuid
+
+from botocore.exceptions import EndpointConnectionError
+
+import clients
+from certificate_provider import provider
+
+REGIONS = ["us-east-1", "eu-west-1", "eu-central-1"]
+
+
+def handle(request):
+    provider.set_request(request, {})
+    provider.execute()
+    return provider.response
+
+
+def test_create_in_all_regions(aws, responses):
+    response = handle(Request("Create"))
+    assert response["Status"] == "SUCCESS", response["Reason"]
+
+    arns = response["PhysicalResourceId"].split(",")
+    assert [arn.split(":")[3] for arn in arns] == REGIONS
+    assert response["Data"] == dict(zip(REGIONS, arns))
+    assert sorted(aws.certificates.keys()) == sorted(arns)
+    assert "Regions" not in aws.certificates[arns[0]].arguments
+    assert aws.certificates[arns[0]].arguments["IdempotencyToken"] == "Certificate"
+
+
+def test_partial_failure_is_rolled_back(aws, responses):
+    aws.fail_next(
+        "acm.request_certificate", "ValidationException", region_name="eu-west-1"
+    )
+    response = handle(Request("Create"))
+    assert response["Status"] == "FAILED"
+    assert "eu-west-1" in response["Reason"]
+    assert response["PhysicalResourceId"] == "failed-to-create"
+    assert aws.certificates == {}
+
+
+def test_update_options_in_all_regions(aws, responses):
+    arns = handle(Request("Create"))["PhysicalResourceId"]
+
+    request = Request("Update", arns)
+    request["ResourceProperties"]["Options"] = {
+        "CertificateTransparencyLoggingPreference": "DISABLED"
+    }
+    response = handle(request)
+    assert response["Status"] == "SUCCESS", response["Reason"]
+    assert response["PhysicalResourceId"] == arns
+    assert response["Data"]["us-east-1"] == arns.split(",")[0]
+    assert all(
+        c.options["CertificateTransparencyLoggingPreference"] == "DISABLED"
+        for c in aws.certificates.values()
+    )
+
+
+def test_changed_regions_are_requested_again(aws, responses):
+    arns = handle(Request("Create"))["PhysicalResourceId"]
+
+    request = Request("Update", arns)
+    request["ResourceProperties"]["Regions"] = ["us-east-1", "ap-southeast-2"]
+    response = handle(request)
+    assert response["Status"] == "SUCCESS", response["Reason"]
+    assert response["PhysicalResourceId"] != arns
+    assert sorted(response["Data"].keys()) == ["ap-southeast-2", "us-east-1"]
+    # the certificate in the unchanged region is replaced too
+    assert response["Data"]["us-east-1"] not in arns.split(",")
+
+    # deleting the replaced certificates keeps the new ones
+    new_arns = response["PhysicalResourceId"]
+    response = handle(Request("Delete", arns))
+    assert response["Status"] == "SUCCESS", response["Reason"]
+    assert sorted(aws.certificates.keys()) == sorted(new_arns.split(","))
+
+
+def test_delete_in_all_regions(aws, responses):
+    arns = handle(Request("Create"))["PhysicalResourceId"]
+    response = handle(Request("Delete", arns))
+    assert response["Status"] == "SUCCESS", response["Reason"]
+    assert aws.certificates == {}
+
+
+def test_connection_failure_is_rolled_back(aws, responses, monkeypatch):
+    def request_certificate(**kwargs):
+        raise EndpointConnectionError(
+            endpoint_url="https://acm.eu-west-1.amazonaws.com"
+        )
+
+    monkeypatch.setattr(
+        clients.acm("eu-west-1"), "request_certificate", request_certificate
+    )
+    response = handle(Request("Create"))
+    assert response["Status"] == "FAILED"
+    assert "acm.eu-west-1" in response["Reason"]
+    assert aws.certificates == {}
+
+
+def test_delete_in_a_single_region(aws, responses):
+    request = Request("Create")
+    request["ResourceProperties"]["Regions"] = ["us-east-1"]
+    arn = handle(request)["PhysicalResourceId"]
+    assert arn.startswith("arn:aws:acm:us-east-1:")
+
+    request = Request("Delete", arn)
+    request["ResourceProperties"]["Regions"] = ["us-east-1"]
+    response = handle(request)
+    assert response["Status"] == "SUCCESS", response["Reason"]
+    assert aws.certificates == {}
+
+
+class Request(dict):
+    def __init__(self, request_type, physical_resource_id=None):
+        self.update(
+            {
+                "RequestType": request_type,
+                "ResponseURL": "https://httpbin.org/put",
+                "StackId": "arn:aws:cloudformation:us-west-2:EXAMPLE/stack-name/guid",
+                "RequestId": "request-%s" % uuid.uuid4(),
+                "ResourceType": "Custom::Certificate",
+                "LogicalResourceId": "Certificate",
+                "ResourceProperties": {
+                    "DomainName": "example.com",
+                    "ValidationMethod": "DNS",
+                    "Regions": list(REGIONS),
+                },
+            }
+        )
+        if physical_resource_id:
+            self["PhysicalResourceId"] = physical_resource_id
+        if request_type == "Update":
+            self["OldResourceProperties"] = {
+                "DomainName": "example.com",
+                "ValidationMethod": "DNS",
+                "Regions": list(REGIONS),
+            }
@@ -0,0 +1,110 @@
+import uuid
+
+from certificate_provider import normalize, provider
+
+ARN = "arn:aws:acm:eu-central-1:111111111111:certificate/%s" % uuid.uuid4()
+
+
+def update(aws, old, new):
+    request = Request(old, new)
+    aws.add_certificate(arn=ARN, **request["OldResourceProperties"])
+    provider.set_request(request, {})
+    provider.execute()
+    return provider.response
+
+
+def test_normalize():
+    assert normalize({"DomainName": "Example.COM."}, "DomainName") == "example.com"
+    assert normalize(
+        {"DomainName": "example.com", "SubjectAlternativeNames": ["B.example.com."]},
+        "SubjectAlternativeNames",
+    ) == {"example.com", "b.example.com"}
+    assert normalize({"Tags": [{"Key": "a", "Value": "1"}]}, "Tags") == {"a": "1"}
+
+
+def test_reordered_names_are_not_reissued(aws, responses):
+    response = update(
+        aws,
+        {"SubjectAlternativeNames": ["a.example.com", "b.example.com"]},
+        {
+            "DomainName": "Example.com.",
+            "SubjectAlternativeNames": [
+                "B.example.com",
+                "a.example.com.",
+                "example.com",
+            ],
+        },
+    )
+    assert response["Status"] == "SUCCESS", response["Reason"]
+    assert response["PhysicalResourceId"] == ARN
+    assert not aws.calls
+
+
+def test_changed_names_are_reissued(aws, responses):
+    response = update(
+        aws,
+        {"SubjectAlternativeNames": ["a.example.com"]},
+        {"SubjectAlternativeNames": ["a.example.com", "c.example.com"]},
+    )
+    assert response["Status"] == "SUCCESS", response["Reason"]
+    assert response["PhysicalResourceId"] not in [ARN, "could-not-create"]
+    assert response["PhysicalResourceId"] in aws.certificates
+    assert aws.calls == {"acm.request_certificate": 1}
+
+
+def test_tags_and_options_are_updated_in_place(aws, responses):
+    response = update(
+        aws,
+        {"Tags": [{"Key": "a", "Value": "1"}, {"Key": "b", "Value": "2"}]},
+        {
+            "Tags": [{"Key": "c", "Value": "3"}, {"Key": "a", "Value": "1"}],
+            "Options": {"CertificateTransparencyLoggingPreference": "DISABLED"},
+        },
+    )
+    assert response["Status"] == "SUCCESS", response["Reason"]
+    assert response["PhysicalResourceId"] == ARN
+    assert aws.calls == {
+        "acm.update_certificate_options": 1,
+        "acm.add_tags_to_certificate": 1,
+        "acm.remove_tags_from_certificate": 1,
+    }
+    assert aws.certificates[ARN].tags == {"a": "1", "c": "3"}
+    assert aws.certificates[ARN].options == {
+        "CertificateTransparencyLoggingPreference": "DISABLED"
+    }
+
+
+def test_reuse_existing_is_changed_without_acm(aws, responses):
+    response = update(aws, {}, {"ReuseExisting": "true"})
+    assert response["Status"] == "SUCCESS", response["Reason"]
+    assert response["PhysicalResourceId"] == ARN
+    assert not aws.calls
+
+
+def test_other_changes_fail(aws, responses):
+    response = update(aws, {}, {"KeyAlgorithm": "EC_prime256v1"})
+    assert response["Status"] == "FAILED"
+    assert "KeyAlgorithm" in response["Reason"]
+    assert not aws.calls
+
+
+class Request(dict):
+    def __init__(self, old, new):
+        properties = {
+            "DomainName": "example.com",
+            "ValidationMethod": "DNS",
+            "Region": "eu-central-1",
+        }
+        self.update(
+            {
+                "RequestType": "Update",
+                "ResponseURL": "https://httpbin.org/put",
+                "StackId": "arn:aws:cloudformation:us-west-2:EXAMPLE/stack-name/guid",
+                "RequestId": "request-%s" % uuid.uuid4(),
+                "ResourceType": "Custom::Certificate",
+                "LogicalResourceId": "Certificate",
+                "PhysicalResourceId": ARN,
+                "ResourceProperties": dict(properties, **new),
+                "OldResourceProperties": dict(properties, **old),
+            }
+        )
@@ -0,0 +1,70 @@
+import json
+import uuid
+
+from certificate_status_batch import CertificateStatusBatch
+from provider import handler
+
+
+def test_resolve_per_region(aws):
+    aws.page_size = 2
+    issued = aws.add_certificate(status="ISSUED", DomainName="example.com")
+    pending = aws.add_certificate(status="PENDING_VALIDATION", DomainName="example.com")
+    failed = aws.add_certificate(status="FAILED", DomainName="example.com")
+    other = aws.add_certificate(
+        region_name="us-east-1", status="ISSUED", DomainName="example.com"
+    )
+
+    result = CertificateStatusBatch().resolve([issued, pending, failed, other])
+    assert {a: c.status for a, c in result.items()} == {
+        issued: "ISSUED",
+        pending: "PENDING_VALIDATION",
+        failed: "FAILED",
+        other: "ISSUED",
+    }
+    # one page in each region, and the failed certificate described
+    assert aws.calls == {"acm.list_certificates": 2, "acm.describe_certificate": 1}
+
+
+def test_sqs_batch_is_checked_with_one_list(aws, responses):
+    aws.page_size = 2
+    arns = [
+        aws.add_certificate(status="ISSUED", DomainName="example.com") for _ in range(5)
+    ]
+
+    result = handler(
+        {"Records": [{"body": Request(a).json()} for a in arns]},
+        {},
+    )
+    # a single walk over the three pages, instead of a describe per certificate
+    assert aws.calls == {"acm.list_certificates": 3}
+    assert [r["PhysicalResourceId"] for r in result] == arns
+    assert [r["Status"] for r in responses] == ["SUCCESS"] * 5
+
+
+def test_failed_batch_falls_back_to_describe(aws, responses):
+    arns = [
+        aws.add_certificate(status="ISSUED", DomainName="example.com") for _ in range(2)
+    ]
+    aws.fail_next("acm.list_certificates", "AccessDeniedException")
+
+    handler({"Requests": [Request(a) for a in arns]}, {})
+    assert aws.calls == {"acm.list_certificates": 1, "acm.describe_certificate": 2}
+    assert [r["Status"] for r in responses] == ["SUCCESS"] * 2
+
+
+class Request(dict):
+    def __init__(self, certificate_arn):
+        self.update(
+            {
+                "RequestType": "Create",
+                "ResponseURL": "https://httpbin.org/put",
+                "StackId": "arn:aws:cloudformation:us-west-2:EXAMPLE/stack-name/guid",
+                "RequestId": "request-%s" % uuid.uuid4(),
+                "ResourceType": "Custom::IssuedCertificate",
+                "LogicalResourceId": "Record",
+                "ResourceProperties": {"CertificateArn": certificate_arn},
+            }
+        )
+
+    def json(self):
+        return json.dumps(self)
@@ -0,0 +1,29 @@
+import clients
+from clients import ClientPool, config_from_environment
+
+
+def test_client_is_reused_per_region():
+    pool = ClientPool("acm")
+    client = pool.get("eu-west-1")
+    assert pool.get("eu-west-1") is client
+    assert pool.get("us-east-1") is not client
+    assert client.meta.region_name == "eu-west-1"
+
+    pool.clear()
+    assert pool.get("eu-west-1") is not client
+
+
+def test_acm_uses_process_wide_pool():
+    assert clients.acm("eu-central-1") is clients.acm("eu-central-1")
+    assert clients.acm_pool.clients["eu-central-1"] is clients.acm("eu-central-1")
+
+
+def test_config_from_environment(monkeypatch):
+    monkeypatch.setenv("ACM_MAX_POOL_CONNECTIONS", "25")
+    monkeypatch.setenv("ACM_READ_TIMEOUT", "2.5")
+    monkeypatch.setenv("ACM_RETRY_MODE", "adaptive")
+    config = config_from_environment("ACM")
+    assert config.max_pool_connections == 25
+    assert config.read_timeout == 2.5
+    assert config.retries == {"max_attempts": 5, "mode": "adaptive"}
+    assert config_from_environment("ACM", max_attempts=1).retries["max_attempts"] == 1
@@ -0,0 +1,191 @@
+import json
+import uuid
+
+import pytest
+from botocore.exceptions import ClientError
+
+import certificate_dns_record_provider
+import provider
+from dedup import Deduplicator, DynamoDBStore, MemoryStore
+from issued_certificate_provider import provider as issued_certificate_provider
+from responder import responder
+from scheduler import SQSScheduler
+
+
+class DynamoDB(object):
+    """
+    local stand-in for a DynamoDB table, supporting the conditional put of the store
+    """
+
+    def __init__(self):
+        self.items = {}
+
+    def put_item(
+        self,
+        TableName,
+        Item,
+        ConditionExpression,
+        ExpressionAttributeNames,
+        ExpressionAttributeValues,
+    ):
+        key = Item["Key"]["S"]
+        existing = self.items.get(key)
+        now = int(ExpressionAttributeValues[":now"]["N"])
+        if existing and int(existing["ExpiresAt"]["N"]) >= now:
+            raise ClientError(
+                {"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem"
+            )
+        self.items[key] = Item
+
+    def delete_item(self, TableName, Key):
+        self.items.pop(Key["Key"]["S"], None)
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_memory_store_claims_once_until_expired():
+    clock = Clock()
+    store = MemoryStore(clock)
+    assert store.claim("a", 60)
+    assert not store.claim("a", 60)
+    assert store.claim("b", 60)
+    clock.now += 61
+    assert store.claim("a", 60)
+    store.release("a")
+    assert store.claim("a", 60)
+
+
+def test_dynamodb_store_claims_once_until_expired():
+    clock = Clock()
+    dynamodb = DynamoDB()
+    store = DynamoDBStore("dedup", dynamodb, clock)
+    assert store.claim("a", 60)
+    assert not store.claim("a", 60)
+    assert dynamodb.items["a"]["ExpiresAt"] == {"N": "1060"}
+    clock.now += 61
+    assert store.claim("a", 60)
+    store.release("a")
+    assert "a" not in dynamodb.items
+    assert store.claim("a", 60)
+
+
+def test_key_includes_the_attempt():
+    request = Request()
+    deduplicator = Deduplicator(MemoryStore())
+    assert not deduplicator.is_duplicate(request)
+    assert deduplicator.is_duplicate(request)
+    request["ResourceProperties"]["Attempt"] = 2
+    assert not deduplicator.is_duplicate(request)
+
+
+def test_late_duplicates_are_ignored_for_the_ttl():
+    clock = Clock()
+    request = Request()
+    deduplicator = Deduplicator(MemoryStore(clock), ttl=900)
+    assert not deduplicator.is_duplicate(request)
+    # after the end of the invocation which handled it
+    clock.now += 600
+    assert deduplicator.is_duplicate(request)
+    clock.now += 301
+    assert not deduplicator.is_duplicate(request)
+
+
+def test_duplicate_deliveries_stop_early(aws, responses, monkeypatch):
+    sqs = SQS()
+    monkeypatch.setattr(provider, "deduplicator", Deduplicator(MemoryStore()))
+    monkeypatch.setattr(
+        certificate_dns_record_provider.reinvoker,
+        "scheduler",
+        SQSScheduler("https://sqs/queue", sqs),
+    )
+    arn = aws.add_certificate(status="PENDING_VALIDATION", DomainName="example.com")
+
+    request = json.dumps(Request(certificate_arn=arn))
+    provider.handler(json.loads(request), {})
+    provider.handler(json.loads(request), {})
+    assert len(sqs.messages) == 1
+
+    # the re-invocation is delivered twice, but only continued once
+    message = sqs.messages.pop()
+    responses = provider.handler({"Records": [message, message]}, {})
+    assert responses[1] is None
+    assert len(sqs.messages) == 1
+
+
+def test_failed_request_is_handled_again(monkeypatch):
+    monkeypatch.setattr(provider, "deduplicator", Deduplicator(MemoryStore()))
+    sent = []
+
+    def send_response():
+        sent.append(issued_certificate_provider.request_id)
+        raise Exception("failed to put the response")
+
+    monkeypatch.setattr(issued_certificate_provider, "send_response", send_response)
+    request = json.dumps(Request("Delete"))
+    for _ in range(2):
+        with pytest.raises(Exception, match="failed to put"):
+            provider.handler(json.loads(request), {})
+    assert len(sent) == 2
+
+
+def test_undelivered_responses_are_handled_again(monkeypatch):
+    monkeypatch.setattr(provider, "deduplicator", Deduplicator(MemoryStore()))
+    sent = []
+
+    def put(url, body, budget=None):
+        sent.append(url)
+        if url.endswith("/fail"):
+            raise Exception("failed to put the response to %s" % url)
+
+    monkeypatch.setattr(responder, "put", put)
+    delivered, undelivered = Request("Delete"), Request("Delete")
+    undelivered["ResponseURL"] = "https://httpbin.org/fail"
+    records = [
+        {"eventSource": "aws:sqs", "body": json.dumps(r)}
+        for r in [delivered, undelivered]
+    ]
+    for _ in range(2):
+        with pytest.raises(Exception, match="/fail"):
+            provider.handler({"Records": records}, {})
+
+    # the redelivered batch only handles the request of which the response failed
+    assert sent == [
+        "https://httpbin.org/put",
+        "https://httpbin.org/fail",
+        "https://httpbin.org/fail",
+    ]
+
+
+class SQS(object):
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, QueueUrl, MessageBody, DelaySeconds):
+        self.messages.append({"eventSource": "aws:sqs", "body": MessageBody})
+
+
+class Request(dict):
+    def __init__(self, request_type="Create", certificate_arn=None):
+        if not certificate_arn:
+            certificate_arn = (
+                "arn:aws:acm:eu-central-1:111111111111:certificate/%s" % uuid.uuid4()
+            )
+        self.update(
+            {
+                "RequestType": request_type,
+                "ResponseURL": "https://httpbin.org/put",
+                "StackId": "arn:aws:cloudformation:us-west-2:EXAMPLE/stack-name/guid",
+                "RequestId": "request-%s" % uuid.uuid4(),
+                "ResourceType": "Custom::IssuedCertificate",
+                "LogicalResourceId": "Certificate",
+                "ResourceProperties": {"CertificateArn": certificate_arn},
+            }
+        )
+        if request_type == "Delete":
+            self["PhysicalResourceId"] = self["ResourceProperties"]["CertificateArn"]
@@ -0,0 +1,184 @@
+import io
+import json
+import uuid
+
+from dispatcher import Dispatcher, dispatcher, requests_of
+from metrics import metrics
+from provider import handler
+
+SERVICE_TOKEN = "arn:aws:lambda:eu-central-1:111111111111:function:f"
+
+
+class Scheduler(object):
+    """
+    local stand-in for a scheduler, recording the scheduled payloads
+    """
+
+    def __init__(self, error=None):
+        self.scheduled = []
+        self.error = error
+
+    def schedule(self, provider, payload, delay):
+        if self.error:
+            raise self.error
+        self.scheduled.append((provider, json.loads(payload), delay))
+
+
+class Provider(object):
+    def __init__(self, service_token=SERVICE_TOKEN):
+        self.request = {"ResourceProperties": {"ServiceToken": service_token}}
+        self.responses = []
+
+    def get(self, name):
+        return self.request["ResourceProperties"].get(name)
+
+    def set_request(self, request, context):
+        self.request = request
+        self.physical_resource_id = request.get("PhysicalResourceId")
+
+    def fail(self, reason):
+        self.reason = reason
+
+    def send_response(self):
+        self.responses.append((self.request["RequestId"], self.reason))
+
+
+def payload(request_id):
+    return json.dumps({"RequestId": request_id}).encode("utf-8")
+
+
+def test_schedules_immediately_outside_batch():
+    scheduler = Scheduler()
+    Dispatcher().schedule(scheduler, Provider(), payload("a"), 15)
+    assert [p for _, p, _ in scheduler.scheduled] == [{"RequestId": "a"}]
+
+
+def test_coalesces_re_invocations_in_batch():
+    scheduler = Scheduler()
+    provider = Provider()
+    dispatcher = Dispatcher(max_batch_size=2)
+    with dispatcher.batch():
+        for request_id, delay in [("a", 30), ("b", 15), ("c", 60)]:
+            dispatcher.schedule(scheduler, provider, payload(request_id), delay)
+        assert not scheduler.scheduled
+
+    assert [(p, d) for _, p, d in scheduler.scheduled] == [
+        ({"Requests": [{"RequestId": "a"}, {"RequestId": "b"}]}, 15),
+        ({"RequestId": "c"}, 60),
+    ]
+    assert all(target is provider for target, _, _ in scheduler.scheduled)
+
+
+def test_continuation_invokes_the_function_of_the_requests():
+    scheduler = Scheduler()
+    provider = Provider("arn:aws:lambda:eu-central-1:111111111111:function:other")
+    dispatcher = Dispatcher()
+    with dispatcher.batch():
+        dispatcher.schedule(scheduler, provider, payload("a"), 15)
+        provider.request = {"ResourceProperties": {"ServiceToken": SERVICE_TOKEN}}
+        dispatcher.schedule(scheduler, provider, payload("b"), 15)
+
+    targets = [target for target, _, _ in scheduler.scheduled]
+    assert targets[0].function_name.endswith(":other")
+    assert targets[1] is provider
+
+
+def test_failure_to_schedule_is_reported():
+    scheduler = Scheduler(error=Exception("throttled"))
+    provider = Provider()
+    sleeps = []
+    dispatcher = Dispatcher(sleep=sleeps.append)
+    with dispatcher.batch():
+        dispatcher.schedule(scheduler, provider, payload("a"), 15)
+        dispatcher.schedule(scheduler, provider, payload("b"), 15)
+
+    assert provider.responses == [
+        ("a", "failed to re-invoke, throttled"),
+        ("b", "failed to re-invoke, throttled"),
+    ]
+    assert provider.physical_resource_id == "could-not-create"
+    # each continuation is retried before it is reported
+    assert sleeps == [1, 2]
+
+
+def test_requests_of_unpacks_batches():
+    a, b, c = {"RequestId": "a"}, {"RequestId": "b"}, {"RequestId": "c"}
+    event = {
+        "Records": [
+            {"body": json.dumps(a)},
+            {"body": json.dumps({"Requests": [b, c]})},
+        ]
+    }
+    assert requests_of(event) == [a, b, c]
+    assert requests_of({"Requests": [a, b]}) == [a, b]
+    assert requests_of(a) == [a]
+
+
+def request(certificate_arn):
+    return {
+        "RequestType": "Create",
+        "ResponseURL": "https://localhost/response/%s" % uuid.uuid4(),
+        "StackId": "arn:aws:cloudformation:eu-central-1:111111111111:stack/s/guid",
+        "RequestId": "request-%s" % uuid.uuid4(),
+        "ResourceType": "Custom::IssuedCertificate",
+        "LogicalResourceId": "Issued",
+        "ResourceProperties": {
+            "CertificateArn": certificate_arn,
+            "ServiceToken": SERVICE_TOKEN,
+        },
+    }
+
+
+def test_pending_checks_continue_in_one_invocation(aws, responses, monkeypatch):
+    stream = io.StringIO()
+    monkeypatch.setattr(metrics, "enabled", True)
+    monkeypatch.setattr(metrics, "stream", stream)
+    acm = aws.client("acm", None)
+    requests = [
+        request(acm.request_certificate(DomainName=name)["CertificateArn"])
+        for name in ["a.example.com", "b.example.com", "c.example.com"]
+    ]
+
+    handler({"Requests": requests}, None)
+    assert not responses
+    assert aws.calls["lambda.invoke"] == 1
+    continuation = json.loads(aws.invocations.popleft())
+    assert [r["RequestId"] for r in continuation["Requests"]] == [
+        r["RequestId"] for r in requests
+    ]
+    assert all(
+        r["ResourceProperties"]["Attempt"] == 2 for r in continuation["Requests"]
+    )
+
+    emitted = [json.loads(line) for line in stream.getvalue().splitlines()]
+    coalescing = [m for m in emitted if m.get("Operation") == "Reinvoke"]
+    assert coalescing[0]["ReinvokedRequests"] == 3
+    assert coalescing[0]["Continuations"] == 1
+    assert coalescing[0]["CoalescedInvocations"] == 2
+
+    aws.clock.sleep(60)
+    handler(continuation, None)
+    assert not aws.invocations
+    assert sorted((r["RequestId"], r["Status"]) for r in responses) == sorted(
+        (r["RequestId"], "SUCCESS") for r in requests
+    )
+    assert dispatcher.pending is None
+
+
+def test_failure_to_re_invoke_is_retried(aws, responses):
+    arn = aws.add_certificate(status="PENDING_VALIDATION", DomainName="example.com")
+    aws.fail_next("lambda.invoke", "TooManyRequestsException")
+    handler(request(arn), None)
+    assert not responses
+    assert aws.calls["lambda.invoke"] == 2
+    assert len(aws.invocations) == 1
+
+
+def test_failure_to_re_invoke_is_reported_last(aws, responses):
+    arn = aws.add_certificate(status="PENDING_VALIDATION", DomainName="example.com")
+    aws.fail_next("lambda.invoke", "TooManyRequestsException", count=3)
+    handler(request(arn), None)
+    assert aws.calls["lambda.invoke"] == 3
+    assert [r["Status"] for r in responses] == ["FAILED"]
+    assert "TooManyRequestsException" in responses[0]["Reason"]
+    assert responses[0]["PhysicalResourceId"] == "could-not-create"
@@ -0,0 +1,135 @@
+import json
+import uuid
+
+import pytest
+from botocore.exceptions import ClientError
+
+import certificate_dns_record_provider
+import clients
+from fake_aws import FakeAWS
+from provider import handler
+
+
+def test_certificate_is_issued_after_delay(aws):
+    aws.record_delay = 10
+    acm = clients.acm()
+    arn = acm.request_certificate(
+        DomainName="example.com",
+        SubjectAlternativeNames=["*.example.com"],
+        ValidationMethod="DNS",
+    )["CertificateArn"]
+
+    certificate = acm.describe_certificate(CertificateArn=arn)["Certificate"]
+    assert certificate["Status"] == "PENDING_VALIDATION"
+    assert "ResourceRecord" not in certificate["DomainValidationOptions"][0]
+
+    aws.clock.sleep(10)
+    options = acm.describe_certificate(CertificateArn=arn)["Certificate"][
+        "DomainValidationOptions"
+    ]
+    # the wildcard and apex domain share a validation record
+    assert options[0]["ResourceRecord"] == options[1]["ResourceRecord"]
+
+    aws.clock.sleep(60)
+    certificate = acm.describe_certificate(CertificateArn=arn)["Certificate"]
+    assert certificate["Status"] == "ISSUED"
+    assert aws.calls == {"acm.request_certificate": 1, "acm.describe_certificate": 3}
+
+
+def test_validation_records_issue_the_certificate():
+    aws = FakeAWS(issue_delay=5, require_validation_records=True)
+    acm = aws.client("acm", None)
+    arn = acm.request_certificate(DomainName="example.com")["CertificateArn"]
+    aws.clock.sleep(60)
+    assert acm.describe_certificate(CertificateArn=arn)["Certificate"]["Status"] == (
+        "PENDING_VALIDATION"
+    )
+
+    record = aws.certificates[arn].resource_record("example.com")
+    aws.client("route53", None).change_resource_record_sets(
+        HostedZoneId="Z1",
+        ChangeBatch={"Changes": [{"Action": "UPSERT", "ResourceRecordSet": record}]},
+    )
+    aws.clock.sleep(5)
+    assert acm.describe_certificate(CertificateArn=arn)["Certificate"]["Status"] == (
+        "ISSUED"
+    )
+
+
+def test_throttling_and_failures():
+    aws = FakeAWS(throttle_limit=2)
+    acm = aws.client("acm", None)
+    arn = acm.request_certificate(DomainName="example.com")["CertificateArn"]
+    acm.describe_certificate(CertificateArn=arn)
+    acm.describe_certificate(CertificateArn=arn)
+    with pytest.raises(ClientError) as error:
+        acm.describe_certificate(CertificateArn=arn)
+    assert error.value.response["Error"]["Code"] == "ThrottlingException"
+
+    aws.clock.sleep(1)
+    aws.fail_next("acm.describe_certificate", "AccessDeniedException")
+    with pytest.raises(ClientError) as error:
+        acm.describe_certificate(CertificateArn=arn)
+    assert error.value.response["Error"]["Code"] == "AccessDeniedException"
+    acm.describe_certificate(CertificateArn=arn)
+
+
+def test_deployment_through_the_providers(aws, responses, monkeypatch):
+    aws.record_delay = 10
+    handler(Request("Custom::Certificate", DomainName="example.com"), None)
+    assert responses[-1]["Status"] == "SUCCESS", responses[-1]["Reason"]
+    arn = responses[-1]["PhysicalResourceId"]
+
+    # the record appears after 10 seconds, waited for by polling
+    monkeypatch.setattr(
+        certificate_dns_record_provider.provider,
+        "create_polling_schedule",
+        lambda: PollingSchedule(aws.clock),
+    )
+    handler(Request("Custom::CertificateDNSRecord", CertificateArn=arn), None)
+    assert responses[-1]["Status"] == "SUCCESS", responses[-1]["Reason"]
+    assert responses[-1]["Data"]["Type"] == "CNAME"
+
+    handler(Request("Custom::IssuedCertificate", CertificateArn=arn), None)
+    while aws.invocations:
+        handler(json.loads(aws.invocations.popleft()), None)
+    assert responses[-1]["Status"] == "SUCCESS", responses[-1]["Reason"]
+    assert responses[-1]["PhysicalResourceId"] == arn
+    assert aws.calls["lambda.invoke"] == 4
+
+
+class PollingSchedule(object):
+    def __init__(self, clock):
+        self.clock = clock
+        self.started = clock()
+        self.iterations = 0
+
+    @property
+    def elapsed(self):
+        return self.clock() - self.started
+
+    def wait(self):
+        if self.iterations:
+            self.clock.sleep(5)
+        self.iterations += 1
+        return True
+
+
+class Request(dict):
+    def __init__(self, resource_type, **properties):
+        properties["ServiceToken"] = (
+            "arn:aws:lambda:eu-central-1:111111111111:function:f"
+        )
+        properties.setdefault("ValidationMethod", "DNS")
+        properties.setdefault("Region", "eu-central-1")
+        self.update(
+            {
+                "RequestType": "Create",
+                "ResponseURL": "https://httpbin.org/put",
+                "StackId": "arn:aws:cloudformation:us-west-2:EXAMPLE/stack-name/guid",
+                "RequestId": "request-%s" % uuid.uuid4(),
+                "ResourceType": resource_type,
+                "LogicalResourceId": "Resource",
+                "ResourceProperties": properties,
+            }
+        )
@@ -0,0 +1,29 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_memory_per_invocation(tmp_path):
+    output = tmp_path / "memory.json"
+    subprocess.check_call(
+        [
+            sys.executable,
+            os.path.join(ROOT, "benchmarks", "memory.py"),
+            "--sans",
+            "20",
+            "--invocations",
+            "5",
+            "--output",
+            str(output),
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    results = json.loads(output.read_text())
+    assert len(results) == 4
+    for result in results.values():
+        assert result["import_kb"] <= result["last_invocation_kb"]
+    # the re-invocation carries the resource properties, not the certificate
+    assert 0 < results["Custom::IssuedCertificate"]["payload_bytes"] < 1024
@@ -0,0 +1,113 @@
+import json
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from metrics import Metrics, metrics
+from provider import handler
+
+
+def test_emf_record():
+    m = Metrics("test", clock=lambda: 1.5)
+    m.reset({"ResourceType": "Custom::Certificate", "RequestType": "Create"})
+    m.add("AWSCalls")
+    m.add("AWSCalls")
+    m.put("TimeToIssued", 12.5, "Seconds")
+    assert m.to_emf() == {
+        "_aws": {
+            "Timestamp": 1500,
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": "test",
+                    "Dimensions": [["RequestType", "ResourceType"]],
+                    "Metrics": [
+                        {"Name": "AWSCalls", "Unit": "Count"},
+                        {"Name": "TimeToIssued", "Unit": "Seconds"},
+                    ],
+                }
+            ],
+        },
+        "ResourceType": "Custom::Certificate",
+        "RequestType": "Create",
+        "AWSCalls": 2,
+        "TimeToIssued": 12.5,
+    }
+
+
+def test_instrumented_client_records_calls():
+    m = Metrics("test")
+    acm = m.instrument(boto3.client("acm", region_name="eu-central-1"), "acm")
+    with Stubber(acm) as stubber:
+        stubber.add_response("delete_certificate", {})
+        stubber.add_client_error("delete_certificate", "ThrottlingException")
+        acm.delete_certificate(
+            CertificateArn="arn:aws:acm:eu-central-1:1:certificate/1"
+        )
+        with pytest.raises(ClientError):
+            acm.delete_certificate(
+                CertificateArn="arn:aws:acm:eu-central-1:1:certificate/1"
+            )
+
+    assert m.values["AWSCalls"] == (2, "Count")
+    assert m.values["acm.DeleteCertificate.Calls"] == (2, "Count")
+    assert m.values["acm.DeleteCertificate.Errors"] == (1, "Count")
+    assert m.values["acm.DeleteCertificate.Throttles"] == (1, "Count")
+    assert m.values["acm.DeleteCertificate.Latency"][1] == "Milliseconds"
+
+
+def test_calls_recorded_in_parallel_are_counted():
+    # switch threads often, to interleave the updates of the counts
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        m = Metrics("test")
+
+        def record(_):
+            for _ in range(2000):
+                m.record_call("acm", "DescribeCertificate", 0.001)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(record, range(8)))
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert m.values["AWSCalls"] == (16000, "Count")
+    assert m.values["acm.DescribeCertificate.Calls"] == (16000, "Count")
+
+
+def test_handler_emits_metrics(aws, responses, capsys):
+    handler(Request(), {})
+    assert responses[-1]["Status"] == "SUCCESS", responses[-1]["Reason"]
+    records = [
+        json.loads(line)
+        for line in capsys.readouterr().out.splitlines()
+        if line.startswith('{"_aws"')
+    ]
+    assert len(records) == 1
+    assert records[0]["ResourceType"] == "Custom::Certificate"
+    assert records[0]["RequestType"] == "Create"
+    assert records[0]["Attempt"] == 1
+    assert records[0]["Duration"] > 0
+
+
+class Request(dict):
+    def __init__(self):
+        self.update(
+            {
+                "RequestType": "Create",
+                "ResponseURL": "https://httpbin.org/put",
+                "StackId": "arn:aws:cloudformation:us-west-2:EXAMPLE/stack-name/guid",
+                "RequestId": "request-%s" % uuid.uuid4(),
+                "ResourceType": "Custom::Certificate",
+                "LogicalResourceId": "Certificate",
+                "ResourceProperties": {
+                    "DomainName": "example.com",
+                    "ValidationMethod": "DNS",
+                },
+            }
+        )
@@ -0,0 +1,131 @@
+import uuid
+
+from budget import ExecutionBudget
+from certificate_dns_record_provider import provider
+from polling import PollingSchedule
+
+
+class FakeClock(object):
+    """
+    a clock which only advances when someone sleeps.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Context(object):
+    def __init__(self, clock, timeout_in_seconds):
+        self.clock = clock
+        self.deadline = clock() + timeout_in_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - self.clock()) * 1000)
+
+
+def schedule(clock, **kwargs):
+    return PollingSchedule(
+        clock=clock.time, sleep=clock.sleep, random=lambda: 0.5, **kwargs
+    )
+
+
+def test_exponential_backoff_with_jitter():
+    clock = FakeClock()
+    s = schedule(clock, first_delay=0.5, interval=2, max_interval=10, jitter=0.5)
+    for _ in range(6):
+        assert s.wait()
+    assert clock.sleeps == [0.5, 1.5, 3.0, 6.0, 7.5, 7.5]
+    assert s.iterations == 6
+
+
+def test_stops_at_deadline():
+    clock = FakeClock()
+    s = schedule(clock, interval=10, max_interval=10, jitter=0, max_wait=25)
+    waits = 0
+    while s.wait():
+        waits += 1
+    assert waits == 4
+    assert clock.sleeps == [1.0, 10, 10, 4.0]
+    assert clock.now == 25
+
+
+def test_deadline_from_context(monkeypatch):
+    monkeypatch.setenv("DEADLINE_RESERVE", "10")
+    clock = FakeClock()
+    budget = ExecutionBudget.from_context(Context(clock.time, 60), clock=clock.time)
+    s = PollingSchedule.from_environment(budget, clock=clock.time, sleep=clock.sleep)
+    assert s.max_wait == 50
+    assert PollingSchedule.from_environment(ExecutionBudget()).max_wait is None
+
+
+def poll(aws, monkeypatch, record_delay, timeout):
+    """
+    creates a DNS record of a certificate of which the record appears after `record_delay`
+    seconds, returning the ARN and the seconds elapsed.
+    """
+    aws.record_delay = record_delay
+    arn = aws.add_certificate(DomainName="example.com")
+    monkeypatch.setattr(
+        provider,
+        "create_polling_schedule",
+        lambda: PollingSchedule.from_environment(
+            provider.budget, clock=aws.clock, sleep=aws.clock.sleep
+        ),
+    )
+    started = aws.clock()
+    context = Context(aws.clock, timeout)
+    provider.set_request(Request("Create", arn), context)
+    provider.budget = ExecutionBudget.from_context(context, clock=aws.clock)
+    provider.create()
+    return arn, aws.clock() - started
+
+
+def test_record_found_on_first_probe(aws, monkeypatch):
+    arn, elapsed = poll(aws, monkeypatch, record_delay=0.5, timeout=300)
+    assert provider.status == "SUCCESS", provider.reason
+    assert provider.physical_resource_id == (
+        aws.certificates[arn].resource_record("example.com")["Name"]
+    )
+    assert elapsed == 1.0
+    assert aws.calls["acm.describe_certificate"] == 1
+
+
+def test_hand_off_before_deadline(aws, monkeypatch):
+    arn, elapsed = poll(aws, monkeypatch, record_delay=1000, timeout=60)
+    assert provider.asynchronous
+    assert provider.attempt == 2
+    # the sleep before the re-invocation is bounded by the reserve of the budget
+    assert elapsed == 50
+    assert len(aws.invocations) == 1
+
+
+def test_asynchronous_polling_checks_once(aws, monkeypatch):
+    monkeypatch.setenv("ASYNC_DNS_RECORD_POLLING", "true")
+    arn, elapsed = poll(aws, monkeypatch, record_delay=1000, timeout=300)
+    assert provider.asynchronous
+    assert provider.attempt == 2
+    assert aws.calls["acm.describe_certificate"] == 1
+    assert elapsed == 1 + 15
+
+
+class Request(dict):
+    def __init__(self, request_type, certificate_arn):
+        self.update(
+            {
+                "RequestType": request_type,
+                "ResponseURL": "https://httpbin.org/put",
+                "StackId": "arn:aws:cloudformation:us-west-2:EXAMPLE/stack-name/guid",
+                "RequestId": "request-%s" % uuid.uuid4(),
+                "ResourceType": "Custom::CertificateDNSRecord",
+                "LogicalResourceId": "Record",
+                "ResourceProperties": {"CertificateArn": certificate_arn},
+            }
+        )
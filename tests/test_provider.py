@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+def loaded_modules(statement):
+    script = "import sys, provider\n{}\nprint(','.join(sorted(m for m in provider.modules.values() if m in sys.modules)))"
+    output = subprocess.check_output(
+        [sys.executable, "-c", script.format(statement)],
+        env=dict(os.environ, PYTHONPATH=SRC),
+    )
+    return output.decode("utf-8").strip()
+
+
+def test_no_provider_is_imported_at_load():
+    assert loaded_modules("") == ""
+
+
+def test_only_the_requested_provider_is_imported():
+    assert (
+        loaded_modules('provider.provider_module("Custom::Certificate")')
+        == "certificate_provider"
+    )
+    assert (
+        loaded_modules('provider.provider_module("Custom::CertificateDNSRecord")')
+        == "certificate_dns_record_provider"
+    )
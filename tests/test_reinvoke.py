@@ -0,0 +1,108 @@
+import json
+
+from reinvoke import Reinvoker
+from scheduler import LambdaScheduler
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Provider(object):
+    def __init__(self, properties):
+        self.request = {"ResourceProperties": properties}
+        self.asynchronous = False
+        self.payloads = []
+        self.reason = None
+
+    @property
+    def properties(self):
+        return self.request["ResourceProperties"]
+
+    def invoke_lambda(self, payload):
+        self.payloads.append(json.loads(payload))
+
+    def fail(self, reason):
+        self.reason = reason
+
+
+def test_reinvoke_carries_state_in_payload():
+    clock = Clock()
+    reinvoker = Reinvoker(
+        interval=5,
+        factor=2,
+        max_interval=15,
+        clock=clock.time,
+        scheduler=LambdaScheduler(clock.sleep),
+    )
+    provider = Provider({"CertificateArn": "arn"})
+    attempts = []
+    for _ in range(4):
+        reinvoker.reinvoke(provider)
+        provider.request = provider.payloads[-1]
+        attempts.append(provider.properties["Attempt"])
+
+    assert provider.asynchronous
+    assert clock.sleeps == [5, 10, 15, 15]
+    assert attempts == [2, 3, 4, 5]
+    assert provider.properties["FirstAttemptTime"] == 1000.0
+    assert reinvoker.elapsed(provider.properties) == 45
+
+
+def test_max_attempts():
+    clock = Clock()
+    reinvoker = Reinvoker(
+        max_attempts=3, clock=clock.time, scheduler=LambdaScheduler(clock.sleep)
+    )
+    provider = Provider({"Attempt": 3})
+    reinvoker.reinvoke(provider)
+    assert not provider.asynchronous
+    assert not provider.payloads
+    assert provider.reason == "gave up waiting after 3 attempts in 0 seconds"
+
+
+def test_max_elapsed():
+    clock = Clock()
+    reinvoker = Reinvoker(
+        max_elapsed=600, clock=clock.time, scheduler=LambdaScheduler(clock.sleep)
+    )
+    provider = Provider({"Attempt": 10, "FirstAttemptTime": clock.now - 600})
+    reinvoker.reinvoke(provider)
+    assert not provider.payloads
+    assert provider.reason == "gave up waiting after 10 attempts in 600 seconds"
+
+
+def test_payload_only_carries_fields_to_resume():
+    clock = Clock()
+    reinvoker = Reinvoker(clock=clock.time, scheduler=LambdaScheduler(clock.sleep))
+    provider = Provider({"CertificateArn": "arn"})
+    provider.request.update(
+        {
+            "RequestType": "Update",
+            "RequestId": "1",
+            "PhysicalResourceId": "arn",
+            "OldResourceProperties": {"CertificateArn": "old-arn"},
+        }
+    )
+    reinvoker.reinvoke(provider)
+    assert provider.payloads == [
+        {
+            "RequestType": "Update",
+            "RequestId": "1",
+            "PhysicalResourceId": "arn",
+            "ResourceProperties": {
+                "CertificateArn": "arn",
+                "Attempt": 2,
+                "FirstAttemptTime": 1000.0,
+            },
+        }
+    ]
@@ -0,0 +1,41 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_replay_of_recorded_requests(tmp_path):
+    output = tmp_path / "replay.json"
+    subprocess.check_call(
+        [
+            sys.executable,
+            os.path.join(ROOT, "benchmarks", "replay.py"),
+            "--runs",
+            "1",
+            "--output",
+            str(output),
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    results = json.loads(output.read_text())["requests"]
+    assert all(r["status"] == "SUCCESS" for r in results.values())
+    assert {name: r["aws_calls"] for name, r in results.items()} == {
+        "Certificate.Create": {"acm.request_certificate": 1},
+        "Certificate.Update": {"acm.request_certificate": 1},
+        "Certificate.Delete": {"acm.delete_certificate": 1},
+        "CertificateDNSRecord.Create": {"acm.describe_certificate": 1},
+        "CertificateDNSRecord.Update": {"acm.describe_certificate": 1},
+        "CertificateDNSRecord.Delete": {},
+        "CertificateDNSRecords.Create": {"acm.describe_certificate": 1},
+        "IssuedCertificate.Create": {
+            "acm.describe_certificate": 1,
+            "lambda.invoke": 1,
+        },
+        "IssuedCertificate.Update": {
+            "acm.describe_certificate": 1,
+            "lambda.invoke": 1,
+        },
+        "IssuedCertificate.Delete": {},
+    }
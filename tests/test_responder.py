@@ -0,0 +1,149 @@
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import issued_certificate_provider
+from metrics import metrics
+from responder import Responder
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    records the responses put to the pre-signed URL, answering with the queued status codes
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_PUT(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(server.delay)
+        with server.lock:
+            status = server.statuses.pop(0) if server.statuses else 200
+            server.received.append((self.path, json.loads(body), status))
+            server.connections.add(self.client_address)
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    result = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    result.daemon_threads = True
+    result.lock = threading.Lock()
+    result.statuses = []
+    result.received = []
+    result.connections = set()
+    result.delay = 0.0
+    result.url = "http://127.0.0.1:%d" % result.server_address[1]
+    thread = threading.Thread(target=result.serve_forever)
+    thread.start()
+    yield result
+    result.shutdown()
+    result.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    result = io.StringIO()
+    monkeypatch.setattr(metrics, "enabled", True)
+    monkeypatch.setattr(metrics, "stream", result)
+    return result
+
+
+def test_reuses_connection(server):
+    sender = Responder()
+    for i in range(3):
+        sender.send(server.url + "/%d" % i, {"Status": "SUCCESS"})
+    assert [path for path, _, _ in server.received] == ["/0", "/1", "/2"]
+    assert len(server.connections) == 1
+
+
+def test_retries_server_errors(server):
+    sleeps = []
+    server.statuses = [500, 503]
+    sender = Responder(sleep=sleeps.append)
+    metrics.reset()
+    sender.send(server.url + "/r", {"Status": "SUCCESS"})
+    assert [status for _, _, status in server.received] == [500, 503, 200]
+    assert len(sleeps) == 2 and all(0.5 <= s <= 8 for s in sleeps)
+    assert metrics.values["ResponseRetries"][0] == 2
+    assert metrics.values["ResponseLatency"][1] == "Milliseconds"
+
+
+def test_does_not_retry_client_errors(server):
+    server.statuses = [403]
+    with pytest.raises(Exception, match="status code 403"):
+        Responder(sleep=lambda s: None).send(server.url + "/r", {})
+    assert len(server.received) == 1
+
+
+def test_gives_up_after_max_attempts(server):
+    server.statuses = [500] * 5
+    with pytest.raises(Exception, match="status code 500"):
+        Responder(max_attempts=3, sleep=lambda s: None).send(server.url + "/r", {})
+    assert len(server.received) == 3
+
+
+def test_sends_batch_concurrently(server, stream):
+    server.delay = 0.2
+    sender = Responder(concurrency=8)
+    started = time.time()
+    with sender.batch():
+        for i in range(8):
+            sender.send(server.url + "/%d" % i, {"Status": "SUCCESS"})
+    assert time.time() - started < 1.0
+    assert sorted(path for path, _, _ in server.received) == [
+        "/%d" % i for i in range(8)
+    ]
+
+    record = json.loads(stream.getvalue())
+    assert record["Operation"] == "Respond"
+    assert record["Responses"] == 8
+    assert record["ResponseFailures"] == 0
+    assert len(record["ResponseLatency"]) == 8
+
+
+def test_batch_raises_failed_delivery(server, stream):
+    server.statuses = [404]
+    sender = Responder(concurrency=1)
+    with pytest.raises(Exception, match="status code 404"):
+        with sender.batch():
+            sender.send(server.url + "/a", {})
+            sender.send(server.url + "/b", {})
+    assert len(server.received) == 2
+    assert json.loads(stream.getvalue())["ResponseFailures"] == 1
+
+
+def test_provider_sends_response_through_responder(server):
+    provider = issued_certificate_provider.provider
+    provider.set_request(
+        {
+            "RequestType": "Delete",
+            "ResponseURL": server.url + "/response",
+            "StackId": "arn:aws:cloudformation:eu-central-1:111111111111:stack/s/guid",
+            "RequestId": "request-1",
+            "ResourceType": "Custom::IssuedCertificate",
+            "LogicalResourceId": "Issued",
+            "PhysicalResourceId": "arn:aws:acm:eu-central-1:111111111111:certificate/1",
+            "ResourceProperties": {"CertificateArn": "arn"},
+        },
+        None,
+    )
+    provider.success("x" * 300)
+    metrics.reset()
+    provider.send_response()
+
+    _, body, _ = server.received[0]
+    assert body["RequestId"] == "request-1"
+    assert body["Status"] == "SUCCESS"
+    assert len(body["Reason"]) == 203
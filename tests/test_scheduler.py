@@ -0,0 +1,131 @@
+import json
+import uuid
+
+import pytest
+
+import certificate_dns_record_provider
+from issued_certificate_provider import provider as issued_certificate_provider
+from provider import handler
+from scheduler import (
+    LambdaScheduler,
+    SQSScheduler,
+    StepFunctionsScheduler,
+    scheduler_from_environment,
+)
+
+
+class SQS(object):
+    """
+    local stand-in for an SQS queue
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, QueueUrl, MessageBody, DelaySeconds):
+        self.messages.append((QueueUrl, MessageBody, DelaySeconds))
+
+    def receive(self):
+        """
+        returns the queued messages as a Lambda SQS event
+        """
+        event = {
+            "Records": [
+                {"eventSource": "aws:sqs", "body": body} for _, body, _ in self.messages
+            ]
+        }
+        self.messages = []
+        return event
+
+
+class StepFunctions(object):
+    def __init__(self):
+        self.executions = []
+
+    def start_execution(self, stateMachineArn, input):
+        self.executions.append((stateMachineArn, json.loads(input)))
+
+
+class Lambda(object):
+    def __init__(self):
+        self.payloads = []
+
+    def invoke_lambda(self, payload):
+        self.payloads.append(payload)
+
+
+def test_lambda_scheduler_sleeps_and_invokes():
+    sleeps = []
+    lmbda = Lambda()
+    LambdaScheduler(sleeps.append).schedule(lmbda, b"{}", 15)
+    assert sleeps == [15]
+    assert lmbda.payloads == [b"{}"]
+
+
+def test_sqs_scheduler_delays_message():
+    sqs = SQS()
+    scheduler = SQSScheduler("https://sqs/queue", sqs)
+    scheduler.schedule(None, b'{"a": 1}', 14.6)
+    scheduler.schedule(None, b'{"a": 1}', 3600)
+    assert sqs.messages == [
+        ("https://sqs/queue", '{"a": 1}', 15),
+        ("https://sqs/queue", '{"a": 1}', 900),
+    ]
+
+
+def test_step_functions_scheduler_starts_execution():
+    stepfunctions = StepFunctions()
+    scheduler = StepFunctionsScheduler("arn:states", stepfunctions)
+    scheduler.schedule(None, b'{"a": 1}', 30)
+    assert stepfunctions.executions == [
+        ("arn:states", {"Delay": 30, "Request": {"a": 1}})
+    ]
+
+
+def test_scheduler_from_environment(monkeypatch):
+    assert isinstance(scheduler_from_environment(), LambdaScheduler)
+    monkeypatch.setenv("REINVOKE_SCHEDULER", "sqs")
+    monkeypatch.setenv("REINVOKE_QUEUE_URL", "https://sqs/queue")
+    assert scheduler_from_environment().queue_url == "https://sqs/queue"
+    monkeypatch.setenv("REINVOKE_SCHEDULER", "stepfunctions")
+    monkeypatch.setenv("REINVOKE_STATE_MACHINE_ARN", "arn:states")
+    assert scheduler_from_environment().state_machine_arn == "arn:states"
+    monkeypatch.setenv("REINVOKE_SCHEDULER", "cron")
+    with pytest.raises(ValueError):
+        scheduler_from_environment()
+
+
+def test_pending_certificate_is_rescheduled_through_sqs(aws, responses, monkeypatch):
+    sqs = SQS()
+    monkeypatch.setattr(
+        certificate_dns_record_provider.reinvoker,
+        "scheduler",
+        SQSScheduler("https://sqs/queue", sqs),
+    )
+    arn = aws.add_certificate(status="PENDING_VALIDATION", DomainName="example.com")
+
+    handler(Request("Create", arn), {})
+    assert issued_certificate_provider.asynchronous
+    assert len(sqs.messages) == 1
+
+    handler(sqs.receive(), {})
+    assert issued_certificate_provider.asynchronous
+    assert issued_certificate_provider.attempt == 3
+    assert len(sqs.messages) == 1
+    assert not aws.invocations
+    assert not responses
+
+
+class Request(dict):
+    def __init__(self, request_type, certificate_arn):
+        self.update(
+            {
+                "RequestType": request_type,
+                "ResponseURL": "https://httpbin.org/put",
+                "StackId": "arn:aws:cloudformation:us-west-2:EXAMPLE/stack-name/guid",
+                "RequestId": "request-%s" % uuid.uuid4(),
+                "ResourceType": "Custom::IssuedCertificate",
+                "LogicalResourceId": "Record",
+                "ResourceProperties": {"CertificateArn": certificate_arn},
+            }
+        )
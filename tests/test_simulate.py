@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def simulate(tmp_path, *arguments):
+    output = tmp_path / "simulate.json"
+    subprocess.check_call(
+        [
+            sys.executable,
+            os.path.join(ROOT, "benchmarks", "simulate.py"),
+            "--output",
+            str(output),
+        ]
+        + list(arguments),
+        stdout=subprocess.DEVNULL,
+    )
+    return json.loads(output.read_text())["strategies"]
+
+
+def test_all_stacks_complete(tmp_path):
+    results = simulate(tmp_path, "--stacks", "5", "--sans", "1")
+    assert sorted(results.keys()) == ["async", "backoff", "sync"]
+    for result in results.values():
+        assert result["stacks_completed"] == 5
+        assert result["timeouts"] == 0
+        # validation records appear after 10 seconds, the certificate is issued 60 seconds later
+        assert 70 <= result["completion_seconds"] < 150
+        assert result["aws_calls"]["acm.request_certificate"] == 5
+
+
+def test_throttled_calls_are_retried(tmp_path):
+    results = simulate(
+        tmp_path,
+        "--stacks",
+        "10",
+        "--throttle-limit",
+        "2",
+        "--hosted-zone",
+        "Z1",
+        "--strategy",
+        "async",
+    )
+    assert results["async"]["stacks_completed"] == 10
+    assert results["async"]["acm_throttled"] > 0
+    assert results["async"]["aws_calls"]["route53.change_resource_record_sets"] == 10
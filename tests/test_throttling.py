@@ -0,0 +1,149 @@
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+import clients
+from budget import ExecutionBudget
+from certificate_index import list_certificates
+from throttling import ThrottledCaller, ThrottledClient, TokenBucket, is_retryable
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def error(code):
+    return ClientError(
+        {"Error": {"Code": code, "Message": code}}, "DescribeCertificate"
+    )
+
+
+class FlakyOperation(object):
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"Certificate": kwargs}
+
+
+def caller(clock, **kwargs):
+    return ThrottledCaller(
+        clock=clock, sleep=clock.sleep, random=lambda low, high: high, **kwargs
+    )
+
+
+def test_classification():
+    assert is_retryable(error("ThrottlingException"))
+    assert is_retryable(error("LimitExceededException"))
+    assert not is_retryable(error("ResourceNotFoundException"))
+    assert not is_retryable(ValueError("bug"))
+
+
+def test_token_bucket_limits_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+    assert bucket.take() == 0.0
+    assert bucket.take() == 0.0
+    assert bucket.take() == 0.5
+    clock.now += 0.5
+    assert bucket.take() == 0.5
+
+
+def test_throttles_are_absorbed():
+    clock = FakeClock()
+    throttled = caller(clock)
+    operation = FlakyOperation(
+        error("ThrottlingException"), error("LimitExceededException")
+    )
+    result = throttled.call("eu-central-1", operation, CertificateArn="arn")
+    assert result == {"Certificate": {"CertificateArn": "arn"}}
+    assert operation.calls == 3
+    assert throttled.throttles_absorbed == 2
+    assert throttled.retries == 2
+    # decorrelated jitter, taking the upper bound: base * 3, then previous * 3
+    assert clock.sleeps == [1.5, 4.5]
+
+
+def test_terminal_errors_are_raised_immediately():
+    clock = FakeClock()
+    throttled = caller(clock)
+    operation = FlakyOperation(error("ResourceNotFoundException"))
+    with pytest.raises(ClientError):
+        throttled.call("eu-central-1", operation)
+    assert operation.calls == 1
+    assert clock.sleeps == []
+
+
+def test_retries_stop_before_the_lambda_times_out():
+    clock = FakeClock()
+    throttled = caller(clock, max_delay=20)
+    throttled.set_budget(ExecutionBudget(deadline=30, reserve=10, clock=clock))
+    operation = FlakyOperation(*[error("ThrottlingException")] * 10)
+    with pytest.raises(ClientError):
+        throttled.call("eu-central-1", operation)
+    assert sum(clock.sleeps) <= 20
+    assert operation.calls < 10
+
+
+def test_rate_is_limited_per_key():
+    clock = FakeClock()
+    throttled = caller(clock, rate=1, burst=1)
+    operation = FlakyOperation()
+    throttled.call("eu-central-1", operation)
+    throttled.call("us-east-1", operation)
+    assert clock.sleeps == []
+    throttled.call("eu-central-1", operation)
+    assert clock.sleeps == [1.0]
+
+
+def test_acm_clients_are_throttled():
+    client = clients.acm("eu-west-1")
+    assert isinstance(client, ThrottledClient)
+    assert client.meta.region_name == "eu-west-1"
+    assert client.caller is clients.acm_pool.caller
+
+
+def test_pages_are_throttled():
+    clock = FakeClock()
+    acm = boto3.client(
+        "acm",
+        region_name="eu-west-1",
+        aws_access_key_id="key",
+        aws_secret_access_key="secret",
+    )
+    summary = {
+        "CertificateArn": "arn:aws:acm:eu-west-1:111111111111:certificate/1",
+        "DomainName": "example.com",
+    }
+    with Stubber(acm) as stubber:
+        stubber.add_client_error("list_certificates", "ThrottlingException")
+        stubber.add_response(
+            "list_certificates",
+            {"CertificateSummaryList": [summary], "NextToken": "t"},
+        )
+        stubber.add_client_error("list_certificates", "ThrottlingException")
+        stubber.add_response(
+            "list_certificates",
+            {"CertificateSummaryList": [summary]},
+            {"NextToken": "t"},
+        )
+        client = ThrottledClient(acm, caller(clock), "eu-west-1")
+        pages = list(list_certificates(client))
+        stubber.assert_no_pending_responses()
+
+    assert len(pages) == 2
+    assert len(clock.sleeps) == 2
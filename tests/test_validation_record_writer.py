@@ -0,0 +1,103 @@
+import json
+import uuid
+
+import pytest
+
+import certificate_dns_record_provider
+from issued_certificate_provider import provider
+from polling import PollingSchedule
+from scheduler import LambdaScheduler
+from validation_record_writer import ValidationRecordWriter
+
+
+@pytest.fixture
+def aws(aws):
+    # changes are in sync after a minute, and certificates issued a minute later
+    aws.change_delay = 60
+    aws.issue_delay = 120
+    aws.require_validation_records = True
+    return aws
+
+
+def test_upsert_in_a_single_batch(aws):
+    writer = ValidationRecordWriter(ttl=300)
+    change_id = writer.upsert(
+        "Z1",
+        [
+            {"Name": "_a.example.com.", "Type": "CNAME", "Value": "_a.acm."},
+            {"Name": "_b.example.com.", "Type": "CNAME", "Value": "_b.acm."},
+        ],
+    )
+    assert aws.calls == {"route53.change_resource_record_sets": 1}
+    assert sorted(aws.records.keys()) == [
+        ("Z1", "_a.example.com."),
+        ("Z1", "_b.example.com."),
+    ]
+    assert aws.records[("Z1", "_b.example.com.")] == {
+        "Name": "_b.example.com.",
+        "Type": "CNAME",
+        "TTL": 300,
+        "ResourceRecords": [{"Value": "_b.acm."}],
+    }
+    assert not writer.is_insync(change_id)
+    aws.clock.sleep(60)
+    assert writer.is_insync(change_id)
+
+
+def test_issued_certificate_writes_validation_records(aws, responses, monkeypatch):
+    arn = aws.add_certificate(
+        DomainName="example.com", SubjectAlternativeNames=["*.example.com"]
+    )
+    # the re-invocations are taken from the queue, without waiting
+    monkeypatch.setattr(
+        certificate_dns_record_provider.reinvoker,
+        "scheduler",
+        LambdaScheduler(lambda s: None),
+    )
+    monkeypatch.setattr(
+        provider,
+        "create_polling_schedule",
+        lambda: PollingSchedule(sleep=lambda seconds: None),
+    )
+
+    provider.set_request(Request(arn), {})
+    provider.create()
+    assert provider.asynchronous
+    # the apex and wildcard domain share a single validation record
+    assert aws.calls["route53.change_resource_record_sets"] == 1
+    assert len(aws.records) == 1
+    payload = json.loads(aws.invocations.popleft())
+    assert payload["ResourceProperties"]["ValidationRecordsChangeId"] == "/change/C1"
+
+    aws.clock.sleep(60)
+    provider.set_request(payload, {})
+    provider.create()
+    assert provider.asynchronous
+    payload = json.loads(aws.invocations.popleft())
+    assert payload["ResourceProperties"]["ValidationRecordsInSync"]
+
+    aws.clock.sleep(60)
+    certificate_dns_record_provider.certificate_cache.invalidate()
+    provider.set_request(payload, {})
+    provider.create()
+    assert not provider.asynchronous
+    assert provider.status == "SUCCESS"
+    assert aws.calls["route53.change_resource_record_sets"] == 1
+
+
+class Request(dict):
+    def __init__(self, certificate_arn):
+        self.update(
+            {
+                "RequestType": "Create",
+                "ResponseURL": "https://httpbin.org/put",
+                "StackId": "arn:aws:cloudformation:us-west-2:EXAMPLE/stack-name/guid",
+                "RequestId": "request-%s" % uuid.uuid4(),
+                "ResourceType": "Custom::IssuedCertificate",
+                "LogicalResourceId": "IssuedCertificate",
+                "ResourceProperties": {
+                    "CertificateArn": certificate_arn,
+                    "HostedZoneId": "Z1",
+                },
+            }
+        )
@@ -0,0 +1,185 @@
+import json
+import uuid
+
+import pytest
+from botocore.exceptions import ClientError
+
+import issued_certificate_provider
+from provider import handler
+from wait_state import DynamoDBStore, FileStore, MemoryStore, WaitStates
+
+ARN = "arn:aws:acm:eu-central-1:111111111111:certificate/1"
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class DynamoDB(object):
+    """
+    local stand-in for a DynamoDB table, supporting the versioned writes of the store.
+    `conflicts` updates are made by another request, just before the next write.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.conflicts = 0
+        self.writes = 0
+
+    def get_item(self, TableName, Key, ConsistentRead):
+        item = self.items.get(Key["Key"]["S"])
+        return {"Item": item} if item else {}
+
+    def check(self, key, ConditionExpression, ExpressionAttributeValues):
+        self.writes += 1
+        if self.conflicts:
+            self.conflicts -= 1
+            item = self.items[key]
+            item["Version"] = {"N": str(int(item["Version"]["N"]) + 1)}
+        existing = self.items.get(key)
+        expected = ExpressionAttributeValues[":version"]["N"]
+        if existing and existing["Version"]["N"] != expected:
+            raise ClientError(
+                {"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem"
+            )
+        if not existing and "attribute_not_exists" not in ConditionExpression:
+            raise ClientError(
+                {"Error": {"Code": "ConditionalCheckFailedException"}}, "DeleteItem"
+            )
+
+    def put_item(self, TableName, Item, ExpressionAttributeNames, **kwargs):
+        self.check(Item["Key"]["S"], **kwargs)
+        self.items[Item["Key"]["S"]] = Item
+
+    def delete_item(self, TableName, Key, **kwargs):
+        self.check(Key["Key"]["S"], **kwargs)
+        del self.items[Key["Key"]["S"]]
+
+
+def increment(state):
+    return {"count": (state or {"count": 0})["count"] + 1}
+
+
+@pytest.fixture(params=["memory", "file", "dynamodb"])
+def store(request, tmp_path):
+    clock = Clock()
+    if request.param == "memory":
+        result = MemoryStore(clock)
+    elif request.param == "file":
+        result = FileStore(str(tmp_path / "wait-states.json"), clock)
+    else:
+        result = DynamoDBStore("wait-states", DynamoDB(), clock)
+    result.clock = clock
+    return result
+
+
+def test_store_updates_until_expired(store):
+    assert store.update("a", increment, 60) == {"count": 1}
+    assert store.update("a", increment, 60) == {"count": 2}
+    assert store.update("b", increment, 60) == {"count": 1}
+    store.clock.now += 61
+    assert store.update("a", increment, 60) == {"count": 1}
+    assert store.update("a", lambda state: None, 60) is None
+    assert store.update("a", lambda state: state, 60) is None
+
+
+def test_file_store_is_shared(tmp_path):
+    path = str(tmp_path / "wait-states.json")
+    FileStore(path).update("a", increment, 60)
+    assert FileStore(path).update("a", increment, 60) == {"count": 2}
+
+
+def test_dynamodb_store_retries_conflicting_update():
+    dynamodb = DynamoDB()
+    store = DynamoDBStore("wait-states", dynamodb, Clock())
+    store.update("a", increment, 60)
+    dynamodb.conflicts = 2
+    assert store.update("a", increment, 60) == {"count": 2}
+    assert dynamodb.writes == 4
+    assert json.loads(dynamodb.items["a"]["State"]["S"]) == {"count": 2}
+
+
+def test_one_poller_per_certificate():
+    clock = Clock()
+    wait_states = WaitStates(MemoryStore(clock), grace=10, clock=clock)
+    assert wait_states.watch(ARN, "a")["Poller"] == "a"
+    state = wait_states.watch(ARN, "b")
+    assert state["Poller"] == "a"
+    assert sorted(state["Waiters"]) == ["a", "b"]
+
+    wait_states.record(ARN, "a", "PENDING_VALIDATION", clock.now + 15)
+    assert wait_states.watch(ARN, "b")["Poller"] == "a"
+    assert wait_states.wait(wait_states.watch(ARN, "b")) == 16
+
+    # the poller did not check in time, and is taken over
+    clock.now += 26
+    assert wait_states.watch(ARN, "b")["Poller"] == "b"
+
+    # the poller left, and is replaced by the next waiter
+    wait_states.leave(ARN, "b")
+    assert wait_states.watch(ARN, "c")["Poller"] == "c"
+    assert wait_states.watch(ARN, "a")["Poller"] == "c"
+
+
+def test_last_waiter_removes_state():
+    clock = Clock()
+    store = MemoryStore(clock)
+    wait_states = WaitStates(store, clock=clock)
+    wait_states.watch(ARN, "a")
+    wait_states.watch(ARN, "b")
+    wait_states.leave(ARN, "a")
+    assert store.states
+    wait_states.leave(ARN, "b")
+    assert not store.states
+
+
+def test_interval_grows_with_pending_time():
+    clock = Clock()
+    wait_states = WaitStates(
+        MemoryStore(clock), backoff=0.1, max_interval=60, clock=clock
+    )
+    state = wait_states.watch(ARN, "a")
+    assert wait_states.interval(state, 15) == 15
+    clock.now += 300
+    assert wait_states.interval(state, 15) == 30
+    clock.now += 3000
+    assert wait_states.interval(state, 15) == 60
+
+
+def request(logical_resource_id, certificate_arn):
+    return {
+        "RequestType": "Create",
+        "ResponseURL": "https://localhost/response",
+        "StackId": "arn:aws:cloudformation:eu-central-1:111111111111:stack/s/guid",
+        "RequestId": "request-%s" % uuid.uuid4(),
+        "ResourceType": "Custom::IssuedCertificate",
+        "LogicalResourceId": logical_resource_id,
+        "ResourceProperties": {
+            "CertificateArn": certificate_arn,
+            "ServiceToken": "arn:aws:lambda:eu-central-1:111111111111:function:f",
+        },
+    }
+
+
+def test_waiters_follow_the_poller(aws, responses):
+    arn = aws.add_certificate(DomainName="example.com")
+    pending = [request(name, arn) for name in ["A", "B", "C"]]
+    for r in pending:
+        handler(r, None)
+    assert aws.calls["acm.describe_certificate"] == 1
+
+    while not len(responses) == 3:
+        handler(json.loads(aws.invocations.popleft()), None)
+
+    assert sorted((r["LogicalResourceId"], r["Status"]) for r in responses) == [
+        ("A", "SUCCESS"),
+        ("B", "SUCCESS"),
+        ("C", "SUCCESS"),
+    ]
+    # only the poller checked the certificate every 15 seconds, until issued after 60
+    assert aws.calls["acm.describe_certificate"] == 5
+    assert not issued_certificate_provider.wait_states.store.states